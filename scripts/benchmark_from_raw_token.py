@@ -0,0 +1,115 @@
+r"""
+Microbenchmark of verifying the tokens received when logging in.
+
+Compares SignaturgruppenToken.from_raw_token() given the JWKS as JSON (parsed
+and imported for each of the two tokens verified) with given a JwkSet (parsed
+and imported once per JWKS), measuring throughput and per-call latency:
+
+    PYTHONPATH=src python scripts/benchmark_from_raw_token.py
+
+Uses a JWKS with a few RSA keys generated on the fly, like the one served by
+the Identity Provider. No network or database is needed.
+"""
+
+# Standard Library
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Union
+
+# Third party
+from authlib.jose import JsonWebKey, jwt
+
+# First party
+from auth_api.oidc.jwks import JwkSet
+from auth_api.oidc.signaturgruppen.models import SignaturgruppenToken
+
+
+def create_raw_token(private_key, kid: str) -> Dict[str, Any]:
+    """Return a token response like the one from the Identity Provider."""
+
+    now = int(time.time())
+
+    def sign(payload: Dict[str, Any]) -> str:
+        return jwt.encode(
+            header={'alg': 'RS256', 'kid': kid},
+            payload=payload,
+            key=private_key,
+        ).decode()
+
+    return {
+        'id_token': sign({
+            'sub': 'subject',
+            'idp': 'mitid',
+            'iat': now,
+            'exp': now + 3600,
+        }),
+        'userinfo_token': sign({
+            'identity_type': 'private',
+            'dk.cpr': '0101010101',
+        }),
+        'scope': 'openid mitid nemid userinfo_token',
+    }
+
+
+def measure(
+        jwk: Callable[[], Union[str, JwkSet]],
+        raw_token: Dict[str, Any],
+        iterations: int,
+) -> List[float]:
+    """
+    Return the duration (in microseconds) of each call to from_raw_token.
+
+    :param jwk: Function returning the key argument, like the backend would
+    :param raw_token: Token response to verify
+    :param iterations: Number of calls
+    """
+    durations = []
+
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        SignaturgruppenToken.from_raw_token(raw_token=raw_token, jwk=jwk())
+        durations.append((time.perf_counter() - begin) * 1e6)
+
+    return durations
+
+
+def main():
+    """Run the benchmark and print the results."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--keys', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=200)
+    args = parser.parse_args()
+
+    private_keys = [
+        JsonWebKey.generate_key('RSA', 2048, is_private=True)
+        for _ in range(args.keys)
+    ]
+
+    jwks = json.dumps({'keys': [
+        key.as_dict(kid=f'key{i}')
+        for i, key in enumerate(private_keys)
+    ]})
+
+    raw_token = create_raw_token(private_keys[-1], kid=f'key{args.keys - 1}')
+    key_set = JwkSet(jwks)
+
+    print(f'{"key":<8} {"logins/s":>10} {"mean µs":>10} {"p50 µs":>10} '
+          f'{"p99 µs":>10}')
+
+    for name, jwk in (('json', lambda: jwks), ('jwkset', lambda: key_set)):
+        measure(jwk, raw_token, args.warmup)
+
+        durations = measure(jwk, raw_token, args.iterations)
+        percentiles = statistics.quantiles(durations, n=100)
+
+        print(f'{name:<8} {1e6 / statistics.mean(durations):>10.0f} '
+              f'{statistics.mean(durations):>10.1f} '
+              f'{percentiles[49]:>10.1f} {percentiles[98]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
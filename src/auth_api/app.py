@@ -7,7 +7,18 @@ from .config import (
     OIDC_LOGIN_CALLBACK_PATH,
     OIDC_LOGIN_CALLBACK_URL,
     INVALIDATE_PENDING_LOGIN_PATH,
+    TOKEN_INVALIDATION_LISTENER,
+    OIDC_JWKS_PREFETCH,
+    DATASYNC_OUTBOX_WORKER,
+    OIDC_LOGOUT_WORKER,
 )
+from .invalidation import start_token_invalidation_listener
+from .outbox import (
+    start_logout_outbox_worker,
+    start_relations_outbox_worker,
+)
+from .oidc import start_jwks_refresher
+from .sql_stats import count_request_statements
 
 from .endpoints import (
     # OpenID Connect:
@@ -28,6 +39,10 @@ from .endpoints import (
     GetUserInformation,
     # Company id:
     GetCompanyId,
+    # Health:
+    ReadinessCheck,
+    GetHttpMetrics,
+    GetSqlMetrics,
 )
 
 
@@ -136,4 +151,44 @@ def create_app() -> Application:
         endpoint=GetCompanyId(),
     )
 
+    # -- Health --------------------------------------------------------------
+
+    app.add_endpoint(
+        method='GET',
+        path='/ready',
+        endpoint=ReadinessCheck(),
+    )
+
+    app.add_endpoint(
+        method='GET',
+        path='/metrics/http',
+        endpoint=GetHttpMetrics(),
+        guards=[TokenGuard()],
+    )
+
+    app.add_endpoint(
+        method='GET',
+        path='/metrics/sql',
+        endpoint=GetSqlMetrics(),
+        guards=[TokenGuard()],
+    )
+
+    # -- Instrumentation -----------------------------------------------------
+
+    count_request_statements(app.wsgi_app)
+
+    # -- Background tasks ----------------------------------------------------
+
+    if TOKEN_INVALIDATION_LISTENER:
+        start_token_invalidation_listener()
+
+    if OIDC_JWKS_PREFETCH:
+        start_jwks_refresher()
+
+    if DATASYNC_OUTBOX_WORKER:
+        start_relations_outbox_worker()
+
+    if OIDC_LOGOUT_WORKER:
+        start_logout_outbox_worker()
+
     return app
@@ -0,0 +1,107 @@
+from origin.api import HttpResponse
+
+from auth_api.config import (
+    OIDC_CALLBACK_CACHE_SIZE,
+    OIDC_CALLBACK_CACHE_TTL,
+    TOKEN_CACHE_BACKEND,
+    TOKEN_CACHE_REDIS_URL,
+    TOKEN_CACHE_SHARED_PATH,
+    TOKEN_CACHE_SHARED_VALUE_SIZE,
+    TOKEN_CACHE_SIZE,
+    TOKEN_CACHE_TTL,
+    TOKEN_NEGATIVE_CACHE_SIZE,
+    TOKEN_NEGATIVE_CACHE_TTL,
+)
+
+from .base import Cache
+from .memory import TtlCache
+from .shared import SharedMemoryCache
+from .redis import RedisCache
+from .single_flight import SingleFlight
+
+
+def create_cache(backend: str, size: int, ttl: float) -> Cache[str]:
+    """
+    Create a cache of strings using the specified backend.
+
+    - memory: In-process cache (one per worker)
+    - shared: Shared memory cache (one per host, shared by all workers)
+    - redis: Redis or a Redis-compatible server (shared by all hosts)
+
+    :param backend: Name of the backend
+    :param size: Max number of entries (ignored by the redis backend)
+    :param ttl: Max number of seconds an entry lives
+    :returns: The cache
+    """
+    if backend == 'memory':
+        return TtlCache(size=size, ttl=ttl)
+    elif backend == 'shared':
+        return SharedMemoryCache(
+            path=TOKEN_CACHE_SHARED_PATH,
+            size=size,
+            ttl=ttl,
+            value_size=TOKEN_CACHE_SHARED_VALUE_SIZE,
+        )
+    elif backend == 'redis':
+        return RedisCache(url=TOKEN_CACHE_REDIS_URL, ttl=ttl)
+    else:
+        raise RuntimeError(f'Unknown cache backend: {backend}')
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+token_cache = create_cache(
+    backend=TOKEN_CACHE_BACKEND,
+    size=TOKEN_CACHE_SIZE,
+    ttl=TOKEN_CACHE_TTL,
+)
+"""
+Cache of opaque tokens mapped to their encoded internal tokens.
+
+Used by the ForwardAuth endpoint to avoid a database lookup per request.
+"""
+
+
+unknown_token_cache: TtlCache[bool] = TtlCache(
+    size=TOKEN_NEGATIVE_CACHE_SIZE,
+    ttl=TOKEN_NEGATIVE_CACHE_TTL,
+)
+"""
+Short-lived cache of opaque tokens which were not found in the database.
+
+Used by the ForwardAuth endpoint to reject stale or garbage tokens without
+checking out a database connection for each of them. It is always kept
+in process memory, as entries live too short to be worth sharing.
+"""
+
+
+token_lookups: SingleFlight = SingleFlight()
+"""
+Database lookups of tokens in flight, by token id.
+
+Used by the ForwardAuth endpoint so concurrent cache misses for the same
+token (ie. the parallel requests of a page load) share a single lookup.
+"""
+
+
+login_callback_cache: TtlCache[HttpResponse] = TtlCache(
+    size=OIDC_CALLBACK_CACHE_SIZE,
+    ttl=OIDC_CALLBACK_CACHE_TTL,
+)
+"""
+Outcomes of completed logins, by (hashed) code, state and nonce cookie.
+
+Used by the login callback endpoint so replayed callbacks (ie. on refresh
+or double-submit) reuse the outcome instead of exchanging the code with
+the Identity Provider again, which would fail.
+"""
+
+
+login_callbacks: SingleFlight[HttpResponse] = SingleFlight()
+"""
+Login callbacks in flight, by (hashed) code, state and nonce cookie.
+
+Used by the login callback endpoint so a callback replayed while the
+first one is in flight waits for its outcome.
+"""
@@ -0,0 +1,80 @@
+# Standard Library
+from abc import abstractmethod
+from datetime import datetime, timezone
+from typing import Generic, Hashable, Optional, TypeVar
+
+TValue = TypeVar('TValue')
+
+
+class Cache(Generic[TValue]):
+    """
+    Abstract cache where every entry has a time-to-live.
+
+    Implementations must be safe to use from multiple threads.
+
+    :param ttl: Max number of seconds an entry lives
+    """
+
+    shared = False
+    """Whether the entries are shared with other processes (workers)."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Optional[TValue]:
+        """
+        Get a value from the cache.
+
+        :param key: Cache key
+        :returns: The cached value, or None if missing or expired
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(
+            self,
+            key: Hashable,
+            value: TValue,
+            expires: Optional[datetime] = None,
+    ):
+        """
+        Add a value to the cache.
+
+        :param key: Cache key
+        :param value: Value to cache
+        :param expires: Optional point in time where the value stops being
+            valid. The entry will never outlive it, even if the TTL is longer.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: Hashable):
+        """
+        Evict a value from the cache (if it exists).
+
+        :param key: Cache key
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        """Evict all values from the cache."""
+
+        raise NotImplementedError
+
+    def get_ttl(self, expires: Optional[datetime] = None) -> float:
+        """
+        Return number of seconds a new entry should live.
+
+        :param expires: Optional point in time where the value stops being
+            valid
+        :returns: Seconds to live (zero or less if it should not be cached)
+        """
+        if expires is None:
+            return self.ttl
+
+        return min(
+            self.ttl,
+            (expires - datetime.now(tz=timezone.utc)).total_seconds(),
+        )
@@ -0,0 +1,100 @@
+# Standard Library
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Hashable, Optional, Tuple
+
+# Local
+from .base import Cache, TValue
+
+
+class TtlCache(Cache[TValue]):
+    """
+    Bounded, thread-safe LRU cache where every entry has a time-to-live.
+
+    Entries are evicted when they expire, or when the cache is full and a
+    new entry is added (least recently used first). The cache lives in
+    process memory, so each worker has its own instance.
+
+    :param size: Max number of entries (zero or less disables the cache)
+    :param ttl: Max number of seconds an entry lives
+    """
+
+    def __init__(self, size: int, ttl: float):
+        super(TtlCache, self).__init__(ttl=ttl)
+        self.size = size
+        self._entries: 'OrderedDict[Hashable, Tuple[float, TValue]]' = \
+            OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return number of entries (including expired, not yet evicted)."""
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[TValue]:
+        """
+        Get a value from the cache.
+
+        :param key: Cache key
+        :returns: The cached value, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            deadline, value = entry
+
+            if deadline <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+
+            return value
+
+    def set(
+            self,
+            key: Hashable,
+            value: TValue,
+            expires: Optional[datetime] = None,
+    ):
+        """
+        Add a value to the cache.
+
+        :param key: Cache key
+        :param value: Value to cache
+        :param expires: Optional point in time where the value stops being
+            valid. The entry will never outlive it, even if the TTL is longer.
+        """
+        if self.size <= 0:
+            return
+
+        ttl = self.get_ttl(expires)
+
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        """
+        Evict a value from the cache (if it exists).
+
+        :param key: Cache key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Evict all values from the cache."""
+
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,112 @@
+# Standard Library
+import hashlib
+import logging
+from datetime import datetime
+from typing import Optional
+
+# Local
+from .base import Cache
+
+logger = logging.getLogger(__name__)
+
+
+class RedisCache(Cache[str]):
+    """
+    Cache of strings stored in Redis (or a Redis-compatible server).
+
+    Keys are stored as a digest of the cache key, prefixed by key_prefix.
+    Errors communicating with the server are logged and treated as cache
+    misses, so an unavailable server only makes lookups slower.
+
+    Requires the "redis" package, which is not installed by default.
+
+    :param url: Redis connection URL, ie. redis://localhost:6379/0
+    :param ttl: Max number of seconds an entry lives
+    :param key_prefix: Prefix for all keys written by this cache
+    """
+
+    shared = True
+
+    def __init__(
+            self,
+            url: str,
+            ttl: float,
+            key_prefix: str = 'eo-auth:token:',
+    ):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                'The "redis" package must be installed to use RedisCache')
+
+        super(RedisCache, self).__init__(ttl=ttl)
+        self.key_prefix = key_prefix
+        self.error = redis.RedisError
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get a value from the cache.
+
+        :param key: Cache key
+        :returns: The cached value, or None if missing or expired
+        """
+        try:
+            value = self.client.get(self._get_name(key))
+        except self.error:
+            logger.exception('Failed to get value from Redis')
+            return None
+
+        if value is not None:
+            return value.decode()
+
+    def set(
+            self,
+            key: str,
+            value: str,
+            expires: Optional[datetime] = None,
+    ):
+        """
+        Add a value to the cache.
+
+        :param key: Cache key
+        :param value: Value to cache
+        :param expires: Optional point in time where the value stops being
+            valid. The entry will never outlive it, even if the TTL is longer.
+        """
+        ttl_ms = int(self.get_ttl(expires) * 1000)
+
+        if ttl_ms <= 0:
+            return
+
+        try:
+            self.client.set(self._get_name(key), value, px=ttl_ms)
+        except self.error:
+            logger.exception('Failed to set value in Redis')
+
+    def delete(self, key: str):
+        """
+        Evict a value from the cache (if it exists).
+
+        :param key: Cache key
+        """
+        try:
+            self.client.delete(self._get_name(key))
+        except self.error:
+            logger.exception('Failed to delete value from Redis')
+
+    def clear(self):
+        """Evict all values written by this cache."""
+
+        try:
+            for name in self.client.scan_iter(match=f'{self.key_prefix}*'):
+                self.client.delete(name)
+        except self.error:
+            logger.exception('Failed to clear values from Redis')
+
+    def _get_name(self, key: str) -> str:
+        """Return the name of the Redis key to store a cache key as."""
+
+        digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+        return f'{self.key_prefix}{digest}'
@@ -0,0 +1,368 @@
+# Standard Library
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+# Local
+from .base import Cache
+
+
+class SharedMemoryCache(Cache[str]):
+    """
+    Cache of strings shared by all processes on the same host.
+
+    The cache is a fixed-size hash table stored in a memory-mapped file
+    (preferably on a tmpfs, like /dev/shm), so every gunicorn worker in a
+    pod reads and writes the same entries.
+
+    Entries are keyed by a digest of the cache key, and each slot has a
+    sequence counter (a "seqlock"): Writers make the counter odd while
+    writing and even when done, and are serialized using a file lock.
+    Readers never lock, but instead retry if the counter changed (or was odd)
+    while reading the slot.
+
+    Values longer than value_size bytes (UTF-8 encoded) are never cached.
+
+    :param path: Path to the file backing the cache
+    :param size: Number of slots in the hash table
+    :param ttl: Max number of seconds an entry lives
+    :param value_size: Max length of a value in bytes
+    """
+
+    shared = True
+
+    # File header: magic, version, number of slots, value size
+    HEADER = struct.Struct('<4sIII')
+    HEADER_SIZE = 64
+    MAGIC = b'EOTC'
+    VERSION = 1
+
+    # Slot header: sequence counter, deadline, key digest, value length
+    SEQUENCE = struct.Struct('<Q')
+    SLOT = struct.Struct('<Qd16sI')
+
+    # Number of neighbouring slots to probe for a key
+    PROBES = 4
+
+    # Number of times to retry reading a slot being written concurrently
+    READ_RETRIES = 8
+
+    def __init__(
+            self,
+            path: str,
+            size: int,
+            ttl: float,
+            value_size: int = 2048,
+    ):
+        super(SharedMemoryCache, self).__init__(ttl=ttl)
+        self.path = path
+        self.size = size
+        self.value_size = value_size
+        self.slot_size = (self.SLOT.size + value_size + 7) // 8 * 8
+        self._fd: Optional[int] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return number of entries which has not yet expired."""
+        now = time.time()
+
+        return sum(
+            1 for i in range(self.size)
+            if self._read_slot(i)[0] > now
+        )
+
+    @property
+    def file_size(self) -> int:
+        """Size of the file backing the cache, in bytes."""
+
+        return self.HEADER_SIZE + self.size * self.slot_size
+
+    # -- Cache interface -----------------------------------------------------
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get a value from the cache without locking.
+
+        :param key: Cache key
+        :returns: The cached value, or None if missing or expired
+        """
+        if self.size <= 0:
+            return None
+
+        digest = self._digest(key)
+
+        for index in self._probe(digest):
+            deadline, slot_digest, value = self._read_slot(index, digest)
+
+            if slot_digest == digest:
+                if value is not None and deadline > time.time():
+                    return value.decode()
+                return None
+
+        return None
+
+    def set(
+            self,
+            key: str,
+            value: str,
+            expires: Optional[datetime] = None,
+    ):
+        """
+        Add a value to the cache.
+
+        :param key: Cache key
+        :param value: Value to cache
+        :param expires: Optional point in time where the value stops being
+            valid. The entry will never outlive it, even if the TTL is longer.
+        """
+        if self.size <= 0:
+            return
+
+        ttl = self.get_ttl(expires)
+        encoded = value.encode()
+
+        if ttl <= 0 or len(encoded) > self.value_size:
+            return
+
+        digest = self._digest(key)
+
+        with self._write_lock():
+            self._write_slot(
+                index=self._find_slot_for_writing(digest),
+                deadline=time.time() + ttl,
+                digest=digest,
+                value=encoded,
+            )
+
+    def delete(self, key: str):
+        """
+        Evict a value from the cache (if it exists).
+
+        :param key: Cache key
+        """
+        if self.size <= 0:
+            return
+
+        digest = self._digest(key)
+
+        with self._write_lock():
+            for index in self._probe(digest):
+                if self._read_slot(index)[1] == digest:
+                    self._write_slot(index, 0, bytes(16), b'')
+
+    def clear(self):
+        """Evict all values from the cache."""
+
+        if self.size <= 0:
+            return
+
+        with self._write_lock():
+            for index in range(self.size):
+                if self._read_slot(index)[0] > 0:
+                    self._write_slot(index, 0, bytes(16), b'')
+
+    # -- Hash table ----------------------------------------------------------
+
+    def _digest(self, key: str) -> bytes:
+        """Return the 16 bytes digest used to identify a key."""
+
+        return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+    def _probe(self, digest: bytes) -> Iterator[int]:
+        """Return indexes of the slots where the digest may be stored."""
+
+        start = int.from_bytes(digest[:8], 'little') % self.size
+
+        return (
+            (start + i) % self.size
+            for i in range(min(self.PROBES, self.size))
+        )
+
+    def _find_slot_for_writing(self, digest: bytes) -> int:
+        """
+        Find the slot to write a digest to.
+
+        Prefers the slot already holding the digest, then an empty or
+        expired slot, and lastly the slot which expires first.
+        Must be invoked while holding the write lock.
+        """
+        now = time.time()
+        candidates = []
+
+        for index in self._probe(digest):
+            deadline, slot_digest, _ = self._read_slot(index)
+
+            if slot_digest == digest:
+                return index
+
+            candidates.append((deadline > now, deadline, index))
+
+        return min(candidates)[2]
+
+    def _slot_offset(self, index: int) -> int:
+        return self.HEADER_SIZE + index * self.slot_size
+
+    def _read_slot(self, index: int, digest: Optional[bytes] = None):
+        """
+        Read a slot consistently, without locking.
+
+        :param index: Index of slot
+        :param digest: Only read the value if the slot holds this digest
+        :returns: Tuple of (deadline, digest, value)
+        """
+        buffer = self._get_mmap()
+        offset = self._slot_offset(index)
+
+        for _ in range(self.READ_RETRIES):
+            sequence_before, deadline, slot_digest, length = \
+                self.SLOT.unpack_from(buffer, offset)
+
+            if sequence_before % 2:
+                continue
+
+            value = None
+
+            if digest is not None and slot_digest == digest:
+                start = offset + self.SLOT.size
+                value = buffer[start:start + min(length, self.value_size)]
+
+            sequence_after, = self.SEQUENCE.unpack_from(buffer, offset)
+
+            if sequence_before == sequence_after:
+                return deadline, slot_digest, value
+
+        # The slot is being written to continuously; treat it as a miss
+        return 0, bytes(16), None
+
+    def _write_slot(
+            self,
+            index: int,
+            deadline: float,
+            digest: bytes,
+            value: bytes,
+    ):
+        """Write a slot. Must be invoked while holding the write lock."""
+
+        buffer = self._get_mmap()
+        offset = self._slot_offset(index)
+        sequence, = self.SEQUENCE.unpack_from(buffer, offset)
+
+        self.SEQUENCE.pack_into(buffer, offset, sequence + 1)
+        self.SLOT.pack_into(
+            buffer, offset, sequence + 1, deadline, digest, len(value))
+        start = offset + self.SLOT.size
+        buffer[start:start + len(value)] = value
+        self.SEQUENCE.pack_into(buffer, offset, sequence + 2)
+
+    # -- File handling -------------------------------------------------------
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers across both threads and processes."""
+
+        self._get_mmap()
+
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _get_mmap(self) -> mmap.mmap:
+        """
+        Return the memory-mapped file, opening it if necessary.
+
+        The file is (re)opened after forking, so every process has its
+        own mapping of the shared file. Only one thread opens it, while
+        others wait for it (readers only take the lock when opening).
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                # Another thread may have opened it while waiting for the lock
+                if self._pid != os.getpid():
+                    self._open()
+
+        return self._mmap
+
+    def _open(self):
+        """Open the file, and replace it if its layout is incompatible."""
+
+        # Mappings inherited from a parent process are not used
+        if self._mmap is not None:
+            self._mmap.close()
+            os.close(self._fd)
+
+        expected_header = self.HEADER.pack(
+            self.MAGIC, self.VERSION, self.size, self.value_size)
+
+        fd = self._open_locked()
+
+        try:
+            header = os.pread(fd, self.HEADER.size, 0)
+
+            if header != expected_header \
+                    or os.fstat(fd).st_size != self.file_size:
+                new_fd = self._replace(expected_header)
+                os.close(fd)
+                fd = new_fd
+
+            self._mmap = mmap.mmap(fd, self.file_size)
+            self._fd = fd
+            self._pid = os.getpid()
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _open_locked(self) -> int:
+        """
+        Open the current file, and lock it.
+
+        :returns: The file descriptor, locked (exclusively)
+        """
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+            try:
+                current = os.stat(self.path).st_ino == os.fstat(fd).st_ino
+            except FileNotFoundError:
+                current = False
+
+            if current:
+                return fd
+
+            # Replaced by another process while waiting for the lock
+            os.close(fd)
+
+    def _replace(self, header: bytes) -> int:
+        """
+        Create an initialized file, and rename it over the current one.
+
+        The current file is never truncated, as other processes may still
+        have it mapped (and would crash reading beyond its new end). They
+        keep using it until they open the file again.
+
+        :param header: File header to write
+        :returns: File descriptor of the new file
+        """
+        path = f'{self.path}.{os.getpid()}.tmp'
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+
+        try:
+            os.ftruncate(fd, self.file_size)
+            os.pwrite(fd, header, 0)
+            os.rename(path, self.path)
+        except Exception:
+            os.close(fd)
+            raise
+
+        return fd
@@ -0,0 +1,71 @@
+# Standard Library
+import threading
+from typing import Callable, Dict, Generic, Hashable, Optional
+
+# Local
+from .base import TValue
+
+
+class _Call(Generic[TValue]):
+    """A call in flight, and its outcome once it has completed."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0  # Number of other threads waiting for it
+        self.result: Optional[TValue] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[TValue]):
+    """
+    Coalesces concurrent calls for the same key into a single call.
+
+    The first thread to call do() with a key invokes the function. Threads
+    calling do() with the same key while it is in flight wait for it, and
+    receive the same result (or exception). Once it has completed, the next
+    call with the key invokes the function again; results are not cached.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call[TValue]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return number of calls in flight."""
+        return len(self._calls)
+
+    def do(self, key: Hashable, function: Callable[[], TValue]) -> TValue:
+        """
+        Invoke function, unless a call with the same key is in flight.
+
+        :param key: Key identifying the call
+        :param function: Function to invoke (without arguments)
+        :returns: The result of the function
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if leader:
+            try:
+                call.result = function()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+
+                call.done.set()
+        else:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+        return call.result
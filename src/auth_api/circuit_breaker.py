@@ -0,0 +1,168 @@
+# Standard Library
+import time
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Tuple, Type, TypeVar
+
+logger = logging.getLogger(__name__)
+
+TResult = TypeVar('TResult')
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its circuit is open."""
+
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a dependency while it is failing.
+
+    The outcome of the last window_size calls is recorded. A call fails if
+    it raises an exception (except those in ignore), or if it takes longer
+    than slow_call_duration. Once at least min_calls have been recorded,
+    and the rate of failed calls reaches failure_rate, the circuit opens.
+
+    While open, calls raise CircuitOpenError immediately. After
+    open_duration, the circuit is half-open: a single call is let through
+    as a probe, while other calls still raise CircuitOpenError. If the probe
+    succeeds, the circuit closes. If it fails, the circuit opens again.
+
+    :param name: Name of the operation (for logging)
+    :param failure_rate: Rate (0-1) of failed calls which opens the circuit
+    :param window_size: Number of recent calls to compute the rate over
+    :param min_calls: Min number of recent calls before the circuit opens
+    :param slow_call_duration: Seconds after which a call counts as failed
+    :param open_duration: Seconds to stay open before probing
+    :param ignore: Exceptions which do not count as failed calls, ie.
+        errors reported by a dependency which is working fine
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+            self,
+            name: str,
+            failure_rate: float = 0.5,
+            window_size: int = 20,
+            min_calls: int = 10,
+            slow_call_duration: float = 5,
+            open_duration: float = 30,
+            ignore: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_call_duration = slow_call_duration
+        self.open_duration = open_duration
+        self.ignore = ignore
+
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at: float = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Current state: CLOSED, OPEN or HALF_OPEN."""
+
+        with self._lock:
+            if self._state == self.OPEN and self._open_has_elapsed():
+                return self.HALF_OPEN
+
+            return self._state
+
+    def call(
+            self,
+            function: Callable[..., TResult],
+            *args,
+            **kwargs,
+    ) -> TResult:
+        """
+        Call function, unless the circuit is open.
+
+        :param function: The function calling the dependency
+        :returns: The result of the function
+        :raises CircuitOpenError: If the circuit is open
+        """
+        probe = self._before_call()
+        begin = time.monotonic()
+
+        try:
+            result = function(*args, **kwargs)
+        except self.ignore:
+            self._after_call(probe, failed=False)
+            raise
+        except BaseException:
+            self._after_call(probe, failed=True)
+            raise
+
+        duration = time.monotonic() - begin
+        self._after_call(probe, failed=duration >= self.slow_call_duration)
+
+        return result
+
+    def reset(self):
+        """Close the circuit, and forget recent calls."""
+
+        with self._lock:
+            self._close()
+
+    def _open_has_elapsed(self) -> bool:
+        return time.monotonic() - self._opened_at >= self.open_duration
+
+    def _before_call(self) -> bool:
+        """Return whether the call is a probe, or raise if open."""
+
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+
+            if self._probing or not self._open_has_elapsed():
+                raise CircuitOpenError(f'Circuit {self.name} is open')
+
+            self._state = self.HALF_OPEN
+            self._probing = True
+
+            return True
+
+    def _after_call(self, probe: bool, failed: bool):
+        """Record the outcome of a call."""
+
+        with self._lock:
+            if probe:
+                self._probing = False
+
+                if failed:
+                    self._open()
+                else:
+                    logger.info(f'Circuit {self.name} closed')
+                    self._close()
+
+                return
+
+            if self._state != self.CLOSED:
+                # Outcome of a call which started before the circuit opened
+                return
+
+            self._outcomes.append(failed)
+
+            if len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) >= \
+                    self.failure_rate * len(self._outcomes):
+                logger.warning(f'Circuit {self.name} opened')
+                self._open()
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._outcomes.clear()
+        self._probing = False
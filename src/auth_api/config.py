@@ -1,7 +1,23 @@
 import os
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from decouple import config
 
+
+def parse_utc_datetime(value: str) -> datetime:
+    """
+    Parse an ISO 8601 time, which is UTC unless it has a timezone.
+
+    :param value: The time, ie. "2026-12-01" or "2026-12-01T00:00:00+01:00"
+    :returns: The time (timezone aware)
+    """
+    parsed = datetime.fromisoformat(value)
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return parsed
+
+
 # -- General -----------------------------------------------------------------
 
 # Enable/disable debug mode
@@ -49,6 +65,47 @@ TOKEN_DEFAULT_SCOPES = [
 # The path to set token cookie on
 TOKEN_COOKIE_PATH = '/'
 
+# Max number of opaque tokens cached per worker by ForwardAuth
+# (set to zero to disable the cache)
+TOKEN_CACHE_SIZE = config('TOKEN_CACHE_SIZE', default=10000, cast=int)
+
+# Max number of seconds an opaque token is cached by ForwardAuth
+TOKEN_CACHE_TTL = config('TOKEN_CACHE_TTL', default=60, cast=int)
+
+# Where ForwardAuth caches opaque tokens; either "memory" (per worker),
+# "shared" (shared memory, per host) or "redis" (Redis-compatible server)
+TOKEN_CACHE_BACKEND = config('TOKEN_CACHE_BACKEND', default='memory')
+
+# File backing the token cache when using the "shared" backend
+TOKEN_CACHE_SHARED_PATH = config(
+    'TOKEN_CACHE_SHARED_PATH', default='/dev/shm/eo-auth-token-cache')
+
+# Max size (in bytes) of a cached internal token when using the "shared"
+# backend. Larger tokens are not cached.
+TOKEN_CACHE_SHARED_VALUE_SIZE = config(
+    'TOKEN_CACHE_SHARED_VALUE_SIZE', default=2048, cast=int)
+
+# Connection URL when using the "redis" backend
+TOKEN_CACHE_REDIS_URL = config(
+    'TOKEN_CACHE_REDIS_URL', default='redis://localhost:6379/0')
+
+# Whether each worker should listen for revoked tokens (via PostgreSQL
+# LISTEN/NOTIFY) and evict them from its caches
+TOKEN_INVALIDATION_LISTENER = config(
+    'TOKEN_INVALIDATION_LISTENER', default=True, cast=bool)
+
+# PostgreSQL channel used to notify workers about revoked tokens
+TOKEN_INVALIDATION_CHANNEL = 'token_invalidation'
+
+# Max number of unknown opaque tokens cached per worker by ForwardAuth
+# (set to zero to disable the cache)
+TOKEN_NEGATIVE_CACHE_SIZE = config(
+    'TOKEN_NEGATIVE_CACHE_SIZE', default=10000, cast=int)
+
+# Max number of seconds an unknown opaque token is cached by ForwardAuth
+TOKEN_NEGATIVE_CACHE_TTL = config(
+    'TOKEN_NEGATIVE_CACHE_TTL', default=5, cast=int)
+
 # -- Secrets -----------------------------------------------------------------
 
 # Secret used to sign internal token
@@ -57,6 +114,20 @@ INTERNAL_TOKEN_SECRET = config('INTERNAL_TOKEN_SECRET')
 # Secret used to encrypt id_token in state
 STATE_ENCRYPTION_SECRET = config('STATE_ENCRYPTION_SECRET')
 
+# Secret used to sign opaque tokens (if not set, a secret is derived from
+# INTERNAL_TOKEN_SECRET, so the two are never the same)
+OPAQUE_TOKEN_SECRET = config('OPAQUE_TOKEN_SECRET', default='')
+
+# Time (ISO 8601) until which legacy (unsigned) opaque tokens, issued before
+# opaque tokens were signed, are accepted. They expire TOKEN_EXPIRY_DELTA
+# after being issued, so set this to the time of the rollout plus
+# TOKEN_EXPIRY_DELTA (or any time in the past to reject them right away).
+# Times without a timezone are UTC. If not set, they are always accepted.
+OPAQUE_TOKEN_ACCEPT_LEGACY_UNTIL = config(
+    'OPAQUE_TOKEN_ACCEPT_LEGACY_UNTIL',
+    default='',
+    cast=lambda value: parse_utc_datetime(value) if value else None,
+)
 
 # -- SQL ---------------------------------------------------------------------
 
@@ -81,6 +152,11 @@ SQL_URI = f'postgresql://{PSQL_USER}:{PSQL_PASSWORD}@{PSQL_HOST}:{PSQL_PORT}/{PS
 # Number of concurrent connection to SQL database
 SQL_POOL_SIZE = config('SQL_POOL_SIZE', default=1, cast=int)
 
+# Whether to log the number of SQL statements executed by each request,
+# and the rows and time they took
+SQL_LOG_REQUEST_STATS = config(
+    'SQL_LOG_REQUEST_STATS', default=True, cast=bool)
+
 
 # -- URLs --------------------------------------------------------------------
 
@@ -109,8 +185,147 @@ OIDC_TOKEN_URL = f'{OIDC_AUTHORITY_URL}/connect/token'
 OIDC_JWKS_URL = f'{OIDC_AUTHORITY_URL}/.well-known/openid-configuration/jwks'
 OIDC_API_LOGOUT_URL = f'{OIDC_AUTHORITY_URL}/api/v1/session/logout'
 
+# Seconds to cache the Identity Provider's JWKS, unless it says otherwise
+# using the Cache-Control header
+OIDC_JWKS_CACHE_TTL = config('OIDC_JWKS_CACHE_TTL', default=3600, cast=int)
+
+# Min seconds between refreshing the JWKS because a token was signed with
+# an unknown key (the IdP may have rotated its keys)
+OIDC_JWKS_REFRESH_INTERVAL = config(
+    'OIDC_JWKS_REFRESH_INTERVAL', default=60, cast=int)
+
+# Max seconds to keep using an expired JWKS while the IdP is unreachable
+OIDC_JWKS_GRACE_PERIOD = config(
+    'OIDC_JWKS_GRACE_PERIOD', default=3600, cast=int)
+
+# Whether each worker should fetch the JWKS when starting, and refresh it in
+# the background before it expires
+OIDC_JWKS_PREFETCH = config('OIDC_JWKS_PREFETCH', default=True, cast=bool)
+
+# Whether the readiness check should fail until the JWKS has been fetched
+OIDC_JWKS_REQUIRED_FOR_READINESS = config(
+    'OIDC_JWKS_REQUIRED_FOR_READINESS', default=False, cast=bool)
+
+# Seconds to wait for the Identity Provider to accept a connection, and to
+# respond (per request)
+OIDC_CONNECT_TIMEOUT = config('OIDC_CONNECT_TIMEOUT', default=3, cast=float)
+OIDC_READ_TIMEOUT = config('OIDC_READ_TIMEOUT', default=10, cast=float)
+
+# Max seconds the login callback may spend on calls to the Identity Provider
+# in total, before failing (error code E505)
+OIDC_CALLBACK_DEADLINE = config(
+    'OIDC_CALLBACK_DEADLINE', default=20, cast=float)
+
+# Max number of completed logins remembered per worker, so callbacks
+# replayed by the same browser (same code, state and nonce cookie) reuse
+# their outcome
+OIDC_CALLBACK_CACHE_SIZE = config(
+    'OIDC_CALLBACK_CACHE_SIZE', default=10000, cast=int)
+
+# Max number of seconds the outcome of a login callback is remembered
+OIDC_CALLBACK_CACHE_TTL = config(
+    'OIDC_CALLBACK_CACHE_TTL', default=60, cast=int)
+
+# Rate (0-1) of failed calls to the Identity Provider, among the most recent
+# OIDC_CIRCUIT_WINDOW_SIZE calls (per operation), which opens the circuit,
+# once at least OIDC_CIRCUIT_MIN_CALLS calls have been made
+OIDC_CIRCUIT_FAILURE_RATE = config(
+    'OIDC_CIRCUIT_FAILURE_RATE', default=0.5, cast=float)
+OIDC_CIRCUIT_WINDOW_SIZE = config(
+    'OIDC_CIRCUIT_WINDOW_SIZE', default=20, cast=int)
+OIDC_CIRCUIT_MIN_CALLS = config(
+    'OIDC_CIRCUIT_MIN_CALLS', default=10, cast=int)
+
+# Seconds after which a call to the Identity Provider counts as failed
+OIDC_CIRCUIT_SLOW_CALL_DURATION = config(
+    'OIDC_CIRCUIT_SLOW_CALL_DURATION', default=5, cast=float)
+
+# Seconds the circuit stays open before letting a call through as a probe
+OIDC_CIRCUIT_OPEN_DURATION = config(
+    'OIDC_CIRCUIT_OPEN_DURATION', default=30, cast=float)
+
+# Whether each worker should send queued logouts to the Identity Provider
+# (from the logout outbox) in the background
+OIDC_LOGOUT_WORKER = config('OIDC_LOGOUT_WORKER', default=True, cast=bool)
+
+# Max number of queued logouts to claim from the outbox at a time
+OIDC_LOGOUT_BATCH_SIZE = config(
+    'OIDC_LOGOUT_BATCH_SIZE', default=50, cast=int)
+
+# Seconds to wait before checking the outbox again when it is empty
+OIDC_LOGOUT_POLL_INTERVAL = config(
+    'OIDC_LOGOUT_POLL_INTERVAL', default=5, cast=float)
+
+# Seconds a claimed logout is reserved for the worker which claimed it.
+# Extended to at least OIDC_LOGOUT_BATCH_SIZE times the OIDC timeouts, so a
+# batch is not claimed again while it is still being sent.
+OIDC_LOGOUT_LEASE = config('OIDC_LOGOUT_LEASE', default=60, cast=float)
+
+# Max number of attempts to log out before dropping the logout (attempts
+# made while the circuit is open are not counted)
+OIDC_LOGOUT_MAX_ATTEMPTS = config(
+    'OIDC_LOGOUT_MAX_ATTEMPTS', default=10, cast=int)
+
+# Seconds to wait before retrying a failed logout (doubled after each
+# failed attempt, up to OIDC_LOGOUT_MAX_BACKOFF)
+OIDC_LOGOUT_BACKOFF = config('OIDC_LOGOUT_BACKOFF', default=5, cast=float)
+OIDC_LOGOUT_MAX_BACKOFF = config(
+    'OIDC_LOGOUT_MAX_BACKOFF', default=600, cast=float)
+
 # -- eo-datasync -------------------------------------------------------------
 DATASYNC_BASE_URL = os.environ.get('DATASYNC_BASE_URL', 'http://eo-data-sync')
 
 DATASYNC_CREATE_RELATIONS_PATH = \
     os.environ.get('DATASYNC_CREATE_RELATIONS_PATH', '/relations')
+
+# Seconds to wait for eo-datasync to accept a connection, and to respond
+DATASYNC_CONNECT_TIMEOUT = config(
+    'DATASYNC_CONNECT_TIMEOUT', default=3, cast=float)
+DATASYNC_READ_TIMEOUT = config(
+    'DATASYNC_READ_TIMEOUT', default=5, cast=float)
+
+# Seconds after relations were created in eo-datasync for a user or company,
+# before they are created again when logging in (0 to create them on every
+# login)
+DATASYNC_RELATIONS_MAX_AGE = config(
+    'DATASYNC_RELATIONS_MAX_AGE', default=86400, cast=int)
+
+# Whether each worker should send queued requests to eo-datasync (from the
+# relations outbox) in the background
+DATASYNC_OUTBOX_WORKER = config(
+    'DATASYNC_OUTBOX_WORKER', default=True, cast=bool)
+
+# Max number of queued requests to claim from the outbox at a time
+DATASYNC_OUTBOX_BATCH_SIZE = config(
+    'DATASYNC_OUTBOX_BATCH_SIZE', default=50, cast=int)
+
+# Seconds to wait before checking the outbox again when it is empty
+DATASYNC_OUTBOX_POLL_INTERVAL = config(
+    'DATASYNC_OUTBOX_POLL_INTERVAL', default=5, cast=float)
+
+# Seconds a claimed request is reserved for the worker which claimed it.
+# If the worker stops before sending it, another worker sends it afterwards.
+# Extended to at least DATASYNC_OUTBOX_BATCH_SIZE times the timeouts above,
+# so a batch is not claimed again while it is still being sent.
+DATASYNC_OUTBOX_LEASE = config(
+    'DATASYNC_OUTBOX_LEASE', default=60, cast=float)
+
+# Max number of attempts to send a request before dropping it
+DATASYNC_OUTBOX_MAX_ATTEMPTS = config(
+    'DATASYNC_OUTBOX_MAX_ATTEMPTS', default=10, cast=int)
+
+# Seconds to wait before retrying a failed request (doubled after each
+# failed attempt, up to DATASYNC_OUTBOX_MAX_BACKOFF)
+DATASYNC_OUTBOX_BACKOFF = config(
+    'DATASYNC_OUTBOX_BACKOFF', default=5, cast=float)
+DATASYNC_OUTBOX_MAX_BACKOFF = config(
+    'DATASYNC_OUTBOX_MAX_BACKOFF', default=600, cast=float)
+
+
+# -- Outbound HTTP -----------------------------------------------------------
+
+# Max number of hosts (IdP, eo-datasync, etc.) to keep connection pools for
+HTTP_POOL_CONNECTIONS = config('HTTP_POOL_CONNECTIONS', default=10, cast=int)
+
+# Max number of keep-alive connections to keep open per host
+HTTP_POOL_MAXSIZE = config('HTTP_POOL_MAXSIZE', default=10, cast=int)
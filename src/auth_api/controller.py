@@ -1,7 +1,13 @@
 # Standard Library
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import List, Optional
-from uuid import uuid4
+from typing import List, Optional, Tuple
+from uuid import UUID, uuid4, uuid5
+
+# Third party
+from sqlalchemy import select
+from sqlalchemy.sql import ColumnElement
+from sqlalchemy.dialects.postgresql import Insert, insert
 
 # First party
 from origin.encrypt import aes256_encrypt
@@ -11,21 +17,27 @@ from origin.tokens import TokenEncoder
 # Local
 from .config import (
     INTERNAL_TOKEN_SECRET,
+    OPAQUE_TOKEN_ACCEPT_LEGACY_UNTIL,
+    OPAQUE_TOKEN_SECRET,
     STATE_ENCRYPTION_SECRET,
 )
 from .db import db
+from .invalidation import notify_token_revoked
+from .opaque_token import OpaqueTokenSigner, derive_secret
 from .models import (
     DbCompany,
     DbExternalUser,
     DbLoginRecord,
+    DbLogoutOutbox,
+    DbRelationsOutbox,
     DbToken,
     DbUser,
+    DbUserCompany,
 )
 from .queries import (
     CompanyQuery,
-    ExternalUserQuery,
     TokenQuery,
-    UserQuery,
+    USER_AND_COMPANY_LOOKUP,
 )
 
 # -- Encoders & Encryption ---------------------------------------------------
@@ -37,6 +49,15 @@ internal_token_encoder = TokenEncoder(
 )
 
 
+opaque_token_signer = OpaqueTokenSigner(
+    secret=OPAQUE_TOKEN_SECRET or derive_secret(
+        secret=INTERNAL_TOKEN_SECRET,
+        label='eo-auth opaque token',
+    ),
+    accept_legacy_until=OPAQUE_TOKEN_ACCEPT_LEGACY_UNTIL,
+)
+
+
 def encrypt_ssn(ssn: str) -> str:
     """
     Encrypts social security number using encryption key from project config.
@@ -50,6 +71,27 @@ def encrypt_ssn(ssn: str) -> str:
     )
 
 
+# -- Users -------------------------------------------------------------------
+
+
+USER_SUBJECT_NAMESPACE = UUID('3b5f0b56-8f3e-4f4e-9d1a-6f2a7c1e9b40')
+"""Namespace of the (uuid5) subjects of new users, see get_user_subject()."""
+
+
+# -- Models ------------------------------------------------------------------
+
+
+@dataclass
+class IssuedToken:
+    """A token issued by DatabaseController.create_token()."""
+
+    opaque_token: str
+    """The (signed) opaque token, to give to the client."""
+
+    internal_token: str
+    """The internal token, encoded."""
+
+
 # -- Database controller -----------------------------------------------------
 
 
@@ -71,13 +113,40 @@ class DatabaseController(object):
         :returns: if the current user exits, in the database, it will be
             returned
         """
-        external_user = ExternalUserQuery(session) \
-            .has_identity_provider(identity_provider) \
-            .has_external_subject(external_subject) \
-            .one_or_none()
+        user, _ = self.get_user_and_company(
+            session=session,
+            identity_provider=identity_provider,
+            external_subject=external_subject,
+        )
+
+        return user
 
-        if external_user:
-            return external_user.user
+    def get_user_and_company(
+            self,
+            session: db.Session,
+            identity_provider: str,
+            external_subject: str,
+            tin: Optional[str] = None,
+    ) -> Tuple[Optional[DbUser], Optional[DbCompany]]:
+        """
+        Identify an external subject, and the company it logs in on behalf of.
+
+        Both are looked up in a single query (see USER_AND_COMPANY_LOOKUP).
+
+        :param session: Database session
+        :param identity_provider: ID/name of Identity Provider
+        :param external_subject: Identity Provider's subject
+        :param tin: Company tax identification number, if any
+        :returns: The user and the company, each if they exist in the
+            database
+        """
+        row = session.execute(USER_AND_COMPANY_LOOKUP, {
+            'identity_provider': identity_provider,
+            'external_subject': external_subject,
+            'tin': tin,
+        }).one()
+
+        return row.DbUser, row.DbCompany
 
     def get_company_by_tin(
         self,
@@ -103,38 +172,67 @@ class DatabaseController(object):
     def get_or_create_user(
             self,
             session: db.Session,
-            ssn: Optional[str] = None,
+            identity_provider: str,
+            external_subject: str,
     ) -> DbUser:
         """
         Identify a subject.
 
-        If the user does exist it returns, if not the user will be created.
+        Returns the user of the external user, which is created (and
+        attached to a new user) if it does not exist.
+
+        The subject of a new user is derived from the external user (see
+        get_user_subject()), so concurrent first logins by the same external
+        user insert the same user, and can not race into creating two
+        users. Both are inserted without updating any existing rows.
 
         :param session: Database session
-        :param ssn: Social security number, unencrypted
-        :param tin: Tax Identification Number
+        :param identity_provider: ID/name of Identity Provider
+        :param external_subject: Identity Provider's subject
         :returns: user information
         """
+        subject = self.get_user_subject(
+            identity_provider=identity_provider,
+            external_subject=external_subject,
+        )
 
-        ssn_encrypted = encrypt_ssn(ssn) if ssn is not None else None
+        stmt = insert(DbUser) \
+            .values(subject=subject) \
+            .on_conflict_do_nothing(index_elements=[DbUser.subject])
 
-        query = UserQuery(session)
-        # TODO: REMOVE ALL SSN RELATED STUFF, IT'S A NOT NEEDED
-        if ssn is not None:
-            query = query.has_ssn(ssn_encrypted)
+        user = self._insert_or_select(
+            session=session,
+            model=DbUser,
+            stmt=stmt,
+            where=DbUser.subject == subject,
+        )
 
-        user = query.one_or_none()
+        self.attach_external_user(
+            session=session,
+            user=user,
+            identity_provider=identity_provider,
+            external_subject=external_subject,
+        )
 
-        if user is None:
-            user = DbUser(
-                subject=str(uuid4()),
-                ssn=ssn_encrypted,
-            )
+        return user
 
-            session.add(user)
-            session.commit()
+    def get_user_subject(
+            self,
+            identity_provider: str,
+            external_subject: str,
+    ) -> str:
+        """
+        Return the subject of a new user for an external user.
 
-        return user
+        :param identity_provider: ID/name of Identity Provider
+        :param external_subject: Identity Provider's subject
+        :returns: The subject, the same for every call with the same
+            identity_provider and external_subject
+        """
+        return str(uuid5(
+            USER_SUBJECT_NAMESPACE,
+            f'{identity_provider}:{external_subject}',
+        ))
 
     def attach_external_user(
             self,
@@ -153,27 +251,25 @@ class DatabaseController(object):
         :param identity_provider: ID/name of Identity Provider
         :param external_subject: Identity Provider's subject
         """
+        stmt = insert(DbExternalUser).values(
+            subject=user.subject,
+            identity_provider=identity_provider,
+            external_subject=external_subject,
+        )
 
-        query = ExternalUserQuery(session)
-
-        query = query \
-            .has_external_subject(external_subject) \
-            .has_identity_provider(identity_provider)
-
-        external_user = query.one_or_none()
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[
+                DbExternalUser.identity_provider,
+                DbExternalUser.external_subject,
+            ],
+        )
 
-        if external_user is None:
-            session.add(DbExternalUser(
-                user=user,
-                identity_provider=identity_provider,
-                external_subject=external_subject
-            ))
-            session.commit()
+        session.execute(stmt)
 
     def create_user(
             self,
             session: db.Session,
-            ssn: str,
+            ssn: Optional[str] = None,
     ) -> DbUser:
         """
         Create a new user in the database.
@@ -182,17 +278,14 @@ class DatabaseController(object):
         :param ssn: Social security number, unencrypted
         :returns: user information
         """
-        ssn_encrypted = encrypt_ssn(ssn)
+        ssn_encrypted = encrypt_ssn(ssn) if ssn is not None else None
 
-        user = DbUser(
+        stmt = insert(DbUser).values(
             subject=str(uuid4()),
             ssn=ssn_encrypted,
         )
 
-        session.add(user)
-        session.commit()
-
-        return user
+        return self._execute_returning(session, DbUser, stmt)
 
     def register_user_login(
             self,
@@ -225,16 +318,12 @@ class DatabaseController(object):
         :return: Created company
         :rtype: DbCompany
         """
-
-        company = DbCompany(
-            tin=tin,
+        stmt = insert(DbCompany).values(
             id=str(uuid4()),
+            tin=tin,
         )
 
-        session.add(company)
-        session.commit()
-
-        return company
+        return self._execute_returning(session, DbCompany, stmt)
 
     def get_or_create_company(
         self,
@@ -243,6 +332,11 @@ class DatabaseController(object):
     ) -> DbCompany:
         """Get or create a company by/with tin.
 
+        The company is inserted by tin, ignoring an existing company (which
+        is selected instead), so concurrent logins on behalf of the same
+        company can not race into creating two companies, and logging in
+        does not write to (or lock) an existing company.
+
         :param session: Database session
         :type session: db.Session
         :param tin: Tax identification number
@@ -250,19 +344,16 @@ class DatabaseController(object):
         :return: Company
         :rtype: DbCompany
         """
-        query = CompanyQuery(session)
-
-        query = query.has_tin(tin)
-
-        company = query.one_or_none()
-
-        if company is None:
-            company = self.create_company(
-                session=session,
-                tin=tin,
-            )
-
-        return company
+        stmt = insert(DbCompany) \
+            .values(id=str(uuid4()), tin=tin) \
+            .on_conflict_do_nothing(index_elements=[DbCompany.tin])
+
+        return self._insert_or_select(
+            session=session,
+            model=DbCompany,
+            stmt=stmt,
+            where=DbCompany.tin == tin,
+        )
 
     def attach_user_to_company(
         self,
@@ -275,7 +366,10 @@ class DatabaseController(object):
 
         Since users and companies have a "many to many" relationship, this
         method lets you add a user to a company. This also adds the company
-        to the user.
+        to the user. Does nothing if the user is already added.
+
+        The membership is inserted directly, so company.users and
+        user.companies are not updated if they are already loaded.
 
         :param session: Database session
         :type session: db.Session
@@ -284,9 +378,15 @@ class DatabaseController(object):
         :param user: The user to be added to the company
         :type user: DbUser
         """
-        if user not in company.users:
-            company.users.append(user)
-            session.commit()
+        # Inserting (and ignoring an existing membership) only probes the
+        # primary key of user_company, instead of loading all users of the
+        # company, so the cost does not depend on the size of the company
+        stmt = insert(DbUserCompany).values(
+            company_id=company.id,
+            user_id=user.subject,
+        )
+
+        session.execute(stmt.on_conflict_do_nothing())
 
     def create_token(
             self,
@@ -297,12 +397,14 @@ class DatabaseController(object):
             subject: str,
             id_token: str,
             scope: List[str],
-    ) -> str:
+    ) -> IssuedToken:
         """
         Create an internal token with the provided scopes.
 
         Create an internal token with the provided scopes on behalf of
-        the provided subject, and returns the opaque token.
+        the provided subject, and returns the (signed) opaque token along
+        with the encoded internal token, so it does not have to be read
+        back from the database.
         The raw ID token is saved together with the token. It is used when
         logging out the user via Signaturgruppen back-channel logout via
         their API.
@@ -314,7 +416,7 @@ class DatabaseController(object):
         :param actor: The actor who is logged in on behalf of subject
         :param id_token: ID token from Identity Provider, raw/encoded
         :param scope: The scopes to grant
-        :returns: Opaque token
+        :returns: The issued token
         """
         internal_token = InternalToken(
             issued=issued,
@@ -327,18 +429,21 @@ class DatabaseController(object):
         internal_token_encoded = internal_token_encoder \
             .encode(internal_token)
 
-        opaque_token = str(uuid4())
+        token_id = str(uuid4())
 
         session.add(DbToken(
             subject=subject,
-            opaque_token=opaque_token,
+            opaque_token=token_id,
             internal_token=internal_token_encoded,
             issued=issued,
             expires=expires,
             id_token=id_token,
         ))
 
-        return opaque_token
+        return IssuedToken(
+            opaque_token=opaque_token_signer.sign(token_id, expires),
+            internal_token=internal_token_encoded,
+        )
 
     def get_token(
             self,
@@ -349,19 +454,150 @@ class DatabaseController(object):
         """
         Look up token by opaque token.
 
+        The signature of the opaque token is verified, but its expiry
+        is not (use only_valid to only fetch tokens which are valid).
+
         :param session: Database session
         :param opaque_token: Opaque token
         :param only_valid: Set to True to only fetch token if its valid
         :returns: Token or None
         """
+        token_id = opaque_token_signer.verify(
+            opaque_token=opaque_token,
+            check_expiry=False,
+        )
+
+        if token_id is None:
+            return None
+
         query = TokenQuery(session) \
-            .has_opaque_token(opaque_token)
+            .has_opaque_token(token_id)
 
         if only_valid:
             query = query.is_valid()
 
         return query.one_or_none()
 
+    def delete_token(
+            self,
+            session: db.Session,
+            token: DbToken,
+    ):
+        """
+        Delete (revoke) a token.
+
+        All workers are notified to evict the token from their caches
+        once the session's transaction is committed.
+
+        :param session: Database session
+        :param token: The token to delete
+        """
+        session.delete(token)
+        notify_token_revoked(
+            session=session,
+            opaque_token=token.opaque_token,
+        )
+
+    def queue_relations(
+            self,
+            session: db.Session,
+            subject: str,
+            internal_token: str,
+            ssn: Optional[str] = None,
+            tin: Optional[str] = None,
+    ):
+        """
+        Queue a request to eo-datasync to create relations.
+
+        The request is sent by the outbox worker once the session's
+        transaction is committed (see outbox.py).
+
+        :param session: Database session
+        :param subject: The user subject (for logging)
+        :param internal_token: Internal token to authorize the request with
+        :param ssn: Social security number of the user (if private)
+        :param tin: Tax identification number of the company (if company)
+        """
+        session.add(DbRelationsOutbox(
+            subject=subject,
+            internal_token=internal_token,
+            ssn=ssn,
+            tin=tin,
+        ))
+
+    def queue_logout(
+            self,
+            session: db.Session,
+            id_token: str,
+    ):
+        """
+        Queue a logout at the Identity Provider.
+
+        The logout is sent by the logout worker once the session's
+        transaction is committed (see outbox.py).
+
+        :param session: Database session
+        :param id_token: ID token from Identity Provider, raw/encoded
+        """
+        session.add(DbLogoutOutbox(id_token=id_token))
+
+    def _execute_returning(
+            self,
+            session: db.Session,
+            model: type,
+            stmt: Insert,
+    ):
+        """
+        Execute an INSERT statement and return the row as a model instance.
+
+        The row is returned by the statement itself (INSERT ... RETURNING),
+        and replaces any stale instance of it in the session.
+
+        :param session: Database session
+        :param model: The model inserted into
+        :param stmt: The INSERT statement to execute
+        :returns: The inserted (or upserted) row
+        """
+        orm_stmt = select(model) \
+            .from_statement(stmt.returning(*model.__table__.c)) \
+            .execution_options(populate_existing=True)
+
+        return session.execute(orm_stmt).scalar_one()
+
+    def _insert_or_select(
+            self,
+            session: db.Session,
+            model: type,
+            stmt: Insert,
+            where: ColumnElement,
+    ):
+        """
+        Execute an INSERT ... ON CONFLICT DO NOTHING statement.
+
+        Returns the inserted row, or selects the existing row if nothing
+        was inserted because of a conflict.
+
+        :param session: Database session
+        :param model: The model inserted into
+        :param stmt: The INSERT statement to execute
+        :param where: Criteria selecting the existing row
+        :returns: The inserted or existing row
+        """
+        orm_stmt = select(model) \
+            .from_statement(stmt.returning(*model.__table__.c)) \
+            .execution_options(populate_existing=True)
+
+        row = session.execute(orm_stmt).scalar_one_or_none()
+
+        if row is None:
+            row = session.execute(
+                select(model)
+                .where(where)
+                .execution_options(populate_existing=True)
+            ).scalar_one()
+
+        return row
+
 
 # -- Singletons --------------------------------------------------------------
 
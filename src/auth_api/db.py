@@ -11,3 +11,14 @@ Database instance.
 
 Used to access database.
 """
+
+outbox_db = SqlEngine(
+    uri=SQL_URI,
+    pool_size=1,
+)
+"""
+Database instance for the background outbox workers.
+
+Has its own connection pool, so the workers never wait for (or hold)
+connections needed by requests.
+"""
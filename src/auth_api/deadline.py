@@ -0,0 +1,105 @@
+# Standard Library
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Iterator, Optional, Tuple, TypeVar
+
+# Third party
+import requests
+
+T = TypeVar('T')
+
+
+class DeadlineExceeded(Exception):
+    """Raised when there is no time left to make an outbound call."""
+
+    pass
+
+
+# Time (time.monotonic) when the current request must have completed
+_deadline: ContextVar[Optional[float]] = ContextVar('deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """
+    Limit the time outbound calls made within the block may take in total.
+
+    Nested deadlines can only shorten the current deadline.
+
+    :param seconds: Time budget for the block
+    """
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+
+    if current is not None:
+        expires = min(expires, current)
+
+    reset_token = _deadline.set(expires)
+
+    try:
+        yield
+    finally:
+        _deadline.reset(reset_token)
+
+
+def get_remaining() -> Optional[float]:
+    """Return seconds left of the current deadline (None if no deadline)."""
+
+    expires = _deadline.get()
+
+    if expires is None:
+        return None
+
+    return expires - time.monotonic()
+
+
+def get_timeout(connect: float, read: float) -> Tuple[float, float]:
+    """
+    Return the (connect, read) timeout to use for an outbound call.
+
+    The dependency's own timeouts, shortened to the time left of the
+    current deadline.
+
+    :param connect: Seconds to wait for the dependency to accept the
+        connection
+    :param read: Seconds to wait for the dependency to respond
+    :raises DeadlineExceeded: If the deadline has passed
+    """
+    remaining = get_remaining()
+
+    if remaining is None:
+        return connect, read
+
+    if remaining <= 0:
+        raise DeadlineExceeded()
+
+    return min(connect, remaining), min(read, remaining)
+
+
+def raise_deadline_exceeded(function: Callable[..., T]) -> Callable[..., T]:
+    """
+    Raise timeouts caused by the deadline as DeadlineExceeded.
+
+    Timeouts shortened by get_timeout() expire when the deadline passes,
+    so a timeout raised once it has passed is due to the deadline, rather
+    than to a slow dependency.
+
+    :param function: Function making outbound calls
+    :returns: The function, raising DeadlineExceeded instead
+    """
+
+    @wraps(function)
+    def _wrapper(*args, **kwargs) -> T:
+        try:
+            return function(*args, **kwargs)
+        except requests.Timeout as e:
+            remaining = get_remaining()
+
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded() from e
+
+            raise
+
+    return _wrapper
@@ -26,3 +26,9 @@ from .user import (
 from .company_uuid import (
     GetCompanyId
 )
+
+from .health import (
+    ReadinessCheck,
+    GetHttpMetrics,
+    GetSqlMetrics,
+)
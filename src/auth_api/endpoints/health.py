@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+
+from origin.api import Endpoint, HttpError
+
+from auth_api.config import OIDC_JWKS_REQUIRED_FOR_READINESS
+from auth_api.http_client import http_stats
+from auth_api.oidc import session
+from auth_api.sql_stats import sql_stats
+
+
+class ReadinessCheck(Endpoint):
+    """
+    Readiness check endpoint.
+
+    Returns status 503 until the worker is ready to serve logins, and
+    status 200 afterwards.
+    """
+
+    def handle_request(self):
+        """Handle HTTP request."""
+
+        if OIDC_JWKS_REQUIRED_FOR_READINESS and not session.jwks.loaded:
+            raise HttpError(msg='JWKS not loaded', status=503)
+
+
+class GetHttpMetrics(Endpoint):
+    """
+    Return counters for the outbound HTTP requests sent by this worker.
+
+    Requests which did not open a connection reused a keep-alive
+    connection from the pool.
+    """
+
+    @dataclass
+    class Response:
+        """Counters since the worker started."""
+
+        requests: int
+        connections_opened: int
+        connections_reused: int
+
+    def handle_request(self) -> Response:
+        """Handle HTTP request."""
+
+        return self.Response(**http_stats.as_dict())
+
+
+class GetSqlMetrics(Endpoint):
+    """Return counters for the SQL statements executed by this worker."""
+
+    @dataclass
+    class Response:
+        """Counters since the worker started."""
+
+        statements: int
+        rows: int
+        duration_ms: float
+
+    def handle_request(self) -> Response:
+        """Handle HTTP request."""
+
+        return self.Response(**sql_stats.as_dict())
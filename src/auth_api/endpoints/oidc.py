@@ -1,7 +1,12 @@
-from typing import Optional, Union
+import logging
+import secrets
+from hashlib import sha256
+from typing import Optional
+from urllib.parse import urlsplit
 from datetime import datetime, timezone
 from dataclasses import dataclass, field
 
+import requests
 from origin.auth import TOKEN_COOKIE_NAME
 from origin.encrypt import aes256_encrypt
 from origin.api import (
@@ -14,7 +19,13 @@ from origin.api import (
 )
 
 from auth_api.db import db
+from auth_api.cache import (
+    login_callback_cache,
+    login_callbacks,
+    token_cache,
+)
 from auth_api.controller import db_controller
+from auth_api.deadline import DeadlineExceeded, deadline
 from auth_api.orchestrator import LoginOrchestrator, state_encoder
 from auth_api.state import AuthState, redirect_to_failure
 from auth_api.config import (
@@ -25,11 +36,17 @@ from auth_api.config import (
     OIDC_LOGIN_CALLBACK_URL,
     STATE_ENCRYPTION_SECRET,
     OIDC_LANGUAGE,
+    OIDC_CALLBACK_DEADLINE,
 )
 from auth_api.oidc import (
     oidc_backend,
 )
 
+logger = logging.getLogger(__name__)
+
+# Name of the cookie which binds a login flow to the browser that started it
+CALLBACK_NONCE_COOKIE_NAME = 'oidc_callback_nonce'
+
 # -- Models ------------------------------------------------------------------
 
 
@@ -86,8 +103,14 @@ class OpenIdLogin(Endpoint):
     def handle_request(
             self,
             request: Request,
-    ) -> Union[Response, TemporaryRedirect]:
-        """Handle HTTP request."""
+    ) -> HttpResponse:
+        """
+        Handle HTTP request.
+
+        Sets a random nonce in a cookie, which is sent back to the callback
+        endpoint by the browser that started the login. Only this browser
+        can reuse the outcome of a replayed callback.
+        """
 
         state = AuthState(
             fe_url=request.fe_url,
@@ -101,7 +124,22 @@ class OpenIdLogin(Endpoint):
             language=OIDC_LANGUAGE,
         )
 
-        return self.Response(next_url=next_url)
+        # Not SameSite, as the Identity Provider redirects to the callback
+        nonce = Cookie(
+            name=CALLBACK_NONCE_COOKIE_NAME,
+            value=secrets.token_urlsafe(32),
+            path=urlsplit(OIDC_LOGIN_CALLBACK_URL).path,
+            domain=TOKEN_COOKIE_DOMAIN,
+            http_only=True,
+            same_site=False,
+            secure=True,
+        )
+
+        return HttpResponse(
+            status=200,
+            model=self.Response(next_url=next_url),
+            cookies=(nonce,),
+        )
 
 
 # -- Login Callback Endpoints ------------------------------------------------
@@ -126,15 +164,76 @@ class OpenIDCallbackEndpoint(Endpoint):
     def __init__(self, url: str):
         self.url = url
 
-    @db.atomic()
     def handle_request(
             self,
             request: OidcCallbackParams,
-            session: db.Session,
+            context: Context,
     ) -> TemporaryRedirect:
         """
         Handle request.
 
+        Browsers and proxies may replay the callback (ie. on refresh or
+        double-submit), but the code can only be exchanged once. Replayed
+        callbacks (same code and state) from the browser which started the
+        login (same nonce cookie, see OpenIdLogin) therefore reuse the
+        outcome of the completed login, or wait for the callback in flight,
+        for OIDC_CALLBACK_CACHE_TTL seconds (per worker).
+
+        Callbacks replayed by anyone else, ie. from a leaked callback URL,
+        never get the outcome, as it holds the token cookie. Only logins
+        which completed (issued a token) are reused, failures are not.
+
+        :param request: Parameters provided by the Identity Provider
+        :param context: Context for the HTTP request
+        """
+        nonce = context.cookies.get(CALLBACK_NONCE_COOKIE_NAME)
+
+        if not request.code or not nonce:
+            return self.handle_callback(request=request)
+
+        key = sha256(
+            f'{request.code}:{request.state}:{nonce}'.encode()).hexdigest()
+
+        outcome = login_callback_cache.get(key)
+
+        if outcome is None:
+            outcome = login_callbacks.do(
+                key, lambda: self._handle_callback_once(key, request))
+
+        return outcome
+
+    def _handle_callback_once(
+            self,
+            key: str,
+            request: OidcCallbackParams,
+    ) -> TemporaryRedirect:
+        """Handle callback, unless it completed while waiting to start."""
+
+        outcome = login_callback_cache.get(key)
+
+        if outcome is None:
+            # Committed once handle_callback() returns
+            outcome = self.handle_callback(request=request)
+
+            # Only completed logins set the token cookie
+            if outcome.cookies:
+                login_callback_cache.set(key, outcome)
+
+        return outcome
+
+    @db.atomic()
+    def handle_callback(
+            self,
+            request: OidcCallbackParams,
+            session: db.Session,
+    ) -> TemporaryRedirect:
+        """
+        Handle callback from the Identity Provider.
+
+        Calls to the Identity Provider must complete within
+        OIDC_CALLBACK_DEADLINE, otherwise the client is redirected with
+        error code E505 (and the token is not committed).
+
         :param request: Parameters provided by the Identity Provider
         :param session: Database session
         """
@@ -153,24 +252,62 @@ class OpenIDCallbackEndpoint(Endpoint):
                 params=request,
             )
 
+        with deadline(OIDC_CALLBACK_DEADLINE):
+            try:
+                return self.on_oidc_flow_succeeded(
+                    state=state,
+                    params=request,
+                    session=session,
+                )
+            except (DeadlineExceeded, requests.Timeout):
+                # Raised (rather than returned) to roll back the transaction
+                raise redirect_to_failure(
+                    state=state,
+                    error_code='E505',
+                )
+
+    def on_oidc_flow_succeeded(
+            self,
+            state: AuthState,
+            params: OidcCallbackParams,
+            session: db.Session,
+    ) -> TemporaryRedirect:
+        """
+        Invoke when OpenID Connect Flow succeeds.
+
+        Fetches the token from the Identity Provider and continues the
+        login flow.
+
+        :param state: State object
+        :param params: Callback parameters from Identity Provider
+        :param session: Database session
+        :returns: Http response
+        """
+
         # Fetch token from Identity Provider
         try:
             oidc_token = oidc_backend.fetch_token(
-                code=request.code,
-                state=request.state,
+                code=params.code,
+                state=params.state,
                 redirect_uri=self.url,
             )
-        except Exception as _e:
-            print(_e)
-            # TODO Log this exception
+        except (DeadlineExceeded, requests.Timeout):
+            # Handled by handle_callback(), which rolls back the transaction
+            raise
+        except Exception:
+            logger.exception('Failed to fetch token from Identity Provider')
             return redirect_to_failure(
                 state=state,
                 error_code='E505',
             )
 
         if oidc_token.is_private:
-            print("Tried to login as a private user which isn't supported")
-            oidc_backend.logout(oidc_token.id_token)
+            logger.warning(
+                'Tried to login as a private user, which is not supported')
+            db_controller.queue_logout(
+                session=session,
+                id_token=oidc_token.id_token,
+            )
             return redirect_to_failure(
                 state=state,
                 error_code='E504',
@@ -186,25 +323,21 @@ class OpenIDCallbackEndpoint(Endpoint):
             key=STATE_ENCRYPTION_SECRET,
         )
 
-        # User is unknown when logging in for the first time and may be None
-        user = db_controller.get_user_by_external_subject(
+        # User (and company) are unknown when logging in for the first time
+        # and may be None
+        user, company = db_controller.get_user_and_company(
             session=session,
             external_subject=oidc_token.subject,
             identity_provider=oidc_token.provider,
+            tin=oidc_token.tin or None,
         )
 
-        company = None
-        if oidc_token.tin:
-            company = db_controller.get_company_by_tin(
-                session=session,
-                tin=oidc_token.tin,
-            )
-
         orchestrator = LoginOrchestrator(
             session=session,
             state=state,
             user=user,
             company=company,
+            looked_up=True,
         )
 
         return orchestrator.redirect_next_step()
@@ -255,6 +388,10 @@ class OpenIdLogout(Endpoint):
     Logs out the user from both our system as well as the used
     OpenId Connect Identity Provider. This is done by calling the OIDC
     logout endpoint as well as deleting the OIDC login session.
+
+    The token is deleted immediately, while the OIDC logout is queued and
+    sent by the logout worker, so logging out does not wait for (or fail
+    because of) the Identity Provider.
     """
 
     @dataclass
@@ -282,9 +419,22 @@ class OpenIdLogout(Endpoint):
         )
 
         if token is not None:
-            session.delete(token)
-            oidc_backend.logout(token.id_token)
+            # Loaded before the token (and its id_token) is deleted
+            id_token = token.id_token
+
+            db_controller.delete_token(
+                session=session,
+                token=token,
+            )
+
+            if id_token is not None:
+                db_controller.queue_logout(
+                    session=session,
+                    id_token=id_token,
+                )
+
             session.commit()
+            token_cache.delete(token.opaque_token)
 
         cookie = Cookie(
             name=TOKEN_COOKIE_NAME,
@@ -319,9 +469,11 @@ class OpenIdInvalidateLogin(Endpoint):
 
         state: str
 
+    @db.atomic()
     def handle_request(
             self,
             request: Request,
+            session: db.Session,
     ) -> HttpResponse:
         """Handle HTTP request."""
 
@@ -332,7 +484,7 @@ class OpenIdInvalidateLogin(Endpoint):
 
         orchestrator = LoginOrchestrator(
             state=state,
-            session=None
+            session=session,
         )
 
         if not orchestrator.invalidate_login():
@@ -1,5 +1,10 @@
 # Standard Library
 from dataclasses import dataclass
+from functools import partial
+from typing import Optional
+
+# Third party
+from sqlalchemy.engine import Row
 
 # First party
 from origin.api import (
@@ -13,9 +18,11 @@ from origin.models.auth import InternalToken
 from origin.tokens import TokenEncoder
 
 # Local
+from auth_api.cache import token_cache, token_lookups, unknown_token_cache
 from auth_api.config import INTERNAL_TOKEN_SECRET
+from auth_api.controller import opaque_token_signer
 from auth_api.db import db
-from auth_api.queries import TokenQuery
+from auth_api.queries import TOKEN_LOOKUP
 
 
 class ForwardAuth(Endpoint):
@@ -49,27 +56,75 @@ class ForwardAuth(Endpoint):
             },
         )
 
-    @db.session()
     def get_internal_token(
             self,
             opaque_token: str,
-            session: db.Session,
-    ) -> str:
+    ) -> Optional[str]:
         """
         Return internal token.
 
-        Only if the correct opaque_token is found in the database.
+        Only if the correct opaque_token is found in the database. Tokens
+        are cached per worker, so only cache misses hit the database.
+        Forged, malformed or expired tokens, and tokens recently found to
+        be unknown, are rejected without touching the database. Concurrent
+        misses for the same token share a single database lookup.
+
+        :param opaque_token: Opaque token provided by the client
+        """
+        token_id = opaque_token_signer.verify(opaque_token)
+
+        if token_id is None:
+            return None
+
+        internal_token = token_cache.get(token_id)
+
+        if internal_token is not None:
+            return internal_token
+
+        if unknown_token_cache.get(token_id):
+            return None
+
+        token = token_lookups.do(
+            key=token_id,
+            function=partial(self.get_token, token_id),
+        )
+
+        if token is None:
+            unknown_token_cache.set(key=token_id, value=True)
+            return None
+
+        if not token.valid:
+            # Not valid yet (ie. just issued), so do not cache it as unknown
+            return None
+
+        token_cache.set(
+            key=token_id,
+            value=token.internal_token,
+            expires=token.expires,
+        )
+
+        return token.internal_token
 
-        :param opaque_token: Primary Key Constraint
-        :param session: Database session
+    def get_token(
+            self,
+            token_id: str,
+    ) -> Optional[Row]:
         """
-        token = TokenQuery(session) \
-            .has_opaque_token(opaque_token) \
-            .is_valid() \
-            .one_or_none()
+        Return internal_token, expires and valid of a token from the database.
+
+        Only if the correct token is found, and it has not expired. Tokens
+        which are not valid yet are returned with valid=False.
 
-        if token:
-            return token.internal_token
+        Runs in autocommit mode, so the lookup is a single round trip
+        to the database (no BEGIN/ROLLBACK).
+
+        :param token_id: Id of the token (its opaque_token column)
+        """
+        with db.engine.connect() as connection:
+            return connection \
+                .execution_options(isolation_level='AUTOCOMMIT') \
+                .execute(TOKEN_LOOKUP, {'token_id': token_id}) \
+                .first()
 
 
 class InspectToken(Endpoint):
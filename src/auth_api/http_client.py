@@ -0,0 +1,129 @@
+# Standard Library
+import threading
+from typing import Any, Dict
+
+# Third party
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Local
+from .config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+
+
+class HttpStats(object):
+    """
+    Counts outbound HTTP requests, and the connections opened to send them.
+
+    Requests which did not open a connection reused a pooled (keep-alive)
+    connection, saving a TCP and TLS handshake.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def connections_reused(self) -> int:
+        """Number of requests sent on a pooled connection."""
+        return max(self.requests - self.connections_opened, 0)
+
+    def count_request(self):
+        """Count a request sent."""
+        with self._lock:
+            self.requests += 1
+
+    def count_connection_opened(self):
+        """Count a connection opened."""
+        with self._lock:
+            self.connections_opened += 1
+
+    def reset(self):
+        """Reset the counters."""
+        with self._lock:
+            self.requests = 0
+            self.connections_opened = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        """Return the counters."""
+        return {
+            'requests': self.requests,
+            'connections_opened': self.connections_opened,
+            'connections_reused': self.connections_reused,
+        }
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        super(_CountingHTTPConnection, self).connect()
+        http_stats.count_connection_opened()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super(_CountingHTTPSConnection, self).connect()
+        http_stats.count_connection_opened()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    Transport adapter which keeps connections alive in a pool per host.
+
+    The same adapter (and therefore the same pools) can be mounted on
+    several sessions. Counts requests and connections in http_stats.
+    """
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any):
+        """Initialize the pool manager, counting connections opened."""
+
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any):
+        """Send a request, counting it."""
+
+        http_stats.count_request()
+
+        return super(PooledHTTPAdapter, self).send(request, **kwargs)
+
+
+def mount_http_adapter(session: requests.Session):
+    """
+    Make a session send its requests using the shared connection pools.
+
+    :param session: The session, ie. the authlib OAuth2Session
+    """
+    session.mount('http://', http_adapter)
+    session.mount('https://', http_adapter)
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+# Counters for all outbound HTTP requests in this worker
+http_stats = HttpStats()
+
+# Connection pools shared by all outbound HTTP requests in this worker
+http_adapter = PooledHTTPAdapter(
+    pool_connections=HTTP_POOL_CONNECTIONS,
+    pool_maxsize=HTTP_POOL_MAXSIZE,
+)
+
+# Client for outbound HTTP requests (instead of requests.get() etc, which
+# opens a new connection for each request)
+http_client = requests.Session()
+mount_http_adapter(http_client)
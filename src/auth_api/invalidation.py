@@ -0,0 +1,205 @@
+# Standard Library
+import logging
+import select
+import threading
+from typing import Optional
+
+# Third party
+import sqlalchemy as sa
+from sqlalchemy.pool import NullPool
+
+# Local
+from .cache import token_cache, unknown_token_cache
+from .config import TOKEN_INVALIDATION_CHANNEL
+from .db import db
+
+logger = logging.getLogger(__name__)
+
+# Payload which evicts all entries from the caches
+FLUSH_ALL = '*'
+
+
+def notify_token_revoked(session: db.Session, opaque_token: str):
+    """
+    Notify all workers that a token has been revoked.
+
+    The notification is delivered when the session's transaction commits.
+
+    :param session: Database session
+    :param opaque_token: The revoked opaque token
+    """
+    session.execute(sa.select(
+        sa.func.pg_notify(TOKEN_INVALIDATION_CHANNEL, opaque_token),
+    ))
+
+
+def notify_flush_all(session: db.Session):
+    """
+    Notify all workers to evict all cached tokens.
+
+    The notification is delivered when the session's transaction commits.
+
+    :param session: Database session
+    """
+    notify_token_revoked(session, FLUSH_ALL)
+
+
+@db.atomic()
+def flush_token_caches(session: db.Session):
+    """
+    Evict all cached tokens in all workers.
+
+    :param session: Database session
+    """
+    notify_flush_all(session)
+
+
+def handle_invalidation(payload: str):
+    """
+    Evict tokens from the caches in this worker.
+
+    :param payload: Opaque token, or FLUSH_ALL to evict everything
+    """
+    if payload == FLUSH_ALL:
+        token_cache.clear()
+        unknown_token_cache.clear()
+    else:
+        token_cache.delete(payload)
+
+
+def flush_local_caches():
+    """
+    Evict all tokens from the caches kept in this worker's memory.
+
+    Caches shared with other workers (see TOKEN_CACHE_BACKEND) are left
+    alone, as the listeners of the other workers keep evicting revoked
+    tokens from them.
+    """
+    for cache in (token_cache, unknown_token_cache):
+        if not cache.shared:
+            cache.clear()
+
+
+class TokenInvalidationListener(threading.Thread):
+    """
+    Background thread which evicts revoked tokens from the caches.
+
+    Revoking a token sends a PostgreSQL NOTIFY with the opaque token as
+    payload (see notify_token_revoked()). NOTIFY is transactional, so it is
+    only delivered if the revocation is committed. Every worker runs a
+    listener, which LISTENs on the channel and evicts the revoked tokens.
+    The payload FLUSH_ALL evicts everything, ie. after rotating secrets.
+
+    Uses its own database connection (outside the connection pool).
+    Notifications may have been missed while not listening, so the caches
+    kept in this worker's memory are flushed whenever it (re)connects.
+    Shared caches are not, so starting or reconnecting a single worker
+    does not wipe the cache of every worker.
+
+    :param channel: Name of the channel to LISTEN on
+    :param poll_interval: Max seconds to wait for a notification before
+        checking if the listener has been stopped
+    :param retry_interval: Seconds to wait before reconnecting
+    """
+
+    def __init__(
+            self,
+            channel: str = TOKEN_INVALIDATION_CHANNEL,
+            poll_interval: float = 5,
+            retry_interval: float = 5,
+    ):
+        super(TokenInvalidationListener, self).__init__(
+            name='token-invalidation-listener',
+            daemon=True,
+        )
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.listening = threading.Event()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Stop listening (returns when the thread has stopped)."""
+
+        self._stopped.set()
+
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        """Listen for notifications until stopped."""
+
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception('Token invalidation listener failed')
+            finally:
+                self.listening.clear()
+
+            self._stopped.wait(self.retry_interval)
+
+    def _listen(self):
+        """Connect, LISTEN, and handle notifications until disconnected."""
+
+        engine = sa.create_engine(db.uri, poolclass=NullPool)
+        connection = engine.raw_connection()
+
+        try:
+            dbapi_connection = connection.connection
+            dbapi_connection.autocommit = True
+
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+
+            # Notifications could have been missed while not listening
+            flush_local_caches()
+            self.listening.set()
+
+            while not self._stopped.is_set():
+                self._wait_and_handle(dbapi_connection)
+        finally:
+            connection.close()
+            engine.dispose()
+
+    def _wait_and_handle(self, dbapi_connection):
+        """Wait for notifications and handle them."""
+
+        readable, _, _ = select.select(
+            [dbapi_connection], [], [], self.poll_interval)
+
+        if readable:
+            dbapi_connection.poll()
+
+            while dbapi_connection.notifies:
+                notify = dbapi_connection.notifies.pop(0)
+                handle_invalidation(notify.payload)
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+_listener: Optional[TokenInvalidationListener] = None
+_listener_lock = threading.Lock()
+
+
+def start_token_invalidation_listener() -> TokenInvalidationListener:
+    """
+    Start the token invalidation listener for this worker (only once).
+
+    :returns: The running listener
+    """
+    global _listener
+
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = TokenInvalidationListener()
+            _listener.start()
+
+        return _listener
+
+
+if __name__ == '__main__':
+    # Run "python -m auth_api.invalidation" to evict all cached tokens in
+    # all workers, ie. after rotating INTERNAL_TOKEN_SECRET.
+    flush_token_caches()
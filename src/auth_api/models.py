@@ -1,30 +1,50 @@
 # Third party
 from typing import List
 import sqlalchemy as sa
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
 
 # Local
 from .db import db
 
 
+@compiles(sa.PrimaryKeyConstraint, 'postgresql')
+def compile_primary_key(constraint, compiler, **kwargs):
+    """
+    Compile primary keys with support for INCLUDE (covering index).
+
+    SQLAlchemy does not support INCLUDE on constraints, so the columns
+    to include are provided as info={'postgresql_include': [...]}.
+    """
+    ddl = compiler.visit_primary_key_constraint(constraint, **kwargs)
+    include = constraint.info.get('postgresql_include')
+
+    if ddl and include:
+        ddl += ' INCLUDE (%s)' % ', '.join(
+            compiler.preparer.quote(column) for column in include)
+
+    return ddl
+
+
 class DbUserCompany(db.ModelBase):
     """Assosiation table, defining relationship betwen users and companies."""
 
     __tablename__ = 'user_company'
     __table_args__ = (
         sa.PrimaryKeyConstraint('company_id', 'user_id'),
-        sa.UniqueConstraint('company_id', 'user_id'),
     )
 
     company_id = sa.Column(
-        sa.String(),
+        UUID(as_uuid=False),
         sa.ForeignKey('company.id'),
         primary_key=True,
     )
     """Unique id for the company."""
 
     user_id = sa.Column(
-        sa.String(),
+        UUID(as_uuid=False),
         sa.ForeignKey('user.subject'),
         primary_key=True,
     )
@@ -41,12 +61,11 @@ class DbUser(db.ModelBase):
     __tablename__ = 'user'
     __table_args__ = (
         sa.PrimaryKeyConstraint('subject'),
-        sa.UniqueConstraint('subject'),
         sa.UniqueConstraint('ssn'),
         sa.CheckConstraint('ssn != NULL'),
     )
 
-    subject = sa.Column(sa.String(), index=True, nullable=False)
+    subject = sa.Column(UUID(as_uuid=False), nullable=False)
     """The user subject used to identify users."""
 
     created = sa.Column(sa.DateTime(timezone=True),
@@ -56,6 +75,9 @@ class DbUser(db.ModelBase):
     ssn = sa.Column(sa.String(), index=True)
     """Social security number, encrypted."""
 
+    relations_created = sa.Column(sa.DateTime(timezone=True))
+    """Time relations were last created in eo-datasync (if ever)."""
+
     companies: List['DbCompany'] = relationship(
         'DbCompany',
         secondary='user_company',
@@ -73,12 +95,11 @@ class DbCompany(db.ModelBase):
     __tablename__ = 'company'
     __table_args__ = (
         sa.PrimaryKeyConstraint('id'),
-        sa.UniqueConstraint('id'),
         sa.UniqueConstraint('tin'),
         sa.CheckConstraint('tin != null'),
     )
 
-    id = sa.Column(sa.String(), index=True, nullable=False)
+    id = sa.Column(UUID(as_uuid=False), nullable=False)
     """Unique id for the Database record."""
 
     created = sa.Column(sa.DateTime(timezone=True),
@@ -88,6 +109,9 @@ class DbCompany(db.ModelBase):
     tin = sa.Column(sa.String(), index=True, nullable=False)
     """Tax identification number."""
 
+    relations_created = sa.Column(sa.DateTime(timezone=True))
+    """Time relations were last created in eo-datasync (if ever)."""
+
     users: List['DbUser'] = relationship(
         'DbUser',
         secondary='user_company',
@@ -118,7 +142,7 @@ class DbExternalUser(db.ModelBase):
                         nullable=False, server_default=sa.func.now())
     """Time when the user signed up using identity provider."""
 
-    subject = sa.Column(sa.String(), sa.ForeignKey(
+    subject = sa.Column(UUID(as_uuid=False), sa.ForeignKey(
         'user.subject'), index=True, nullable=False)
 
     identity_provider = sa.Column(sa.String(), index=True, nullable=False)
@@ -173,16 +197,28 @@ class DbToken(db.ModelBase):
     id_token used to make requests to the used
     identity provider(MitID, Nemid, etc). The tokens are assigned to a specific
     user using the user "subject".
+
+    The id_token is stored in a separate table (see DbTokenIdToken), as it
+    is large and only needed when logging out, whereas the token row is
+    read by ForwardAuth for each request.
     """
 
     __tablename__ = 'token'
     __table_args__ = (
-        sa.PrimaryKeyConstraint('opaque_token'),
-        sa.UniqueConstraint('opaque_token'),
+        # Covers the columns read by ForwardAuth (index-only scan)
+        sa.PrimaryKeyConstraint(
+            'opaque_token',
+            name='token_pkey',
+            info={'postgresql_include': [
+                'internal_token',
+                'issued',
+                'expires',
+            ]},
+        ),
         sa.CheckConstraint('issued < expires'),
     )
 
-    opaque_token = sa.Column(sa.String(), index=True, nullable=False)
+    opaque_token = sa.Column(UUID(as_uuid=False), nullable=False)
     """
     Opaque token which is safe to pass to the frontend clients
 
@@ -195,9 +231,6 @@ class DbToken(db.ModelBase):
     internal_token = sa.Column(sa.String(), nullable=False)
     """Internal token used by our own system"""
 
-    id_token = sa.Column(sa.String(), nullable=False)
-    """Token used by identity provider"""
-
     issued = sa.Column(sa.DateTime(timezone=True), nullable=False)
     """Time when token were issued"""
 
@@ -206,3 +239,125 @@ class DbToken(db.ModelBase):
 
     subject = sa.Column(sa.String(), index=True, nullable=False)
     """Unique subject which identifies the user"""
+
+    id_token_record: 'DbTokenIdToken' = relationship(
+        'DbTokenIdToken',
+        uselist=False,
+        lazy='select',
+        cascade='all, delete-orphan',
+        passive_deletes=True,
+    )
+    """The id_token (only loaded when accessed)"""
+
+    id_token = association_proxy(
+        'id_token_record',
+        'id_token',
+        creator=lambda id_token: DbTokenIdToken(id_token=id_token),
+    )
+    """Token used by identity provider"""
+
+
+class DbTokenIdToken(db.ModelBase):
+    """
+    Contains the id_token of a user session (one-to-one with DbToken).
+
+    Deleted along with its token.
+    """
+
+    __tablename__ = 'token_id_token'
+    __table_args__ = (
+        sa.PrimaryKeyConstraint('opaque_token'),
+    )
+
+    opaque_token = sa.Column(
+        UUID(as_uuid=False),
+        sa.ForeignKey('token.opaque_token', ondelete='CASCADE'),
+        nullable=False,
+    )
+    """Opaque token (id) of the token"""
+
+    id_token = sa.Column(sa.String(), nullable=False)
+    """Token used by identity provider"""
+
+
+class DbRelationsOutbox(db.ModelBase):
+    """
+    Outbox of requests to eo-datasync to create relations.
+
+    A row is written in the same transaction as the login, and the
+    request is sent afterwards by the outbox worker (see outbox.py),
+    which retries failed requests with backoff.
+    """
+
+    __tablename__ = 'relations_outbox'
+    __table_args__ = (
+        sa.PrimaryKeyConstraint('id'),
+        sa.CheckConstraint('ssn IS NOT NULL OR tin IS NOT NULL'),
+    )
+
+    id = sa.Column(sa.BigInteger(), autoincrement=True)
+    """Unique id for the Database record."""
+
+    created = sa.Column(sa.DateTime(timezone=True),
+                        nullable=False, server_default=sa.func.now())
+    """Time when the request was queued."""
+
+    subject = sa.Column(sa.String(), nullable=False)
+    """The user subject (for logging)."""
+
+    internal_token = sa.Column(sa.String(), nullable=False)
+    """Internal token to authorize the request with."""
+
+    ssn = sa.Column(sa.String())
+    """Social security number of the user (if private)."""
+
+    tin = sa.Column(sa.String())
+    """Tax identification number of the company (if company)."""
+
+    attempts = sa.Column(sa.Integer(), nullable=False, server_default='0')
+    """Number of times sending the request has been attempted."""
+
+    next_attempt = sa.Column(
+        sa.DateTime(timezone=True),
+        nullable=False,
+        server_default=sa.func.now(),
+        index=True,
+    )
+    """Time when the request should be sent (again)."""
+
+
+class DbLogoutOutbox(db.ModelBase):
+    """
+    Outbox of logouts at the Identity Provider.
+
+    A row is written in the same transaction as deleting the token (or
+    invalidating the login), and the logout is sent afterwards by the
+    logout worker (see outbox.py), which retries failed logouts with
+    backoff.
+    """
+
+    __tablename__ = 'logout_outbox'
+    __table_args__ = (
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    id = sa.Column(sa.BigInteger(), autoincrement=True)
+    """Unique id for the Database record."""
+
+    created = sa.Column(sa.DateTime(timezone=True),
+                        nullable=False, server_default=sa.func.now())
+    """Time when the logout was queued."""
+
+    id_token = sa.Column(sa.String(), nullable=False)
+    """Token used by identity provider."""
+
+    attempts = sa.Column(sa.Integer(), nullable=False, server_default='0')
+    """Number of times logging out has been attempted."""
+
+    next_attempt = sa.Column(
+        sa.DateTime(timezone=True),
+        nullable=False,
+        server_default=sa.func.now(),
+        index=True,
+    )
+    """Time when the logout should be sent (again)."""
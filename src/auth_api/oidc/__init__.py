@@ -1,3 +1,6 @@
+import threading
+from typing import Optional
+
 from auth_api.config import (
     OIDC_CLIENT_ID,
     OIDC_CLIENT_SECRET,
@@ -5,8 +8,16 @@ from auth_api.config import (
     OIDC_TOKEN_URL,
     OIDC_JWKS_URL,
     OIDC_API_LOGOUT_URL,
+    OIDC_JWKS_REFRESH_INTERVAL,
+    OIDC_CIRCUIT_FAILURE_RATE,
+    OIDC_CIRCUIT_WINDOW_SIZE,
+    OIDC_CIRCUIT_MIN_CALLS,
+    OIDC_CIRCUIT_SLOW_CALL_DURATION,
+    OIDC_CIRCUIT_OPEN_DURATION,
 )
 
+from .circuit import CircuitBreakerBackend
+from .jwks import JwksRefresher
 from .models import OpenIDConnectToken
 from .errors import OIDC_ERROR_CODES
 from .session import OAuth2Session
@@ -23,10 +34,47 @@ session = OAuth2Session(
 )
 
 
-# The default OpenID Connect backend clients should import and use.
-# Makes it easy to switch implementation without effects anywhere else.
-oidc_backend = SignaturgruppenBackend(
+signaturgruppen_backend = SignaturgruppenBackend(
     session=session,
     authorization_endpoint=OIDC_LOGIN_URL,
     token_endpoint=OIDC_TOKEN_URL,
 )
+
+
+# The default OpenID Connect backend clients should import and use.
+# Makes it easy to switch implementation without effects anywhere else.
+oidc_backend = CircuitBreakerBackend(
+    backend=signaturgruppen_backend,
+    failure_rate=OIDC_CIRCUIT_FAILURE_RATE,
+    window_size=OIDC_CIRCUIT_WINDOW_SIZE,
+    min_calls=OIDC_CIRCUIT_MIN_CALLS,
+    slow_call_duration=OIDC_CIRCUIT_SLOW_CALL_DURATION,
+    open_duration=OIDC_CIRCUIT_OPEN_DURATION,
+)
+
+
+_jwks_refresher: Optional[JwksRefresher] = None
+_jwks_refresher_lock = threading.Lock()
+
+
+def start_jwks_refresher() -> JwksRefresher:
+    """
+    Start prefetching and refreshing the JWKS for this worker (only once).
+
+    The keys are parsed by the backend after each refresh, so
+    logging in does neither fetch nor parse them.
+
+    :returns: The running refresher
+    """
+    global _jwks_refresher
+
+    with _jwks_refresher_lock:
+        if _jwks_refresher is None or not _jwks_refresher.is_alive():
+            _jwks_refresher = JwksRefresher(
+                jwks=session.jwks,
+                warm=signaturgruppen_backend.get_key_set,
+                min_interval=OIDC_JWKS_REFRESH_INTERVAL,
+            )
+            _jwks_refresher.start()
+
+        return _jwks_refresher
@@ -0,0 +1,71 @@
+from typing import Dict
+
+from authlib.integrations.base_client import OAuthError
+
+from auth_api.circuit_breaker import CircuitBreaker
+from auth_api.deadline import DeadlineExceeded, raise_deadline_exceeded
+
+from .backend import OpenIDConnectBackend
+from .models import OpenIDConnectToken
+
+
+class CircuitBreakerBackend(OpenIDConnectBackend):
+    """
+    Stops calling the Identity Provider while it is failing.
+
+    Wraps another backend, with a circuit breaker per operation. While the
+    circuit of an operation is open, it raises CircuitOpenError without
+    waiting for the Identity Provider. Logouts are sent by the logout
+    worker (see outbox.py), which retries them once the circuit closes.
+
+    Errors reported by the Identity Provider (ie. an invalid code) mean it
+    is working, and do not count as failures. Neither do calls not made,
+    or timed out, because the request's deadline had passed.
+
+    :param backend: The backend to wrap
+    :param breaker_options: Options for each CircuitBreaker
+    """
+
+    def __init__(
+            self,
+            backend: OpenIDConnectBackend,
+            **breaker_options,
+    ):
+        super(CircuitBreakerBackend, self).__init__(session=backend.session)
+        self.backend = backend
+        self.breakers: Dict[str, CircuitBreaker] = {
+            'fetch_token': CircuitBreaker(
+                name='oidc.fetch_token',
+                ignore=(OAuthError, DeadlineExceeded),
+                **breaker_options,
+            ),
+            'logout': CircuitBreaker(
+                name='oidc.logout',
+                ignore=(DeadlineExceeded,),
+                **breaker_options,
+            ),
+        }
+
+    def create_authorization_url(self, *args, **kwargs) -> str:
+        """Create OpenID Connect Authorization url (no calls are made)."""
+
+        return self.backend.create_authorization_url(*args, **kwargs)
+
+    def fetch_token(self, *args, **kwargs) -> OpenIDConnectToken:
+        """
+        Fetch token from the Identity Provider.
+
+        :raises CircuitOpenError: If the Identity Provider is failing
+        """
+        return self.breakers['fetch_token'].call(
+            raise_deadline_exceeded(self.backend.fetch_token),
+            *args, **kwargs)
+
+    def logout(self, id_token: str):
+        """
+        Call OpenID Connect Identity provider logout endpoint.
+
+        :raises CircuitOpenError: If the Identity Provider is failing
+        """
+        self.breakers['logout'].call(
+            raise_deadline_exceeded(self.backend.logout), id_token)
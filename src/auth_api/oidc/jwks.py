@@ -0,0 +1,373 @@
+import re
+import json
+import time
+import base64
+import logging
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, Mapping, Optional, Union
+
+import requests
+from authlib.jose import JsonWebKey, Key
+from authlib.jose.rfc7517 import AsymmetricKey
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_max_age(cache_control: Optional[str]) -> Optional[int]:
+    """
+    Return the number of seconds a response may be cached.
+
+    :param cache_control: Value of the Cache-Control response header
+    :returns: Seconds to cache, or None if the header does not say
+    """
+    if not cache_control:
+        return None
+
+    directives = cache_control.lower()
+
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+
+    match = re.search(r'max-age\s*=\s*"?(\d+)"?', directives)
+
+    if match:
+        return int(match.group(1))
+
+    return None
+
+
+def get_kids(jwks: str) -> FrozenSet[str]:
+    """
+    Return the key IDs in a JWKS (or a single JWK).
+
+    :param jwks: JWKS as JSON
+    """
+    try:
+        parsed = json.loads(jwks)
+    except ValueError:
+        return frozenset()
+
+    if not isinstance(parsed, dict):
+        return frozenset()
+
+    keys = parsed.get('keys', [parsed])
+
+    return frozenset(
+        key['kid'] for key in keys
+        if isinstance(key, dict) and 'kid' in key
+    )
+
+
+def get_kid(token: str) -> Optional[str]:
+    """
+    Return the key ID (kid) from the header of a JWT, without verifying it.
+
+    :param token: The JWT
+    :returns: The key ID, or None if the header does not have one
+    """
+    header = token.split('.', 1)[0]
+
+    try:
+        parsed = json.loads(
+            base64.urlsafe_b64decode(header + '=' * (-len(header) % 4)))
+    except ValueError:
+        return None
+
+    if not isinstance(parsed, dict) or not isinstance(parsed.get('kid'), str):
+        return None
+
+    return parsed['kid']
+
+
+class JwkSet(object):
+    """
+    A parsed, immutable JWKS, indexed by key ID (kid).
+
+    Parsing the JWKS and importing its keys is done once, when constructed,
+    instead of for every token verified. Instances can be passed as key to
+    authlib's jwt.decode(), which looks up the key by the token's kid.
+
+    A single JWK (without a "keys" list) is treated as a set of one key.
+    A set of one key without a kid is used regardless of the token's kid.
+
+    :param jwks: JWKS (or a single JWK) as JSON, or parsed
+    """
+
+    def __init__(self, jwks: Union[str, Dict[str, Any]]):
+        self.jwks = jwks
+
+        parsed = json.loads(jwks) if isinstance(jwks, str) else jwks
+        keys = tuple(
+            JsonWebKey.import_key(key)
+            for key in parsed.get('keys', [parsed])
+        )
+
+        for key in keys:
+            if isinstance(key, AsymmetricKey):
+                # Load the key now rather than when first verifying with it
+                key.get_public_key()
+
+        self.keys = keys
+        self._by_kid: Mapping[str, Key] = MappingProxyType(
+            {key.kid: key for key in keys if key.kid})
+
+    def __contains__(self, kid: str) -> bool:
+        """Return whether the set has a key with the kid."""
+        return kid in self._by_kid
+
+    def __call__(self, header: Dict[str, Any], payload: Any) -> Key:
+        """Return the key to verify a token with (authlib's load_key)."""
+        return self.find(header.get('kid'))
+
+    def find(self, kid: Optional[str]) -> Key:
+        """
+        Return the key with the kid.
+
+        :param kid: ID of the key, if known
+        :raises ValueError: If the set has no such key
+        """
+        key = self._by_kid.get(kid) if kid else None
+
+        if key is None and len(self.keys) == 1 and not self.keys[0].kid:
+            key = self.keys[0]
+
+        if key is None:
+            raise ValueError('Invalid JSON Web Key Set')
+
+        return key
+
+
+class JwksCache(object):
+    """
+    Caches the Identity Provider's JSON Web Key Set (JWKS).
+
+    The JWKS is cached for as long as the Cache-Control response header
+    allows (or default_ttl if it does not say).
+
+    If asked for a key ID (kid) which is not in the cached JWKS, the IdP
+    may have rotated its keys, so the JWKS is refreshed. Such refreshes
+    are rate-limited to one per refresh_interval, so tokens with bogus
+    key IDs can not be used to flood the IdP with requests.
+
+    If the JWKS has expired, but refreshing it fails (ie. the IdP is
+    unreachable), the stale JWKS is served for up to grace_period seconds
+    after it expired.
+
+    :param fetch: Function which fetches the JWKS (returns the response)
+    :param default_ttl: Seconds to cache the JWKS if the IdP does not say
+    :param refresh_interval: Min seconds between refreshes caused by
+        unknown key IDs
+    :param grace_period: Max seconds to serve an expired JWKS if it can
+        not be refreshed
+    """
+
+    def __init__(
+            self,
+            fetch: Callable[[], requests.Response],
+            default_ttl: float,
+            refresh_interval: float,
+            grace_period: float,
+    ):
+        self.fetch = fetch
+        self.default_ttl = default_ttl
+        self.refresh_interval = refresh_interval
+        self.grace_period = grace_period
+
+        self._jwks: Optional[str] = None
+        self._kids: FrozenSet[str] = frozenset()
+        self._fetched_at: float = 0
+        self._expires_at: float = 0
+        self._retry_at: float = 0
+        self._lock = threading.Lock()
+
+    @property
+    def expires_at(self) -> float:
+        """Time (time.monotonic) when the cached JWKS expires."""
+        return self._expires_at
+
+    @property
+    def loaded(self) -> bool:
+        """Whether a JWKS has been fetched (it may have expired since)."""
+        return self._jwks is not None
+
+    def get(self, kid: Optional[str] = None) -> str:
+        """
+        Return the JWKS, fetching it if necessary.
+
+        :param kid: ID of the key needed, if known
+        :returns: JWKS as JSON
+        """
+        jwks = self._get_cached(kid)
+
+        if jwks is not None:
+            return jwks
+
+        with self._lock:
+            # Another thread may have refreshed it while waiting for the lock
+            jwks = self._get_cached(kid)
+
+            if jwks is not None:
+                return jwks
+
+            return self._refresh(kid)
+
+    def refresh(self, allow_stale: bool = True) -> str:
+        """
+        Fetch the JWKS, even if the cached one has not expired.
+
+        :param allow_stale: Whether to return the stale JWKS (within the
+            grace period) if fetching fails, rather than raising
+        :returns: JWKS as JSON
+        """
+        with self._lock:
+            return self._refresh(kid=None, allow_stale=allow_stale)
+
+    def clear(self):
+        """Forget the cached JWKS."""
+
+        with self._lock:
+            self._jwks = None
+            self._kids = frozenset()
+            self._fetched_at = 0
+            self._expires_at = 0
+            self._retry_at = 0
+
+    def _get_cached(self, kid: Optional[str]) -> Optional[str]:
+        """Return the cached JWKS, if it is fresh and has the kid."""
+
+        jwks = self._jwks
+        now = time.monotonic()
+
+        if jwks is None:
+            return None
+
+        # Refreshing failed recently, so wait a while before retrying
+        backing_off = now < self._retry_at
+
+        if now >= self._expires_at:
+            if backing_off and now < self._expires_at + self.grace_period:
+                return jwks
+
+            return None
+
+        if kid is not None and kid not in self._kids:
+            if backing_off or now - self._fetched_at < self.refresh_interval:
+                # Refreshed recently, so the key is most likely bogus
+                return jwks
+
+            return None
+
+        return jwks
+
+    def _refresh(self, kid: Optional[str], allow_stale: bool = True) -> str:
+        """Fetch the JWKS, or fall back to the stale one (lock held)."""
+
+        now = time.monotonic()
+
+        try:
+            response = self.fetch()
+            response.raise_for_status()
+        except Exception:
+            stale = self._jwks is not None \
+                and now < self._expires_at + self.grace_period
+
+            if stale:
+                # Serve the stale JWKS for a while before refreshing again
+                self._retry_at = now + self.refresh_interval
+
+            if not stale or not allow_stale:
+                raise
+
+            logger.warning('Failed to refresh JWKS, serving cached JWKS',
+                           exc_info=True)
+
+            return self._jwks
+
+        max_age = get_max_age(response.headers.get('Cache-Control'))
+
+        if max_age is None:
+            max_age = self.default_ttl
+
+        self._jwks = response.content.decode()
+        self._kids = get_kids(self._jwks)
+        self._fetched_at = now
+        self._expires_at = now + max_age
+
+        return self._jwks
+
+
+class JwksRefresher(threading.Thread):
+    """
+    Background thread which keeps a JwksCache warm.
+
+    Fetches the JWKS when started (ie. when a worker starts), and refreshes
+    it shortly before it expires, so logging in does not have to wait for
+    the Identity Provider. If refreshing fails, it is retried after
+    retry_interval (the cache serves the stale JWKS meanwhile).
+
+    :param jwks: The cache to keep warm
+    :param warm: Called after each refresh, ie. to parse the keys
+    :param lead_time: Seconds before expiry to refresh the JWKS
+    :param min_interval: Min seconds between refreshes
+    :param retry_interval: Seconds to wait before retrying a failed refresh
+    """
+
+    def __init__(
+            self,
+            jwks: JwksCache,
+            warm: Optional[Callable[[], Any]] = None,
+            lead_time: float = 30,
+            min_interval: float = 60,
+            retry_interval: float = 5,
+    ):
+        super(JwksRefresher, self).__init__(
+            name='jwks-refresher',
+            daemon=True,
+        )
+        self.jwks = jwks
+        self.warm = warm
+        self.lead_time = lead_time
+        self.min_interval = min_interval
+        self.retry_interval = retry_interval
+        self.loaded = threading.Event()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Stop refreshing (returns when the thread has stopped)."""
+
+        self._stopped.set()
+
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        """Refresh the JWKS until stopped."""
+
+        while not self._stopped.is_set():
+            self._stopped.wait(self.refresh_once())
+
+    def refresh_once(self) -> float:
+        """
+        Refresh the JWKS.
+
+        :returns: Seconds to wait before refreshing it again
+        """
+        try:
+            # Serving the stale JWKS is left to the cache, the refresh has
+            # failed nonetheless and should be retried soon
+            self.jwks.refresh(allow_stale=False)
+
+            if self.warm is not None:
+                self.warm()
+        except Exception:
+            logger.exception('Failed to prefetch JWKS')
+            return self.retry_interval
+
+        self.loaded.set()
+
+        return max(
+            self.jwks.expires_at - time.monotonic() - self.lead_time,
+            self.min_interval,
+        )
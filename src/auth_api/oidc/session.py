@@ -1,7 +1,21 @@
+from typing import Optional, Tuple
+
 import requests
 from authlib.integrations.requests_client import \
     OAuth2Session as _OAuth2Session
 
+from auth_api.config import (
+    OIDC_JWKS_CACHE_TTL,
+    OIDC_JWKS_REFRESH_INTERVAL,
+    OIDC_JWKS_GRACE_PERIOD,
+    OIDC_CONNECT_TIMEOUT,
+    OIDC_READ_TIMEOUT,
+)
+from auth_api.deadline import get_timeout
+from auth_api.http_client import http_client, mount_http_adapter
+
+from .jwks import JwksCache
+
 
 class OAuth2Session(_OAuth2Session):
     """Adds a few useful methods to the default OAuth2Session from authlib."""
@@ -15,19 +29,46 @@ class OAuth2Session(_OAuth2Session):
         """Construct a OAuth 2 client session."""
         self.jwk_endpoint = jwk_endpoint
         self.api_logout_url = api_logout_url
+        self.jwks = JwksCache(
+            fetch=self.fetch_jwk,
+            default_ttl=OIDC_JWKS_CACHE_TTL,
+            refresh_interval=OIDC_JWKS_REFRESH_INTERVAL,
+            grace_period=OIDC_JWKS_GRACE_PERIOD,
+        )
         super(OAuth2Session, self).__init__(**kwargs)
 
-    def get_jwk(self) -> str:
-        """TODO."""
+        # Fetch tokens using the shared connection pools
+        mount_http_adapter(self)
 
-        # TODO Cache result in a period
-        jwks_response = requests.get(
+    def get_timeout(self) -> Tuple[float, float]:
+        """
+        Return the (connect, read) timeout for a call to the IdP.
+
+        Shortened to the time left of the current deadline, if any.
+
+        :raises DeadlineExceeded: If the deadline has passed
+        """
+        return get_timeout(OIDC_CONNECT_TIMEOUT, OIDC_READ_TIMEOUT)
+
+    def get_jwk(self, kid: Optional[str] = None) -> str:
+        """
+        Return the Identity Provider's JWKS (cached).
+
+        :param kid: ID of the key needed to verify a token, if known.
+            The JWKS is refreshed if it does not have it.
+        :returns: JWKS as JSON
+        """
+        return self.jwks.get(kid)
+
+    def fetch_jwk(self) -> requests.Response:
+        """Fetch the Identity Provider's JWKS (not cached)."""
+
+        return http_client.get(
             url=self.jwk_endpoint,
             verify=True,
+            timeout=self.get_timeout(),
         )
 
-        return jwks_response.content.decode()
-
     def logout(self, id_token: str):
         """
         Logout the user from used Identity Provider.
@@ -38,9 +79,10 @@ class OAuth2Session(_OAuth2Session):
         redirected to the authorization URL.
         """
 
-        response = requests.post(
+        response = http_client.post(
             url=self.api_logout_url,
             json={'id_token': id_token},
+            timeout=self.get_timeout(),
         )
 
         if response.status_code != 200:
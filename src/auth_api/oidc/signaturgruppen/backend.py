@@ -2,6 +2,7 @@ import json
 from typing import Optional
 
 from ..backend import OpenIDConnectBackend
+from ..jwks import JwkSet, get_kid
 
 from .models import SignaturgruppenToken
 
@@ -20,6 +21,7 @@ class SignaturgruppenBackend(OpenIDConnectBackend):
 
         self.authorization_endpoint = authorization_endpoint
         self.token_endpoint = token_endpoint
+        self._key_set: Optional[JwkSet] = None
         super(SignaturgruppenBackend, self).__init__(*args, **kwargs)
 
     def create_authorization_url(
@@ -81,9 +83,28 @@ class SignaturgruppenBackend(OpenIDConnectBackend):
             state=state,
             redirect_uri=redirect_uri,
             verify=True,
+            timeout=self.session.get_timeout(),
         )
 
         return SignaturgruppenToken.from_raw_token(
             raw_token=raw_token,
-            jwk=self.session.get_jwk(),
+            jwk=self.get_key_set(kid=get_kid(raw_token['id_token'])),
         )
+
+    def get_key_set(self, kid: Optional[str] = None) -> JwkSet:
+        """
+        Return the Identity Provider's keys, parsed.
+
+        The keys are only parsed again when the JWKS changes.
+
+        :param kid: ID of the key needed to verify a token, if known
+        """
+        jwks = self.session.get_jwk(kid=kid)
+        key_set = self._key_set
+
+        if key_set is None or key_set.jwks != jwks:
+            # Replaced rather than modified, so other threads may keep
+            # using the previous one
+            key_set = self._key_set = JwkSet(jwks)
+
+        return key_set
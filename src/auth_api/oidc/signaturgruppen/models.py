@@ -1,7 +1,8 @@
 from authlib.jose import jwt
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union
 
+from ..jwks import JwkSet
 from ..models import OpenIDConnectToken
 
 
@@ -12,9 +13,15 @@ class SignaturgruppenToken(OpenIDConnectToken, Dict[str, Any]):
     def from_raw_token(
             cls,
             raw_token: Dict[str, Any],
-            jwk: str,
+            jwk: Union[str, JwkSet],
     ) -> 'SignaturgruppenToken':
-        """Return token from given Dict."""
+        """
+        Return token from given Dict.
+
+        :param raw_token: Token response from the Identity Provider
+        :param jwk: Keys to verify the tokens with, preferably parsed
+            once (JwkSet) rather than for each token (JSON)
+        """
 
         token = cls()
         token.update(raw_token)
@@ -0,0 +1,138 @@
+# Standard Library
+import base64
+import hashlib
+import hmac
+import re
+from datetime import datetime, timezone
+from typing import Optional
+
+
+def derive_secret(secret: str, label: str) -> str:
+    """
+    Derive a secret for a single purpose from another secret.
+
+    Uses HKDF-SHA256 (RFC 5869) without salt, with the label as info, so
+    secrets derived with different labels are independent of each other
+    (and of the secret they are derived from).
+
+    :param secret: The secret to derive from
+    :param label: Purpose of the derived secret
+    :returns: The derived secret (32 bytes, hex-encoded)
+    """
+    prk = hmac.new(bytes(32), secret.encode(), hashlib.sha256).digest()
+
+    return hmac.new(prk, label.encode() + b'\x01', hashlib.sha256).hexdigest()
+
+
+class OpaqueTokenSigner(object):
+    """
+    Signs and verifies opaque tokens.
+
+    A signed opaque token has the format "<id>.<expires>.<tag>" where id is
+    a random uuid4 (the primary key of the token in the database), expires
+    is the time of expiry as a hexadecimal UNIX timestamp, and tag is a
+    truncated HMAC-SHA256 of the former two. It contains no information
+    about the user.
+
+    This makes it possible to reject tampered or expired tokens without
+    looking them up in the database.
+
+    Legacy opaque tokens (a bare uuid4) can still be accepted during a
+    transition period, in which case they are their own id.
+
+    :param secret: Secret used to sign tokens
+    :param accept_legacy_until: Time until which legacy (unsigned) tokens
+        are accepted, or None to always accept them
+    """
+
+    # Regex pattern for matching ids (str(uuid4()))
+    ID_PATTERN = \
+        r'[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}'
+
+    # Regex pattern for matching legacy (unsigned) opaque tokens
+    LEGACY_PATTERN = re.compile(rf'^{ID_PATTERN}$')
+
+    # Regex pattern for matching signed opaque tokens
+    SIGNED_PATTERN = re.compile(
+        rf'^(?P<id>{ID_PATTERN})'
+        r'\.(?P<expires>[0-9a-f]{1,16})'
+        r'\.(?P<tag>[A-Za-z0-9_-]{22})$'
+    )
+
+    # Length of the tag (in bytes, before encoding)
+    TAG_SIZE = 16
+
+    def __init__(
+            self,
+            secret: str,
+            accept_legacy_until: Optional[datetime] = None,
+    ):
+        self.secret = secret.encode()
+        self.accept_legacy_until = accept_legacy_until
+
+    @property
+    def accept_legacy(self) -> bool:
+        """Whether legacy (unsigned) tokens are currently accepted."""
+
+        return self.accept_legacy_until is None \
+            or datetime.now(tz=timezone.utc) < self.accept_legacy_until
+
+    def sign(self, token_id: str, expires: datetime) -> str:
+        """
+        Create a signed opaque token.
+
+        :param token_id: Unique id of the token, str(uuid4())
+        :param expires: Time when token expires
+        :returns: Signed opaque token
+        """
+        payload = f'{token_id}.{int(expires.timestamp()):x}'
+
+        return f'{payload}.{self._get_tag(payload)}'
+
+    def verify(
+            self,
+            opaque_token: Optional[str],
+            check_expiry: bool = True,
+    ) -> Optional[str]:
+        """
+        Verify an opaque token, and return its id if it is valid.
+
+        Does no I/O; the token may still have been revoked, so the id must
+        be looked up before trusting the token.
+
+        :param opaque_token: Opaque token provided by the client
+        :param check_expiry: Whether to reject signed tokens that expired
+        :returns: The id of the token, or None if it is invalid
+        """
+        if not opaque_token:
+            return None
+
+        if self.accept_legacy and self.LEGACY_PATTERN.match(opaque_token):
+            return opaque_token
+
+        match = self.SIGNED_PATTERN.match(opaque_token)
+
+        if match is None:
+            return None
+
+        payload = f'{match["id"]}.{match["expires"]}'
+
+        if not hmac.compare_digest(match['tag'], self._get_tag(payload)):
+            return None
+
+        if check_expiry:
+            expires = int(match['expires'], 16)
+            now = datetime.now(tz=timezone.utc).timestamp()
+
+            if expires <= now:
+                return None
+
+        return match['id']
+
+    def _get_tag(self, payload: str) -> str:
+        """Return the encoded, truncated HMAC of a payload."""
+
+        digest = hmac.new(self.secret, payload.encode(), hashlib.sha256) \
+            .digest()[:self.TAG_SIZE]
+
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
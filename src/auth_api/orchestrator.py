@@ -1,6 +1,6 @@
 # Standard Library
 from dataclasses import dataclass, field
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 # First party
@@ -13,12 +13,10 @@ from origin.auth import TOKEN_COOKIE_NAME
 from origin.encrypt import aes256_decrypt
 from origin.tokens import TokenEncoder
 from origin.tools import url_append
-import requests
 
 # Local
 from auth_api.config import (
-    DATASYNC_BASE_URL,
-    DATASYNC_CREATE_RELATIONS_PATH,
+    DATASYNC_RELATIONS_MAX_AGE,
     INTERNAL_TOKEN_SECRET,
     STATE_ENCRYPTION_SECRET,
     TOKEN_COOKIE_DOMAIN,
@@ -34,10 +32,6 @@ from auth_api.models import DbCompany, DbUser
 from auth_api.user import create_or_get_user
 from auth_api.state import AuthState
 
-from auth_api.oidc import (
-    oidc_backend,
-)
-
 from auth_api.templates.logging_templates import LoggingTemplates
 
 
@@ -69,7 +63,17 @@ state_encoder = TokenEncoder(
 
 
 class LoginOrchestrator:
-    """Orchestrator to handle the login flow."""
+    """
+    Orchestrator to handle the login flow.
+
+    :param state: AuthState
+    :param session: Database session
+    :param user: The user of the external user, if known
+    :param company: The company of the tin in the state, if known
+    :param looked_up: Whether user and company have been looked up (and
+        are None because they do not exist), so they are not looked up
+        again before being created
+    """
 
     def __init__(
         self,
@@ -77,11 +81,13 @@ class LoginOrchestrator:
         session: db.Session,
         user: Optional[DbUser] = None,
         company: Optional[DbCompany] = None,
+        looked_up: bool = False,
     ) -> None:
         self.state = state
         self.session = session
         self.user = user
         self.company = company
+        self.looked_up = looked_up
 
     def redirect_next_step(
         self
@@ -162,14 +168,16 @@ class LoginOrchestrator:
         self.user = create_or_get_user(
             session=self.session,
             state=self.state,
+            look_up=not self.looked_up,
         )
 
         # If user is signed in as a company assign user to company
         if self.state.tin:
-            self.company = db_controller.get_or_create_company(
-                session=self.session,
-                tin=self.state.tin,
-            )
+            if self.company is None:
+                self.company = db_controller.get_or_create_company(
+                    session=self.session,
+                    tin=self.state.tin,
+                )
 
             db_controller.attach_user_to_company(
                 session=self.session,
@@ -202,7 +210,7 @@ class LoginOrchestrator:
             cookie=cookie
         )
 
-    def _create_relations(self, internal_token: str) -> bool:
+    def _create_relations(self, internal_token: str):
         """
         Create relationship between user and meteringpoints.
 
@@ -210,8 +218,14 @@ class LoginOrchestrator:
         a relation between the user and it's meteringpoints. This will be
         replaced once the event store is up and running
 
-        :return: Success
-        :rtype: bool
+        The request is queued in the relations outbox, in the same
+        transaction as the login, and sent to eo-datasync afterwards
+        by the outbox worker. Logging in therefore does not wait for
+        (or fail because of) eo-datasync.
+
+        Relations are only created when logging in for the first time,
+        or when they were created more than DATASYNC_RELATIONS_MAX_AGE
+        seconds ago.
         """
 
         if not self.user and not self.company:
@@ -224,31 +238,41 @@ class LoginOrchestrator:
 
         if self.company is not None and self.company.tin is not None:
             tin = self.company.tin
+            relations_created = self.company.relations_created
         elif self.user is not None and self.user.ssn is not None:
             ssn = self.user.ssn
+            relations_created = self.user.relations_created
         else:
             raise Exception(
                 "Failed to create relationship. Neither tin or ssn were set"
             )
 
-        uri = f'{DATASYNC_BASE_URL}{DATASYNC_CREATE_RELATIONS_PATH}'
-
-        response = requests.post(
-            url=uri,
-            headers={
-                "Authorization": f'Bearer: {internal_token}'
-            },
-            json={
-                "ssn": ssn,
-                "tin": tin,
-            }
+        if self._relations_are_fresh(relations_created):
+            return
+
+        db_controller.queue_relations(
+            session=self.session,
+            subject=self.user.subject,
+            internal_token=internal_token,
+            ssn=ssn,
+            tin=tin,
         )
 
-        if response.status_code != 200:
-            print(f"Failed to create releation for user {self.user.subject}")
-            print(f"'{uri}' Responded with status code {response.status_code}")
-        else:
-            print(f"created releation for user {self.user.subject}")
+    def _relations_are_fresh(
+        self,
+        relations_created: Optional[datetime],
+    ) -> bool:
+        """
+        Return whether relations were created recently enough.
+
+        :param relations_created: Time relations were last created (if ever)
+        """
+        if relations_created is None or DATASYNC_RELATIONS_MAX_AGE <= 0:
+            return False
+
+        age = datetime.now(tz=timezone.utc) - relations_created
+
+        return age < timedelta(seconds=DATASYNC_RELATIONS_MAX_AGE)
 
     def _log_in_user_and_create_cookie(
         self
@@ -275,7 +299,7 @@ class LoginOrchestrator:
 
         issued = datetime.now(tz=timezone.utc)
 
-        opaque_token = db_controller.create_token(
+        token = db_controller.create_token(
             session=self.session,
             issued=issued,
             expires=issued + TOKEN_EXPIRY_DELTA,
@@ -288,12 +312,6 @@ class LoginOrchestrator:
             ),
         )
 
-        # Get token required to create relations
-        token = db_controller.get_token(
-            session=self.session,
-            opaque_token=opaque_token,
-        )
-
         logger.log(message=f"User {self.state.tin}", actor=self.state.tin,
                    subject=subject)
 
@@ -302,7 +320,7 @@ class LoginOrchestrator:
 
         return Cookie(
             name=TOKEN_COOKIE_NAME,
-            value=opaque_token,
+            value=token.opaque_token,
             domain=TOKEN_COOKIE_DOMAIN,
             path=TOKEN_COOKIE_PATH,
             http_only=TOKEN_COOKIE_HTTP_ONLY,
@@ -311,9 +329,20 @@ class LoginOrchestrator:
         )
 
     def invalidate_login(self) -> bool:
-        """Invalidate an initiated login that is persistented only in state."""
+        """
+        Invalidate an initiated login that is persistented only in state.
+
+        The logout at the Identity Provider is queued, and sent once the
+        session's transaction is committed.
+        """
         if self.state is not None and self.state.id_token is not None:
-            oidc_backend.logout(self.state.id_token)
+            db_controller.queue_logout(
+                session=self.session,
+                id_token=aes256_decrypt(
+                    self.state.id_token,
+                    STATE_ENCRYPTION_SECRET
+                ),
+            )
             return True
 
         return False
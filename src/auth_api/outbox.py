@@ -0,0 +1,604 @@
+# Standard Library
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Optional
+
+# Third party
+import sqlalchemy as sa
+
+# Local
+from .circuit_breaker import CircuitOpenError
+from .config import (
+    DATASYNC_BASE_URL,
+    DATASYNC_CREATE_RELATIONS_PATH,
+    DATASYNC_CONNECT_TIMEOUT,
+    DATASYNC_READ_TIMEOUT,
+    DATASYNC_OUTBOX_BATCH_SIZE,
+    DATASYNC_OUTBOX_POLL_INTERVAL,
+    DATASYNC_OUTBOX_LEASE,
+    DATASYNC_OUTBOX_MAX_ATTEMPTS,
+    DATASYNC_OUTBOX_BACKOFF,
+    DATASYNC_OUTBOX_MAX_BACKOFF,
+    OIDC_CONNECT_TIMEOUT,
+    OIDC_READ_TIMEOUT,
+    OIDC_LOGOUT_BATCH_SIZE,
+    OIDC_LOGOUT_POLL_INTERVAL,
+    OIDC_LOGOUT_LEASE,
+    OIDC_LOGOUT_MAX_ATTEMPTS,
+    OIDC_LOGOUT_BACKOFF,
+    OIDC_LOGOUT_MAX_BACKOFF,
+)
+from .db import db, outbox_db
+from .http_client import http_client
+from .models import DbCompany, DbLogoutOutbox, DbRelationsOutbox, DbUser
+from .oidc import oidc_backend
+
+logger = logging.getLogger(__name__)
+
+
+def get_backoff(
+        attempts: int,
+        backoff: float = DATASYNC_OUTBOX_BACKOFF,
+        max_backoff: float = DATASYNC_OUTBOX_MAX_BACKOFF,
+) -> float:
+    """
+    Return seconds to wait before retrying a failed request.
+
+    :param attempts: Number of attempts made so far (at least 1)
+    :param backoff: Seconds to wait after the first failed attempt
+    :param max_backoff: Max seconds to wait
+    """
+    return min(backoff * 2 ** (attempts - 1), max_backoff)
+
+
+def get_lease(lease: float, batch_size: int, timeout: float) -> float:
+    """
+    Return seconds to reserve a claimed batch for the worker.
+
+    The lease is at least long enough to send every request in the batch,
+    even if each of them times out, so the batch is not claimed (and sent)
+    again by another worker meanwhile.
+
+    :param lease: Configured lease
+    :param batch_size: Max number of requests in the batch
+    :param timeout: Max seconds a single request takes (connect and read)
+    """
+    return max(lease, batch_size * timeout)
+
+
+# -- Outbox tables -----------------------------------------------------------
+
+
+def claim_batch(
+        session: db.Session,
+        table: sa.Table,
+        batch_size: int,
+        lease: float,
+) -> List[Any]:
+    """
+    Claim queued requests which are due to be sent.
+
+    Claimed requests are postponed by lease seconds (and their attempt is
+    counted) in a short transaction, so no other worker sends them
+    meanwhile. Rows locked by other workers are skipped, not waited for.
+
+    The returned next_attempt of each row identifies this worker's lease,
+    and must be passed on when completing or retrying the request.
+
+    :param session: Database session
+    :param table: The outbox table (with id, attempts and next_attempt)
+    :param batch_size: Max number of requests to claim
+    :param lease: Seconds the requests are reserved for this worker
+    :returns: The claimed rows
+    """
+    now = sa.func.now()
+
+    due = sa.select(table.c.id) \
+        .where(table.c.next_attempt <= now) \
+        .order_by(table.c.next_attempt) \
+        .limit(batch_size) \
+        .with_for_update(skip_locked=True) \
+        .scalar_subquery()
+
+    claim = sa.update(table).where(table.c.id.in_(due)).values(
+        attempts=table.c.attempts + 1,
+        next_attempt=now + timedelta(seconds=lease),
+    ).returning(*table.c)
+
+    return session.execute(claim).fetchall()
+
+
+def delete_batch(
+        session: db.Session,
+        table: sa.Table,
+        rows: List[Any],
+) -> List[Any]:
+    """
+    Delete requests which have been sent.
+
+    Only requests still leased to this worker are deleted. If the lease
+    expired and another worker claimed a request meanwhile, it is left to
+    that worker.
+
+    :param session: Database session
+    :param table: The outbox table
+    :param rows: The sent rows, as claimed
+    :returns: The deleted rows
+    """
+    leases = [(row.id, row.next_attempt) for row in rows]
+
+    deleted = session.execute(
+        sa.delete(table)
+        .where(sa.tuple_(table.c.id, table.c.next_attempt).in_(leases))
+        .returning(*table.c)
+    ).fetchall()
+
+    if len(deleted) < len(rows):
+        logger.warning(
+            f'Lost the lease of {len(rows) - len(deleted)} sent request(s) '
+            f'in {table.name} before completing them')
+
+    return deleted
+
+
+def retry_later(
+        session: db.Session,
+        table: sa.Table,
+        id: int,
+        leased_until: datetime,
+        attempts: int,
+        max_attempts: int,
+        backoff: float,
+        max_backoff: float,
+):
+    """
+    Postpone a request which failed, or drop it after too many attempts.
+
+    Does nothing if the request is no longer leased to this worker.
+
+    :param session: Database session
+    :param table: The outbox table
+    :param id: ID of the failed request
+    :param leased_until: The next_attempt of the request, as claimed
+    :param attempts: Number of attempts made so far
+    :param max_attempts: Max number of attempts before dropping it
+    :param backoff: Seconds to wait after the first failed attempt
+    :param max_backoff: Max seconds to wait
+    """
+    leased = sa.and_(table.c.id == id, table.c.next_attempt == leased_until)
+
+    if attempts >= max_attempts:
+        logger.error(
+            f'Failed to send request {id} from {table.name} after '
+            f'{attempts} attempts, dropping it')
+        session.execute(sa.delete(table).where(leased))
+        return
+
+    retry_at = sa.func.now() + timedelta(
+        seconds=get_backoff(attempts, backoff, max_backoff))
+
+    session.execute(
+        sa.update(table)
+        .where(leased)
+        .values(attempts=attempts, next_attempt=retry_at)
+    )
+
+
+class OutboxWorker(threading.Thread):
+    """
+    Background thread which sends queued requests from an outbox.
+
+    Requests to other services are queued in an outbox table, in the same
+    transaction as the change which caused them. The worker repeatedly
+    calls process(batch_size), which claims due requests and sends them,
+    retrying failed requests with exponential backoff. Several workers
+    (ie. one per process) can run concurrently, as claimed rows are
+    locked (FOR UPDATE SKIP LOCKED) and leased to a single worker.
+
+    :param name: Name of the thread
+    :param process: Function which claims and sends a batch, and returns
+        the number of requests claimed
+    :param batch_size: Max number of requests to claim at a time
+    :param poll_interval: Seconds to wait when the outbox is empty
+    """
+
+    def __init__(
+            self,
+            name: str,
+            process: Callable[[int], int],
+            batch_size: int,
+            poll_interval: float,
+    ):
+        super(OutboxWorker, self).__init__(name=name, daemon=True)
+        self.process = process
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Stop sending requests (returns when the thread has stopped)."""
+
+        self._stopped.set()
+
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        """Send queued requests until stopped."""
+
+        while not self._stopped.is_set():
+            try:
+                claimed = self.process(self.batch_size)
+            except Exception:
+                logger.exception(f'Outbox worker {self.name} failed')
+                claimed = 0
+
+            # Continue immediately if there may be more due requests
+            if claimed < self.batch_size:
+                self._stopped.wait(self.poll_interval)
+
+
+# -- eo-datasync relations ---------------------------------------------------
+
+
+@outbox_db.atomic()
+def claim_relations(
+        session: db.Session,
+        batch_size: int = DATASYNC_OUTBOX_BATCH_SIZE,
+        lease: float = DATASYNC_OUTBOX_LEASE,
+) -> List[Any]:
+    """
+    Claim queued requests to create relations.
+
+    :param session: Database session
+    :param batch_size: Max number of requests to claim
+    :param lease: Seconds the requests are reserved for this worker
+        (extended to cover sending the whole batch, see get_lease())
+    :returns: The claimed rows
+    """
+    return claim_batch(
+        session=session,
+        table=DbRelationsOutbox.__table__,
+        batch_size=batch_size,
+        lease=get_lease(
+            lease=lease,
+            batch_size=batch_size,
+            timeout=DATASYNC_CONNECT_TIMEOUT + DATASYNC_READ_TIMEOUT,
+        ),
+    )
+
+
+@outbox_db.atomic()
+def complete_relations(session: db.Session, rows: List[Any]):
+    """
+    Delete requests which have been sent.
+
+    Also records when relations were created for the companies (tin) and
+    users (ssn), so they are not created again on every login.
+
+    :param session: Database session
+    :param rows: The sent rows, as claimed
+    """
+    now = sa.func.now()
+
+    deleted = delete_batch(
+        session=session,
+        table=DbRelationsOutbox.__table__,
+        rows=rows,
+    )
+
+    tins = [row.tin for row in deleted if row.tin is not None]
+    ssns = [row.ssn for row in deleted if row.ssn is not None]
+
+    if tins:
+        session.execute(
+            sa.update(DbCompany.__table__)
+            .where(DbCompany.__table__.c.tin.in_(tins))
+            .values(relations_created=now)
+        )
+
+    if ssns:
+        session.execute(
+            sa.update(DbUser.__table__)
+            .where(DbUser.__table__.c.ssn.in_(ssns))
+            .values(relations_created=now)
+        )
+
+
+@outbox_db.atomic()
+def retry_relations(
+        session: db.Session,
+        id: int,
+        leased_until: datetime,
+        attempts: int,
+):
+    """
+    Postpone a request which failed, or drop it after too many attempts.
+
+    :param session: Database session
+    :param id: ID of the failed request
+    :param leased_until: The next_attempt of the request, as claimed
+    :param attempts: Number of attempts made so far
+    """
+    retry_later(
+        session=session,
+        table=DbRelationsOutbox.__table__,
+        id=id,
+        leased_until=leased_until,
+        attempts=attempts,
+        max_attempts=DATASYNC_OUTBOX_MAX_ATTEMPTS,
+        backoff=DATASYNC_OUTBOX_BACKOFF,
+        max_backoff=DATASYNC_OUTBOX_MAX_BACKOFF,
+    )
+
+
+def send_relations(row: Any) -> bool:
+    """
+    Send a request to eo-datasync to create relations.
+
+    :param row: The claimed row
+    :returns: Whether eo-datasync created the relations
+    """
+    uri = f'{DATASYNC_BASE_URL}{DATASYNC_CREATE_RELATIONS_PATH}'
+
+    try:
+        response = http_client.post(
+            url=uri,
+            headers={
+                "Authorization": f'Bearer: {row.internal_token}'
+            },
+            json={
+                "ssn": row.ssn,
+                "tin": row.tin,
+            },
+            timeout=(DATASYNC_CONNECT_TIMEOUT, DATASYNC_READ_TIMEOUT),
+        )
+    except Exception:
+        logger.exception(f'Failed to create relations for {row.subject}')
+        return False
+
+    if response.status_code != 200:
+        logger.warning(
+            f'Failed to create relations for {row.subject}: '
+            f'{uri} responded with status code {response.status_code}')
+        return False
+
+    logger.info(f'Created relations for {row.subject}')
+    return True
+
+
+def process_relations(
+        batch_size: int = DATASYNC_OUTBOX_BATCH_SIZE,
+) -> int:
+    """
+    Claim a batch of queued requests, and send them to eo-datasync.
+
+    No database connection is held while sending the requests. Requests
+    are claimed, completed and retried using the worker's own connection
+    pool (outbox_db), separate from the one used for requests to the API.
+
+    :param batch_size: Max number of requests to claim
+    :returns: Number of requests claimed
+    """
+    rows = claim_relations(batch_size=batch_size)
+    sent = []
+
+    for row in rows:
+        if send_relations(row):
+            sent.append(row)
+        else:
+            retry_relations(
+                id=row.id,
+                leased_until=row.next_attempt,
+                attempts=row.attempts,
+            )
+
+    if sent:
+        complete_relations(rows=sent)
+
+    return len(rows)
+
+
+class RelationsOutboxWorker(OutboxWorker):
+    """
+    Background thread which sends queued requests to eo-datasync.
+
+    Logging in queues a request to create relations (see
+    DatabaseController.queue_relations()) in the same transaction as the
+    login itself.
+    """
+
+    def __init__(
+            self,
+            batch_size: int = DATASYNC_OUTBOX_BATCH_SIZE,
+            poll_interval: float = DATASYNC_OUTBOX_POLL_INTERVAL,
+    ):
+        super(RelationsOutboxWorker, self).__init__(
+            name='relations-outbox-worker',
+            process=process_relations,
+            batch_size=batch_size,
+            poll_interval=poll_interval,
+        )
+
+
+# -- Identity Provider logouts -----------------------------------------------
+
+
+@outbox_db.atomic()
+def claim_logouts(
+        session: db.Session,
+        batch_size: int = OIDC_LOGOUT_BATCH_SIZE,
+        lease: float = OIDC_LOGOUT_LEASE,
+) -> List[Any]:
+    """
+    Claim queued logouts.
+
+    :param session: Database session
+    :param batch_size: Max number of logouts to claim
+    :param lease: Seconds the logouts are reserved for this worker
+        (extended to cover sending the whole batch, see get_lease())
+    :returns: The claimed rows
+    """
+    return claim_batch(
+        session=session,
+        table=DbLogoutOutbox.__table__,
+        batch_size=batch_size,
+        lease=get_lease(
+            lease=lease,
+            batch_size=batch_size,
+            timeout=OIDC_CONNECT_TIMEOUT + OIDC_READ_TIMEOUT,
+        ),
+    )
+
+
+@outbox_db.atomic()
+def complete_logouts(session: db.Session, rows: List[Any]):
+    """
+    Delete logouts which have been sent.
+
+    :param session: Database session
+    :param rows: The sent rows, as claimed
+    """
+    delete_batch(
+        session=session,
+        table=DbLogoutOutbox.__table__,
+        rows=rows,
+    )
+
+
+@outbox_db.atomic()
+def retry_logout(
+        session: db.Session,
+        id: int,
+        leased_until: datetime,
+        attempts: int,
+):
+    """
+    Postpone a logout which failed, or drop it after too many attempts.
+
+    :param session: Database session
+    :param id: ID of the failed logout
+    :param leased_until: The next_attempt of the logout, as claimed
+    :param attempts: Number of attempts made so far
+    """
+    retry_later(
+        session=session,
+        table=DbLogoutOutbox.__table__,
+        id=id,
+        leased_until=leased_until,
+        attempts=attempts,
+        max_attempts=OIDC_LOGOUT_MAX_ATTEMPTS,
+        backoff=OIDC_LOGOUT_BACKOFF,
+        max_backoff=OIDC_LOGOUT_MAX_BACKOFF,
+    )
+
+
+def process_logouts(batch_size: int = OIDC_LOGOUT_BATCH_SIZE) -> int:
+    """
+    Claim a batch of queued logouts, and log out at the Identity Provider.
+
+    While the Identity Provider's circuit is open, logouts are postponed
+    without counting the attempt, so they are not dropped during an outage.
+    No database connection is held while calling the Identity Provider,
+    and logouts are claimed using the worker's own connection pool.
+
+    :param batch_size: Max number of logouts to claim
+    :returns: Number of logouts claimed
+    """
+    rows = claim_logouts(batch_size=batch_size)
+    sent = []
+
+    for row in rows:
+        try:
+            oidc_backend.logout(row.id_token)
+        except CircuitOpenError:
+            retry_logout(
+                id=row.id,
+                leased_until=row.next_attempt,
+                attempts=row.attempts - 1,
+            )
+        except Exception:
+            logger.exception(f'Failed to log out (logout {row.id})')
+            retry_logout(
+                id=row.id,
+                leased_until=row.next_attempt,
+                attempts=row.attempts,
+            )
+        else:
+            sent.append(row)
+
+    if sent:
+        complete_logouts(rows=sent)
+
+    return len(rows)
+
+
+class LogoutOutboxWorker(OutboxWorker):
+    """
+    Background thread which logs users out at the Identity Provider.
+
+    Logging out queues a logout (see DatabaseController.queue_logout())
+    in the same transaction as deleting the token, so logging out does
+    not wait for (or fail because of) the Identity Provider.
+    """
+
+    def __init__(
+            self,
+            batch_size: int = OIDC_LOGOUT_BATCH_SIZE,
+            poll_interval: float = OIDC_LOGOUT_POLL_INTERVAL,
+    ):
+        super(LogoutOutboxWorker, self).__init__(
+            name='logout-outbox-worker',
+            process=process_logouts,
+            batch_size=batch_size,
+            poll_interval=poll_interval,
+        )
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+_relations_worker: Optional[RelationsOutboxWorker] = None
+_logout_worker: Optional[LogoutOutboxWorker] = None
+_worker_lock = threading.Lock()
+
+
+def start_relations_outbox_worker() -> RelationsOutboxWorker:
+    """
+    Start the relations outbox worker for this worker (only once).
+
+    :returns: The running worker
+    """
+    global _relations_worker
+
+    with _worker_lock:
+        if _relations_worker is None or not _relations_worker.is_alive():
+            _relations_worker = RelationsOutboxWorker()
+            _relations_worker.start()
+
+        return _relations_worker
+
+
+def start_logout_outbox_worker() -> LogoutOutboxWorker:
+    """
+    Start the logout outbox worker for this worker (only once).
+
+    :returns: The running worker
+    """
+    global _logout_worker
+
+    with _worker_lock:
+        if _logout_worker is None or not _logout_worker.is_alive():
+            _logout_worker = LogoutOutboxWorker()
+            _logout_worker.start()
+
+        return _logout_worker
+
+
+if __name__ == '__main__':
+    # Run "python -m auth_api.outbox" to send queued requests in a separate
+    # process (set DATASYNC_OUTBOX_WORKER=false and OIDC_LOGOUT_WORKER=false
+    # for the API workers).
+    start_logout_outbox_worker()
+    RelationsOutboxWorker().run()
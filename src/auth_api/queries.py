@@ -1,10 +1,39 @@
-from sqlalchemy import orm, func, and_
+from uuid import UUID
+
+from sqlalchemy import (
+    orm,
+    func,
+    and_,
+    bindparam,
+    false,
+    join,
+    literal,
+    select,
+    true,
+)
 
 from origin.sql import SqlQuery
 
 from .models import DbCompany, DbUser, DbExternalUser, DbToken, DbLoginRecord
 
 
+def is_uuid(value: str) -> bool:
+    """
+    Check if a value can be compared to a UUID column.
+
+    PostgreSQL raises an error when comparing a UUID column to a value
+    which is not a valid UUID, so such values must never match instead.
+
+    :param value: Value to check
+    """
+    try:
+        UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+    return True
+
+
 class UserQuery(SqlQuery):
     """Query DbUser."""
 
@@ -36,6 +65,9 @@ class UserQuery(SqlQuery):
 
         :param subject: Internal Id
         """
+        if not is_uuid(subject):
+            return self.filter(false())
+
         return self.filter(DbUser.subject == subject)
 
 
@@ -53,6 +85,9 @@ class CompanyQuery(SqlQuery):
 
         :param id: Unique company id
         """
+        if not is_uuid(id):
+            return self.filter(false())
+
         return self.filter(DbCompany.id == id)
 
     def has_tin(self, tin: str) -> 'UserQuery':
@@ -97,6 +132,9 @@ class ExternalUserQuery(SqlQuery):
         :param user_id: unique user id
         :type user_id: str
         """
+        if not is_uuid(user_id):
+            return self.filter(false())
+
         # TODO: change "user.subject" to "user.id" when DbUser is updated
         return self.filter(DbExternalUser.user.has(DbUser.subject == user_id))
 
@@ -133,6 +171,8 @@ class TokenQuery(SqlQuery):
 
         param opaque_token: Primary Key Constraint
         """
+        if not is_uuid(opaque_token):
+            return self.filter(false())
 
         return self.filter(DbToken.opaque_token == opaque_token)
 
@@ -143,3 +183,52 @@ class TokenQuery(SqlQuery):
             DbToken.issued <= func.now(),
             DbToken.expires > func.now(),
         ))
+
+
+# -- Statements --------------------------------------------------------------
+
+
+_token_table = DbToken.__table__
+
+TOKEN_LOOKUP = select(
+    _token_table.c.internal_token,
+    _token_table.c.expires,
+    (_token_table.c.issued <= func.now()).label('valid'),
+).where(
+    _token_table.c.opaque_token == bindparam('token_id'),
+    _token_table.c.expires > func.now(),
+)
+"""
+Look up the internal token (and its expiry) of a token by its id.
+
+Used by ForwardAuth on cache misses. Tokens which have expired are not
+returned, while tokens issued after now() (ie. due to clock skew) are
+returned with valid=False, so they can be told apart from unknown tokens.
+
+It is a plain Core statement built once at import time, so SQLAlchemy
+compiles it once and caches it; it selects only the columns needed (not
+ie. the id_token), and bypasses the ORM (no entities, no identity map).
+Execute with {'token_id': ...}.
+"""
+
+
+_anchor = select(literal(1).label('anchor')).subquery()
+
+_user_of_external_subject = join(DbUser, DbExternalUser, and_(
+    DbExternalUser.subject == DbUser.subject,
+    DbExternalUser.identity_provider == bindparam('identity_provider'),
+    DbExternalUser.external_subject == bindparam('external_subject'),
+))
+
+USER_AND_COMPANY_LOOKUP = select(DbUser, DbCompany) \
+    .select_from(_anchor) \
+    .outerjoin(_user_of_external_subject, true()) \
+    .outerjoin(DbCompany, DbCompany.tin == bindparam('tin'))
+"""
+Look up the user of an external subject, and the company with a tin.
+
+Used when logging in. Both are looked up in a single round trip, and
+either may be None (a single row is always returned, as the joins are
+anchored to a constant). No company is found if tin is None. Execute with
+{'identity_provider': ..., 'external_subject': ..., 'tin': ...}.
+"""
@@ -0,0 +1,171 @@
+# Standard Library
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+# Third party
+from flask import Flask, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Local
+from .config import SQL_LOG_REQUEST_STATS
+
+logger = logging.getLogger(__name__)
+
+
+class SqlStats(object):
+    """
+    Counts SQL statements executed, and the rows and time they took.
+
+    Rows are those returned by queries, or affected by INSERT, UPDATE and
+    DELETE statements.
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def count_statement(self, rows: int, duration: float):
+        """
+        Count a statement executed.
+
+        :param rows: Number of rows returned or affected
+        :param duration: Time spent executing the statement, in seconds
+        """
+        with self._lock:
+            self.statements += 1
+            self.rows += rows
+            self.duration += duration
+
+    def reset(self):
+        """Reset the counters."""
+        with self._lock:
+            self.statements = 0
+            self.rows = 0
+            self.duration = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the counters."""
+        return {
+            'statements': self.statements,
+            'rows': self.rows,
+            'duration_ms': round(self.duration * 1000, 3),
+        }
+
+
+# -- Counting ----------------------------------------------------------------
+
+
+_local = threading.local()
+
+
+def _active_counters() -> List[SqlStats]:
+    """Return the counters counting statements executed by this thread."""
+
+    if not hasattr(_local, 'counters'):
+        _local.counters = []
+
+    return _local.counters
+
+
+def start_counting() -> SqlStats:
+    """
+    Start counting the SQL statements executed by this thread.
+
+    :returns: The counter, counting until stop_counting() is called
+    """
+    counter = SqlStats()
+    _active_counters().append(counter)
+    return counter
+
+
+def stop_counting(counter: SqlStats):
+    """
+    Stop counting the SQL statements executed by this thread.
+
+    :param counter: The counter returned by start_counting()
+    """
+    counters = _active_counters()
+
+    if counter in counters:
+        counters.remove(counter)
+
+
+@contextmanager
+def count_statements() -> Iterator[SqlStats]:
+    """Count the SQL statements executed by this thread within the block."""
+
+    counter = start_counting()
+
+    try:
+        yield counter
+    finally:
+        stop_counting(counter)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info['sql_stats_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = conn.info.pop('sql_stats_started', None)
+    duration = time.perf_counter() - started if started is not None else 0.0
+    rows = max(cursor.rowcount, 0)
+
+    sql_stats.count_statement(rows, duration)
+
+    for counter in _active_counters():
+        counter.count_statement(rows, duration)
+
+
+# -- Requests ----------------------------------------------------------------
+
+
+def count_request_statements(app: Flask):
+    """
+    Count the SQL statements executed by each request to the app.
+
+    Requests which executed any statements are logged (unless disabled by
+    SQL_LOG_REQUEST_STATS), along with the rows and time they took.
+
+    :param app: The Flask app
+    """
+
+    @app.before_request
+    def _start_counting():
+        g.sql_stats = start_counting()
+
+    @app.teardown_request
+    def _stop_counting(exception=None):
+        counter = g.pop('sql_stats', None)
+
+        if counter is None:
+            return
+
+        stop_counting(counter)
+
+        if SQL_LOG_REQUEST_STATS and counter.statements:
+            logger.info(
+                'SQL %s %s: %d statements, %d rows, %.1f ms',
+                request.method,
+                request.path,
+                counter.statements,
+                counter.rows,
+                counter.duration * 1000,
+            )
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+sql_stats = SqlStats()
+"""Counts the SQL statements executed by this worker since it started."""
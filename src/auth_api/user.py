@@ -7,37 +7,41 @@ from auth_api.state import AuthState
 
 def create_or_get_user(
         session: db.Session,
-        state: AuthState
+        state: AuthState,
+        look_up: bool = True,
 ) -> DbUser:
     """
     Create or get a user and an external user if they don't exist.
 
-    This only happens if they have accepted terms
+    This only happens if they have accepted terms. The user and external
+    user are upserted without committing, so the login is written in the
+    caller's transaction.
 
     :param session: The db session
     :param state: AuthState
+    :param look_up: Whether to look up the external user first. Pass False
+        if the caller has already looked it up in this transaction, and
+        found no user
     :return: A DbUser if a user has been created or exists, otherwise an error
     """
 
     if not state.terms_accepted:
         raise RuntimeError("User has not accepted terms")
 
-    user = db_controller.get_user_by_external_subject(
-        session=session,
-        identity_provider=state.identity_provider,
-        external_subject=state.external_subject,
-    )
+    user = None
 
-    if not user:
-        user = db_controller.get_or_create_user(
+    if look_up:
+        user = db_controller.get_user_by_external_subject(
             session=session,
+            identity_provider=state.identity_provider,
+            external_subject=state.external_subject,
         )
 
-        db_controller.attach_external_user(
+    if not user:
+        user = db_controller.get_or_create_user(
             session=session,
-            user=user,
-            external_subject=state.external_subject,
             identity_provider=state.identity_provider,
+            external_subject=state.external_subject,
         )
 
     return user
@@ -0,0 +1,110 @@
+"""Covering primary key on token
+
+Collapses the primary key, the unique constraint and the ix_token_opaque_token
+index (all on token.opaque_token) into a single unique index, which INCLUDEs
+the columns read by ForwardAuth, so the lookup is an index-only scan.
+
+The index is built CONCURRENTLY (outside a transaction), after which the
+constraints are swapped in a short transaction, so writes are only blocked
+briefly.
+
+Every unique constraint on token.opaque_token is dropped, as databases
+migrated from the baseline may have more than one (ie. the unnamed
+constraint added by 9720f2c9aba2 may be token_opaque_token_key1). Their
+names are kept in a comment on the new primary key, so downgrading
+restores the same constraints.
+
+Revision ID: 719de39f4ff3
+Revises: 7c454b8ab0d9
+Create Date: 2026-10-18 10:12:41.318203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '719de39f4ff3'
+down_revision = '7c454b8ab0d9'
+branch_labels = None
+depends_on = None
+
+
+# The unique constraints on token.opaque_token (other than the primary key)
+UNIQUE_CONSTRAINTS = sa.text("""
+    SELECT c.conname
+    FROM pg_constraint c
+    JOIN pg_attribute a
+        ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+    WHERE c.conrelid = 'token'::regclass
+        AND c.contype = 'u'
+        AND array_length(c.conkey, 1) = 1
+        AND a.attname = 'opaque_token'
+    ORDER BY c.conname
+""")
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        # A previous, failed attempt may have left an INVALID index behind
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS token_pkey_covering')
+        op.execute(
+            'CREATE UNIQUE INDEX CONCURRENTLY token_pkey_covering '
+            'ON token (opaque_token) '
+            'INCLUDE (internal_token, issued, expires)'
+        )
+
+    op.execute("SET LOCAL lock_timeout = '5s'")
+
+    unique_constraints = op.get_bind().execute(
+        UNIQUE_CONSTRAINTS).scalars().all()
+
+    for name in unique_constraints:
+        op.execute(f'ALTER TABLE token DROP CONSTRAINT "{name}"')
+
+    op.execute('ALTER TABLE token DROP CONSTRAINT token_pkey')
+    op.execute(
+        'ALTER TABLE token ADD CONSTRAINT token_pkey '
+        'PRIMARY KEY USING INDEX token_pkey_covering'
+    )
+    op.execute(sa.text(
+        'COMMENT ON CONSTRAINT token_pkey ON token IS :names'
+    ).bindparams(names=','.join(unique_constraints)))
+
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_token_opaque_token')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_token_opaque_token')
+        op.execute(
+            'CREATE INDEX CONCURRENTLY ix_token_opaque_token '
+            'ON token (opaque_token)'
+        )
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS token_pkey_plain')
+        op.execute(
+            'CREATE UNIQUE INDEX CONCURRENTLY token_pkey_plain '
+            'ON token (opaque_token)'
+        )
+
+    op.execute("SET LOCAL lock_timeout = '5s'")
+
+    # Names of the unique constraints dropped when upgrading
+    dropped = op.get_bind().execute(sa.text(
+        "SELECT obj_description(oid, 'pg_constraint') FROM pg_constraint "
+        "WHERE conrelid = 'token'::regclass AND conname = 'token_pkey'"
+    )).scalar()
+
+    if dropped is None:
+        dropped = 'token_opaque_token_key'
+
+    op.execute('ALTER TABLE token DROP CONSTRAINT token_pkey')
+    op.execute(
+        'ALTER TABLE token ADD CONSTRAINT token_pkey '
+        'PRIMARY KEY USING INDEX token_pkey_plain'
+    )
+
+    for name in filter(None, dropped.split(',')):
+        op.execute(
+            f'ALTER TABLE token ADD CONSTRAINT "{name}" UNIQUE (opaque_token)')
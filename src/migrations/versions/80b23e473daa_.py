@@ -0,0 +1,108 @@
+"""Move token.id_token into a side table
+
+The id_token (several kilobytes) is only needed when logging out, but made
+every token row read by ForwardAuth large. It is moved to token_id_token
+(one-to-one with token, deleted along with it).
+
+Existing rows are backfilled in batches, each committed separately, and the
+id_token in the token row is set to NULL, so the token rows shrink (once
+vacuumed) without locking the table for the duration of the migration.
+
+The token.id_token column is kept (nullable) for now, along with a trigger
+which copies id_tokens written by the previous version of the service to
+the side table, so it keeps working during a rolling deployment. Both can
+be dropped by a later migration.
+
+Revision ID: 80b23e473daa
+Revises: 719de39f4ff3
+Create Date: 2026-10-18 11:02:17.530941
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '80b23e473daa'
+down_revision = '719de39f4ff3'
+branch_labels = None
+depends_on = None
+
+
+# Number of tokens backfilled per transaction
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    op.create_table('token_id_token',
+    sa.Column('opaque_token', sa.String(), nullable=False),
+    sa.Column('id_token', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['opaque_token'], ['token.opaque_token'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('opaque_token')
+    )
+    op.alter_column('token', 'id_token', existing_type=sa.String(), nullable=True)
+
+    # Copies id_tokens written by the previous version of the service
+    op.execute("""
+        CREATE FUNCTION token_copy_id_token() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.id_token IS NOT NULL THEN
+                INSERT INTO token_id_token (opaque_token, id_token)
+                VALUES (NEW.opaque_token, NEW.id_token)
+                ON CONFLICT (opaque_token)
+                DO UPDATE SET id_token = EXCLUDED.id_token;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER token_copy_id_token
+        AFTER INSERT OR UPDATE OF id_token ON token
+        FOR EACH ROW EXECUTE PROCEDURE token_copy_id_token()
+    """)
+
+    with op.get_context().autocommit_block():
+        backfill()
+
+
+def backfill():
+    """Copy id_tokens to the side table in batches (one statement each)."""
+
+    connection = op.get_bind()
+    last = ''
+
+    while last is not None:
+        last = connection.execute(sa.text("""
+            WITH batch AS (
+                SELECT opaque_token FROM token
+                WHERE opaque_token > :last AND id_token IS NOT NULL
+                ORDER BY opaque_token
+                LIMIT :batch_size
+                FOR UPDATE
+            ),
+            copied AS (
+                INSERT INTO token_id_token (opaque_token, id_token)
+                SELECT t.opaque_token, t.id_token
+                FROM token t JOIN batch USING (opaque_token)
+                ON CONFLICT (opaque_token) DO NOTHING
+            ),
+            cleared AS (
+                UPDATE token SET id_token = NULL
+                FROM batch WHERE token.opaque_token = batch.opaque_token
+            )
+            SELECT max(opaque_token) FROM batch
+        """), {'last': last, 'batch_size': BATCH_SIZE}).scalar()
+
+
+def downgrade():
+    op.execute('DROP TRIGGER token_copy_id_token ON token')
+    op.execute('DROP FUNCTION token_copy_id_token()')
+    op.execute("""
+        UPDATE token SET id_token = s.id_token
+        FROM token_id_token s
+        WHERE token.opaque_token = s.opaque_token AND token.id_token IS NULL
+    """)
+    op.execute("UPDATE token SET id_token = '' WHERE id_token IS NULL")
+    op.alter_column('token', 'id_token', existing_type=sa.String(), nullable=False)
+    op.drop_table('token_id_token')
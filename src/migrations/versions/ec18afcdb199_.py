@@ -0,0 +1,344 @@
+"""Native uuid keys
+
+Converts the keys which hold UUIDs (token, user and company) and their
+foreign keys from varchar to uuid (16 bytes, compared as bytes rather than
+using collations), without locking the tables for long:
+
+1. A uuid shadow column is added next to each column, and kept in sync with
+   it by a trigger
+2. Existing rows are backfilled in batches (one autocommitted statement each)
+3. The new indexes are built CONCURRENTLY, and NOT NULL is proven by
+   validating a CHECK constraint (which does not block writes)
+4. The columns, keys and indexes are swapped in one short transaction
+5. The foreign keys (added NOT VALID) are validated without blocking writes
+
+The redundant unique constraints and indexes on the primary keys of user and
+company are not recreated. The names of the unique constraints are kept in a
+comment on the new primary keys, so downgrading restores the same
+constraints (as databases migrated from the baseline may not have all of
+them). Comments already on the primary keys (ie. token_pkey) are kept.
+
+Revision ID: ec18afcdb199
+Revises: 80b23e473daa
+Create Date: 2026-10-18 12:24:09.114870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ec18afcdb199'
+down_revision = '80b23e473daa'
+branch_labels = None
+depends_on = None
+
+
+# Number of rows backfilled per statement
+BATCH_SIZE = 1000
+
+# Max time to wait for locks before failing (the migration can be re-run)
+LOCK_TIMEOUT = '5s'
+
+# Table: (key to batch the backfill by, columns to convert)
+COLUMNS = {
+    'user': (['subject'], ['subject']),
+    'company': (['id'], ['id']),
+    'token': (['opaque_token'], ['opaque_token']),
+    'token_id_token': (['opaque_token'], ['opaque_token']),
+    'user_external': (['id'], ['subject']),
+    'user_company': (['company_id', 'user_id'], ['company_id', 'user_id']),
+}
+
+# Name: (table, columns, INCLUDE columns)
+PRIMARY_KEYS = {
+    'user_pkey': ('user', ['subject'], []),
+    'company_pkey': ('company', ['id'], []),
+    'token_pkey': (
+        'token', ['opaque_token'], ['internal_token', 'issued', 'expires']),
+    'token_id_token_pkey': ('token_id_token', ['opaque_token'], []),
+    'user_company_pkey': ('user_company', ['company_id', 'user_id'], []),
+}
+
+# Primary keys whose redundant unique constraints are dropped (and kept in
+# a comment on the primary key); the unique constraints on token were
+# dropped by 719de39f4ff3, which keeps their names in the comment instead
+UNIQUE_CONSTRAINTS = ['user_pkey', 'company_pkey', 'user_company_pkey']
+
+# The unique constraints on exactly the given columns of a table
+FIND_UNIQUE_CONSTRAINTS = sa.text("""
+    SELECT c.conname
+    FROM pg_constraint c
+    WHERE c.conrelid = CAST(:table AS regclass)
+        AND c.contype = 'u'
+        AND ARRAY(
+            SELECT a.attname::text
+            FROM pg_attribute a
+            WHERE a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+            ORDER BY a.attname
+        ) = CAST(:columns AS text[])
+    ORDER BY c.conname
+""")
+
+# The comment on a constraint of a table
+GET_COMMENT = sa.text("""
+    SELECT obj_description(oid, 'pg_constraint')
+    FROM pg_constraint
+    WHERE conrelid = CAST(:table AS regclass) AND conname = :name
+""")
+
+# Name: (table, columns)
+INDEXES = {
+    'ix_user_external_subject': ('user_external', ['subject']),
+}
+
+# Name: (table, column, referred table, referred column, ON DELETE)
+FOREIGN_KEYS = {
+    'user_external_subject_fkey': (
+        'user_external', 'subject', 'user', 'subject', None),
+    'user_company_company_id_fkey': (
+        'user_company', 'company_id', 'company', 'id', None),
+    'user_company_user_id_fkey': (
+        'user_company', 'user_id', 'user', 'subject', None),
+    'token_id_token_opaque_token_fkey': (
+        'token_id_token', 'opaque_token', 'token', 'opaque_token', 'CASCADE'),
+}
+
+
+def q(*names):
+    """Quote and join identifiers ("user" is a reserved word)."""
+    return ', '.join(f'"{name}"' for name in names)
+
+
+def shadow(column):
+    """Return the name of the shadow column of a column."""
+    return f'{column}_uuid'
+
+
+def upgrade():
+    # -- 1. Shadow columns ---------------------------------------------------
+
+    for table, (_, columns) in COLUMNS.items():
+        for column in columns:
+            op.execute(f'ALTER TABLE {q(table)} '
+                       f'ADD COLUMN {q(shadow(column))} uuid')
+
+        assignments = ' '.join(
+            f'NEW.{q(shadow(column))} := NEW.{q(column)}::uuid;'
+            for column in columns
+        )
+
+        op.execute(f"""
+            CREATE FUNCTION {q(f'{table}_sync_uuid')}() RETURNS trigger AS $$
+            BEGIN
+                {assignments}
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {q(f'{table}_sync_uuid')}
+            BEFORE INSERT OR UPDATE ON {q(table)}
+            FOR EACH ROW EXECUTE PROCEDURE {q(f'{table}_sync_uuid')}()
+        """)
+
+    with op.get_context().autocommit_block():
+
+        # -- 2. Backfill -----------------------------------------------------
+
+        for table, (key, columns) in COLUMNS.items():
+            backfill(table, key, columns)
+
+        # -- 3. Indexes and NOT NULL -----------------------------------------
+
+        for name, (table, columns, include) in PRIMARY_KEYS.items():
+            create_index_concurrently(
+                f'{name}_uuid', table, [shadow(c) for c in columns],
+                unique=True, include=include)
+
+        for name, (table, columns) in INDEXES.items():
+            create_index_concurrently(
+                f'{name}_uuid', table, [shadow(c) for c in columns])
+
+        op.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+
+        for table, (_, columns) in COLUMNS.items():
+            for column in columns:
+                check = q(f'{table}_{shadow(column)}_not_null')
+                op.execute(f'ALTER TABLE {q(table)} ADD CONSTRAINT {check} '
+                           f'CHECK ({q(shadow(column))} IS NOT NULL) '
+                           f'NOT VALID')
+                op.execute(f'ALTER TABLE {q(table)} '
+                           f'VALIDATE CONSTRAINT {check}')
+
+        op.execute('RESET lock_timeout')
+
+    # -- 4. Swap -------------------------------------------------------------
+
+    op.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+
+    comments = {}
+
+    for name, (table, columns, _) in PRIMARY_KEYS.items():
+        if name in UNIQUE_CONSTRAINTS:
+            comments[name] = ','.join(get_unique_constraints(table, columns))
+        else:
+            comments[name] = get_comment(table, name)
+
+    for name, (table, *_) in FOREIGN_KEYS.items():
+        op.execute(f'ALTER TABLE {q(table)} DROP CONSTRAINT {q(name)}')
+
+    for table, (_, columns) in COLUMNS.items():
+        op.execute(f'DROP TRIGGER {q(f"{table}_sync_uuid")} ON {q(table)}')
+        op.execute(f'DROP FUNCTION {q(f"{table}_sync_uuid")}()')
+
+        for column in columns:
+            check = q(f'{table}_{shadow(column)}_not_null')
+
+            # Also drops the old primary key, constraints and indexes
+            op.execute(f'ALTER TABLE {q(table)} DROP COLUMN {q(column)}')
+            op.execute(f'ALTER TABLE {q(table)} '
+                       f'RENAME COLUMN {q(shadow(column))} TO {q(column)}')
+
+            # Uses the validated CHECK constraint instead of scanning
+            op.execute(f'ALTER TABLE {q(table)} '
+                       f'ALTER COLUMN {q(column)} SET NOT NULL')
+            op.execute(f'ALTER TABLE {q(table)} DROP CONSTRAINT {check}')
+
+    for name, (table, *_) in PRIMARY_KEYS.items():
+        op.execute(f'ALTER TABLE {q(table)} ADD CONSTRAINT {q(name)} '
+                   f'PRIMARY KEY USING INDEX {q(f"{name}_uuid")}')
+        set_comment(table, name, comments[name])
+
+    for name in INDEXES:
+        op.execute(f'ALTER INDEX {q(f"{name}_uuid")} RENAME TO {q(name)}')
+
+    for name, foreign_key in FOREIGN_KEYS.items():
+        add_foreign_key(name, *foreign_key, valid=False)
+
+    # -- 5. Validate foreign keys --------------------------------------------
+
+    with op.get_context().autocommit_block():
+        for name, (table, *_) in FOREIGN_KEYS.items():
+            op.execute(f'ALTER TABLE {q(table)} VALIDATE CONSTRAINT {q(name)}')
+
+
+def backfill(table, key, columns):
+    """Fill the shadow columns of a table in batches (keyset paginated)."""
+
+    connection = op.get_bind()
+    params = {f'k{i}': None for i in range(len(key))}
+    after = ''
+
+    while True:
+        batch = connection.execute(sa.text(f"""
+            WITH batch AS (
+                SELECT {q(*key)} FROM {q(table)}
+                WHERE {q(shadow(columns[0]))} IS NULL {after}
+                ORDER BY {q(*key)}
+                LIMIT :batch_size
+                FOR UPDATE
+            ),
+            filled AS (
+                UPDATE {q(table)} SET {', '.join(
+                    f'{q(shadow(c))} = {q(table)}.{q(c)}::uuid'
+                    for c in columns)}
+                FROM batch WHERE {' AND '.join(
+                    f'{q(table)}.{q(k)} = batch.{q(k)}' for k in key)}
+            )
+            SELECT {q(*key)} FROM batch
+            ORDER BY {', '.join(f'{q(k)} DESC' for k in key)}
+            LIMIT 1
+        """), {**params, 'batch_size': BATCH_SIZE}).first()
+
+        if batch is None:
+            break
+
+        params = {f'k{i}': value for i, value in enumerate(batch)}
+        after = f'AND ({q(*key)}) > ({", ".join(f":{k}" for k in params)})'
+
+
+def get_unique_constraints(table, columns):
+    """Return the names of the unique constraints on the columns."""
+
+    return op.get_bind().execute(FIND_UNIQUE_CONSTRAINTS, {
+        'table': q(table),
+        'columns': sorted(columns),
+    }).scalars().all()
+
+
+def get_comment(table, name):
+    """Return the comment on a constraint (None if it has none)."""
+
+    return op.get_bind().execute(GET_COMMENT, {
+        'table': q(table),
+        'name': name,
+    }).scalar()
+
+
+def set_comment(table, name, comment):
+    """Set (or with None, remove) the comment on a constraint."""
+
+    op.execute(sa.text(
+        f'COMMENT ON CONSTRAINT {q(name)} ON {q(table)} IS :comment'
+    ).bindparams(comment=comment))
+
+
+def create_index_concurrently(name, table, columns, unique=False,
+                              include=()):
+    """Create an index without blocking writes."""
+
+    # A previous, failed attempt may have left an INVALID index behind
+    op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {q(name)}')
+    op.execute(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX CONCURRENTLY {q(name)} '
+        f'ON {q(table)} ({q(*columns)})'
+        + (f' INCLUDE ({q(*include)})' if include else '')
+    )
+
+
+def add_foreign_key(name, table, column, referred_table, referred_column,
+                    ondelete, valid=True):
+    """Add a foreign key (NOT VALID skips checking existing rows)."""
+
+    op.execute(
+        f'ALTER TABLE {q(table)} ADD CONSTRAINT {q(name)} '
+        f'FOREIGN KEY ({q(column)}) '
+        f'REFERENCES {q(referred_table)} ({q(referred_column)})'
+        + (f' ON DELETE {ondelete}' if ondelete else '')
+        + ('' if valid else ' NOT VALID')
+    )
+
+
+def downgrade():
+    # Rewrites the tables, so writes are blocked while downgrading
+
+    # Names of the unique constraints dropped when upgrading (an empty
+    # comment is no comment, ie. None)
+    dropped = {
+        name: get_comment(PRIMARY_KEYS[name][0], name) or ''
+        for name in UNIQUE_CONSTRAINTS
+    }
+
+    for name, (table, *_) in FOREIGN_KEYS.items():
+        op.execute(f'ALTER TABLE {q(table)} DROP CONSTRAINT {q(name)}')
+
+    for table, (_, columns) in COLUMNS.items():
+        op.execute(f'ALTER TABLE {q(table)} ' + ', '.join(
+            f'ALTER COLUMN {q(column)} TYPE varchar USING {q(column)}::text'
+            for column in columns
+        ))
+
+    for name, foreign_key in FOREIGN_KEYS.items():
+        add_foreign_key(name, *foreign_key)
+
+    for name, comment in dropped.items():
+        table, columns, _ = PRIMARY_KEYS[name]
+        set_comment(table, name, None)
+
+        for constraint in filter(None, comment.split(',')):
+            op.execute(f'ALTER TABLE {q(table)} ADD CONSTRAINT '
+                       f'{q(constraint)} UNIQUE ({q(*columns)})')
+
+    op.create_index('ix_user_subject', 'user', ['subject'], unique=False)
+    op.create_index('ix_company_id', 'company', ['id'], unique=False)
@@ -0,0 +1,182 @@
+"""Tests for invalidating cached tokens across workers."""
+
+# Standard Library
+import time
+from typing import Callable, Iterator
+from unittest.mock import MagicMock, patch
+
+# Third party
+import pytest
+
+# Local
+from auth_api.cache import token_cache, unknown_token_cache
+from auth_api.db import db
+from auth_api.invalidation import (
+    FLUSH_ALL,
+    TokenInvalidationListener,
+    flush_local_caches,
+    handle_invalidation,
+    notify_flush_all,
+    notify_token_revoked,
+)
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def listener(mock_session: db.Session) -> Iterator[TokenInvalidationListener]:
+    """Yield a running listener, which is listening for notifications."""
+
+    listener = TokenInvalidationListener(poll_interval=0.1)
+    listener.start()
+
+    assert listener.listening.wait(timeout=10)
+
+    yield listener
+
+    listener.stop()
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 10) -> bool:
+    """Wait for a condition to become true."""
+
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+
+    return True
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestHandleInvalidation:
+    """Tests handle_invalidation()."""
+
+    @pytest.mark.unittest
+    def test__payload_is_opaque_token__should_evict_only_that_token(self):
+        """Only the revoked token should be evicted."""
+
+        token_cache.set('token1', 'internal-token1')
+        token_cache.set('token2', 'internal-token2')
+
+        handle_invalidation('token1')
+
+        assert token_cache.get('token1') is None
+        assert token_cache.get('token2') == 'internal-token2'
+
+    @pytest.mark.unittest
+    def test__payload_is_flush_all__should_evict_all_tokens(self):
+        """All tokens should be evicted from all caches."""
+
+        token_cache.set('token1', 'internal-token1')
+        unknown_token_cache.set('token2', True)
+
+        handle_invalidation(FLUSH_ALL)
+
+        assert token_cache.get('token1') is None
+        assert unknown_token_cache.get('token2') is None
+
+
+class TestFlushLocalCaches:
+    """Tests flush_local_caches()."""
+
+    @pytest.mark.unittest
+    def test__memory_backend__should_evict_all_tokens(self):
+        """Caches in this worker's memory should be flushed."""
+
+        token_cache.set('token1', 'internal-token1')
+        unknown_token_cache.set('token2', True)
+
+        flush_local_caches()
+
+        assert token_cache.get('token1') is None
+        assert unknown_token_cache.get('token2') is None
+
+    @pytest.mark.unittest
+    def test__shared_backend__should_not_flush_shared_cache(self):
+        """Caches shared with other workers should be left alone."""
+
+        shared_cache = MagicMock(shared=True)
+        unknown_token_cache.set('token2', True)
+
+        with patch('auth_api.invalidation.token_cache', shared_cache):
+            flush_local_caches()
+
+        shared_cache.clear.assert_not_called()
+        assert unknown_token_cache.get('token2') is None
+
+
+class TestTokenInvalidationListener:
+    """Tests TokenInvalidationListener."""
+
+    @pytest.mark.integrationtest
+    def test__token_revoked_and_committed__should_evict_token(
+            self,
+            mock_session: db.Session,
+            listener: TokenInvalidationListener,
+    ):
+        """A committed revocation should evict the token in all workers."""
+
+        token_cache.set('token1', 'internal-token1')
+        token_cache.set('token2', 'internal-token2')
+
+        # -- Act -------------------------------------------------------------
+
+        notify_token_revoked(mock_session, 'token1')
+        mock_session.commit()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert wait_for(lambda: token_cache.get('token1') is None)
+        assert token_cache.get('token2') == 'internal-token2'
+
+    @pytest.mark.integrationtest
+    def test__token_revoked_and_rolled_back__should_not_evict_token(
+            self,
+            mock_session: db.Session,
+            listener: TokenInvalidationListener,
+    ):
+        """A rolled back revocation should not evict the token."""
+
+        token_cache.set('token1', 'internal-token1')
+
+        # -- Act -------------------------------------------------------------
+
+        notify_token_revoked(mock_session, 'token1')
+        mock_session.rollback()
+
+        # Send another notification to know when to stop waiting
+        notify_token_revoked(mock_session, 'token2')
+        token_cache.set('token2', 'internal-token2')
+        mock_session.commit()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert wait_for(lambda: token_cache.get('token2') is None)
+        assert token_cache.get('token1') == 'internal-token1'
+
+    @pytest.mark.integrationtest
+    def test__flush_all__should_evict_all_tokens(
+            self,
+            mock_session: db.Session,
+            listener: TokenInvalidationListener,
+    ):
+        """Flushing should evict all tokens in all workers."""
+
+        token_cache.set('token1', 'internal-token1')
+        token_cache.set('token2', 'internal-token2')
+
+        # -- Act -------------------------------------------------------------
+
+        notify_flush_all(mock_session)
+        mock_session.commit()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert wait_for(lambda: token_cache.get('token1') is None)
+        assert token_cache.get('token2') is None
@@ -0,0 +1,251 @@
+"""Tests for the shared memory cache."""
+
+# Standard Library
+import multiprocessing
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+# Third party
+import pytest
+
+# Local
+from auth_api.cache import SharedMemoryCache, TtlCache, create_cache
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def path(tmp_path) -> str:
+    """Path to the file backing the cache."""
+
+    return str(tmp_path / 'cache')
+
+
+@pytest.fixture(scope='function')
+def cache(path: str) -> SharedMemoryCache:
+    """Shared memory cache backed by a temporary file."""
+
+    return SharedMemoryCache(path=path, size=16, ttl=60, value_size=64)
+
+
+def _set_in_other_process(path: str, key: str, value: str):
+    SharedMemoryCache(path=path, size=16, ttl=60, value_size=64) \
+        .set(key, value)
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestSharedMemoryCache:
+    """Tests SharedMemoryCache."""
+
+    @pytest.mark.unittest
+    def test__get__key_was_set__should_return_value(
+            self,
+            cache: SharedMemoryCache,
+    ):
+        """A value that has been set should be returned."""
+
+        cache.set('key', 'value')
+
+        assert cache.get('key') == 'value'
+        assert cache.get('other-key') is None
+
+    @pytest.mark.unittest
+    def test__get__key_was_set_by_another_process__should_return_value(
+            self,
+            cache: SharedMemoryCache,
+            path: str,
+    ):
+        """A value set by another process should be visible."""
+
+        cache.set('key1', 'value1')
+
+        process = multiprocessing.get_context('fork').Process(
+            target=_set_in_other_process,
+            args=(path, 'key2', 'value2'),
+        )
+        process.start()
+        process.join()
+
+        assert cache.get('key1') == 'value1'
+        assert cache.get('key2') == 'value2'
+
+    @pytest.mark.unittest
+    def test__get__ttl_has_passed__should_return_none(
+            self,
+            cache: SharedMemoryCache,
+    ):
+        """A value should be evicted once its TTL has passed."""
+
+        with patch('auth_api.cache.shared.time.time', return_value=1000):
+            cache.set('key', 'value')
+
+        with patch('auth_api.cache.shared.time.time', return_value=1059):
+            assert cache.get('key') == 'value'
+
+        with patch('auth_api.cache.shared.time.time', return_value=1061):
+            assert cache.get('key') is None
+
+    @pytest.mark.unittest
+    def test__set__already_expired__should_not_cache_value(
+            self,
+            cache: SharedMemoryCache,
+    ):
+        """A value which has already expired should not be cached."""
+
+        expires = datetime.now(tz=timezone.utc) - timedelta(seconds=1)
+
+        cache.set('key', 'value', expires=expires)
+
+        assert cache.get('key') is None
+
+    @pytest.mark.unittest
+    def test__set__value_is_too_large__should_not_cache_value(
+            self,
+            cache: SharedMemoryCache,
+    ):
+        """Values larger than value_size should not be cached."""
+
+        cache.set('key', 'x' * 65)
+
+        assert cache.get('key') is None
+
+    @pytest.mark.unittest
+    def test__set__key_already_exists__should_overwrite_value(
+            self,
+            cache: SharedMemoryCache,
+    ):
+        """Setting an existing key should overwrite its value."""
+
+        cache.set('key', 'a-long-value')
+        cache.set('key', 'short')
+
+        assert cache.get('key') == 'short'
+        assert len(cache) == 1
+
+    @pytest.mark.unittest
+    def test__set__more_keys_than_slots__should_keep_latest_keys(
+            self,
+            path: str,
+    ):
+        """When full, new values should replace the ones expiring first."""
+
+        cache = SharedMemoryCache(path=path, size=4, ttl=60, value_size=64)
+
+        for i in range(100):
+            cache.set(f'key{i}', f'value{i}')
+
+        assert len(cache) == 4
+        assert cache.get('key99') == 'value99'
+
+    @pytest.mark.unittest
+    def test__delete__should_evict_value(
+            self,
+            cache: SharedMemoryCache,
+    ):
+        """A deleted value should not be returned."""
+
+        cache.set('key1', 'value1')
+        cache.set('key2', 'value2')
+        cache.delete('key1')
+
+        assert cache.get('key1') is None
+        assert cache.get('key2') == 'value2'
+
+    @pytest.mark.unittest
+    def test__clear__should_evict_all_values(
+            self,
+            cache: SharedMemoryCache,
+    ):
+        """Clearing the cache should evict all values."""
+
+        cache.set('key1', 'value1')
+        cache.set('key2', 'value2')
+        cache.clear()
+
+        assert len(cache) == 0
+
+    @pytest.mark.unittest
+    def test__open__file_has_other_layout__should_reinitialize_file(
+            self,
+            cache: SharedMemoryCache,
+            path: str,
+    ):
+        """A file written with another layout should not be read."""
+
+        cache.set('key', 'value')
+
+        other_cache = SharedMemoryCache(
+            path=path, size=8, ttl=60, value_size=64)
+
+        assert other_cache.get('key') is None
+
+    @pytest.mark.unittest
+    def test__open__file_has_other_layout__should_not_truncate_mapped_file(
+            self,
+            cache: SharedMemoryCache,
+            path: str,
+    ):
+        """Processes which have mapped the old file should keep using it."""
+
+        cache.set('key', 'value')
+
+        other_cache = SharedMemoryCache(
+            path=path, size=8, ttl=60, value_size=64)
+        other_cache.set('key', 'other-value')
+
+        assert cache.get('key') == 'value'
+        assert other_cache.get('key') == 'other-value'
+
+    @pytest.mark.unittest
+    def test__get__first_use_by_concurrent_threads__should_open_file_once(
+            self,
+            cache: SharedMemoryCache,
+    ):
+        """Threads reading concurrently should not open the file twice."""
+
+        barrier = threading.Barrier(8, timeout=10)
+        results = []
+
+        def get():
+            barrier.wait()
+            results.append(cache.get('key'))
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+
+        with patch.object(cache, '_open', wraps=cache._open) as mock:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert mock.call_count == 1
+        assert results == [None] * 8
+
+
+class TestCreateCache:
+    """Tests create_cache()."""
+
+    @pytest.mark.unittest
+    def test__backend_is_memory__should_return_ttl_cache(self):
+        """The memory backend should be an in-process cache."""
+
+        assert isinstance(
+            create_cache(backend='memory', size=1, ttl=1), TtlCache)
+
+    @pytest.mark.unittest
+    def test__backend_is_shared__should_return_shared_memory_cache(self):
+        """The shared backend should be a shared memory cache."""
+
+        assert isinstance(
+            create_cache(backend='shared', size=1, ttl=1), SharedMemoryCache)
+
+    @pytest.mark.unittest
+    def test__backend_is_unknown__should_raise_runtime_error(self):
+        """Unknown backends should raise an error."""
+
+        with pytest.raises(RuntimeError):
+            create_cache(backend='unknown', size=1, ttl=1)
@@ -0,0 +1,118 @@
+"""Tests for single-flight coalescing of calls."""
+
+# Standard Library
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+# Third party
+import pytest
+
+# Local
+from auth_api.cache import SingleFlight
+
+
+def wait_for_waiters(single_flight: SingleFlight, key: str, count: int):
+    """Block until count threads are waiting for the call in flight."""
+
+    for _ in range(1000):
+        if single_flight._calls[key].waiters >= count:
+            return
+        threading.Event().wait(0.005)
+
+    raise AssertionError('Threads never joined the call in flight')
+
+
+class TestSingleFlight:
+    """Tests SingleFlight."""
+
+    @pytest.mark.unittest
+    def test__do__concurrent_calls_with_same_key__should_invoke_once(self):
+        """Concurrent calls should share one invocation and its result."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def function():
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        function = Mock(side_effect=function)
+
+        # -- Act -------------------------------------------------------------
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            leader = executor.submit(single_flight.do, 'key', function)
+            started.wait(5)
+
+            followers = [
+                executor.submit(single_flight.do, 'key', function)
+                for _ in range(4)
+            ]
+
+            wait_for_waiters(single_flight, 'key', 4)
+            release.set()
+
+            results = [f.result(5) for f in [leader, *followers]]
+
+        # -- Assert ----------------------------------------------------------
+
+        assert function.call_count == 1
+        assert results == ['result'] * 5
+        assert len(single_flight) == 0
+
+    @pytest.mark.unittest
+    def test__do__call_raises__should_raise_in_all_callers(self):
+        """An exception should be raised to all callers sharing the call."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def function():
+            started.set()
+            release.wait(5)
+            raise ValueError('failed')
+
+        # -- Act -------------------------------------------------------------
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(single_flight.do, 'key', function)
+            started.wait(5)
+            follower = executor.submit(single_flight.do, 'key', function)
+            wait_for_waiters(single_flight, 'key', 1)
+            release.set()
+
+            # -- Assert ------------------------------------------------------
+
+            with pytest.raises(ValueError):
+                leader.result(5)
+
+            with pytest.raises(ValueError):
+                follower.result(5)
+
+    @pytest.mark.unittest
+    def test__do__call_has_completed__should_invoke_again(self):
+        """Results should not be cached once a call has completed."""
+
+        single_flight = SingleFlight()
+        function = Mock(side_effect=['result1', 'result2'])
+
+        assert single_flight.do('key', function) == 'result1'
+        assert single_flight.do('key', function) == 'result2'
+        assert function.call_count == 2
+
+    @pytest.mark.unittest
+    def test__do__different_keys__should_not_be_coalesced(self):
+        """Calls with different keys should be invoked separately."""
+
+        single_flight = SingleFlight()
+
+        assert single_flight.do('key1', lambda: 'result1') == 'result1'
+        assert single_flight.do('key2', lambda: 'result2') == 'result2'
@@ -0,0 +1,119 @@
+"""Tests for the in-process TTL cache."""
+
+# Standard Library
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+# Third party
+import pytest
+
+# Local
+from auth_api.cache import TtlCache
+
+
+class TestTtlCache:
+    """Tests TtlCache."""
+
+    @pytest.mark.unittest
+    def test__get__key_was_set__should_return_value(self):
+        """A value that has been set should be returned."""
+
+        cache = TtlCache(size=10, ttl=60)
+        cache.set('key', 'value')
+
+        assert cache.get('key') == 'value'
+
+    @pytest.mark.unittest
+    def test__get__key_was_not_set__should_return_none(self):
+        """A key that has not been set should return None."""
+
+        cache = TtlCache(size=10, ttl=60)
+
+        assert cache.get('key') is None
+
+    @pytest.mark.unittest
+    def test__get__ttl_has_passed__should_return_none(self):
+        """A value should be evicted once its TTL has passed."""
+
+        cache = TtlCache(size=10, ttl=60)
+
+        with patch('auth_api.cache.memory.time.monotonic', return_value=1000):
+            cache.set('key', 'value')
+
+        with patch('auth_api.cache.memory.time.monotonic', return_value=1061):
+            assert cache.get('key') is None
+
+        assert len(cache) == 0
+
+    @pytest.mark.unittest
+    def test__set__expires_before_ttl__should_expire_at_expires(self):
+        """A value should never outlive its expires, even if TTL is longer."""
+
+        cache = TtlCache(size=10, ttl=3600)
+        expires = datetime.now(tz=timezone.utc) + timedelta(seconds=10)
+
+        with patch('auth_api.cache.memory.time.monotonic', return_value=1000):
+            cache.set('key', 'value', expires=expires)
+
+        with patch('auth_api.cache.memory.time.monotonic', return_value=1005):
+            assert cache.get('key') == 'value'
+
+        with patch('auth_api.cache.memory.time.monotonic', return_value=1011):
+            assert cache.get('key') is None
+
+    @pytest.mark.unittest
+    def test__set__already_expired__should_not_cache_value(self):
+        """A value which has already expired should not be cached."""
+
+        cache = TtlCache(size=10, ttl=60)
+        expires = datetime.now(tz=timezone.utc) - timedelta(seconds=1)
+
+        cache.set('key', 'value', expires=expires)
+
+        assert cache.get('key') is None
+
+    @pytest.mark.unittest
+    def test__set__cache_is_full__should_evict_least_recently_used(self):
+        """The least recently used value should be evicted when full."""
+
+        cache = TtlCache(size=2, ttl=60)
+        cache.set('key1', 'value1')
+        cache.set('key2', 'value2')
+
+        # Use key1 so key2 becomes the least recently used
+        cache.get('key1')
+        cache.set('key3', 'value3')
+
+        assert cache.get('key1') == 'value1'
+        assert cache.get('key2') is None
+        assert cache.get('key3') == 'value3'
+
+    @pytest.mark.unittest
+    def test__set__size_is_zero__should_not_cache_value(self):
+        """Setting size to zero should disable the cache."""
+
+        cache = TtlCache(size=0, ttl=60)
+        cache.set('key', 'value')
+
+        assert cache.get('key') is None
+
+    @pytest.mark.unittest
+    def test__delete__should_evict_value(self):
+        """A deleted value should not be returned."""
+
+        cache = TtlCache(size=10, ttl=60)
+        cache.set('key', 'value')
+        cache.delete('key')
+
+        assert cache.get('key') is None
+
+    @pytest.mark.unittest
+    def test__clear__should_evict_all_values(self):
+        """Clearing the cache should evict all values."""
+
+        cache = TtlCache(size=10, ttl=60)
+        cache.set('key1', 'value1')
+        cache.set('key2', 'value2')
+        cache.clear()
+
+        assert len(cache) == 0
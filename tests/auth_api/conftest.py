@@ -6,7 +6,8 @@ https://docs.pytest.org/en/2.7.3/plugins.html?highlight=re#conftest-py-plugins
 import pytest
 import requests_mock
 from uuid import uuid4
-from typing import Dict, Any
+from contextlib import contextmanager
+from typing import Any, Callable, ContextManager, Dict, Iterator
 from unittest.mock import patch
 from authlib.jose import jwt, jwk
 from flask.testing import FlaskClient
@@ -20,8 +21,16 @@ from origin.models.auth import InternalToken
 from origin.encrypt import aes256_encrypt
 
 from auth_api.app import create_app
+from auth_api.controller import opaque_token_signer
+from auth_api.cache import (
+    login_callback_cache,
+    token_cache,
+    unknown_token_cache,
+)
+from auth_api.oidc import oidc_backend
 from auth_api.state import AuthState
 from auth_api.db import db as _db
+from auth_api.sql_stats import SqlStats, count_statements
 from auth_api.config import (
     DATASYNC_BASE_URL,
     DATASYNC_CREATE_RELATIONS_PATH,
@@ -44,6 +53,30 @@ def client() -> FlaskClient:
     return create_app().test_client
 
 
+@pytest.fixture(scope='function', autouse=True)
+def clear_token_cache():
+    """Make sure cached tokens does not leak between tests."""
+
+    token_cache.clear()
+    unknown_token_cache.clear()
+    login_callback_cache.clear()
+    yield
+    token_cache.clear()
+    unknown_token_cache.clear()
+    login_callback_cache.clear()
+
+
+@pytest.fixture(scope='function', autouse=True)
+def reset_circuit_breakers():
+    """Make sure failed calls to the IdP does not leak between tests."""
+
+    for breaker in oidc_backend.breakers.values():
+        breaker.reset()
+    yield
+    for breaker in oidc_backend.breakers.values():
+        breaker.reset()
+
+
 # -- OAuth2 session methods --------------------------------------------------
 
 
@@ -103,14 +136,14 @@ def jwk_private() -> str:
 def subject() -> str:
     """Return the subject."""
 
-    return 'subject'
+    return str(uuid4())
 
 
 @pytest.fixture(scope='function')
 def actor() -> str:
     """Return an actor name."""
 
-    return 'actor'
+    return str(uuid4())
 
 # -- Tokens ------------------------------------------------------------------
 
@@ -316,6 +349,21 @@ def opaque_token() -> str:
     return str(uuid4())
 
 
+@pytest.fixture(scope='function')
+def opaque_token_cookie(
+        opaque_token: str,
+        expires_datetime: datetime,
+) -> str:
+    """
+    Return the cookie value of the opaque token.
+
+    The opaque token is signed, like the token set in the cookie when
+    logging in.
+    """
+
+    return opaque_token_signer.sign(opaque_token, expires_datetime)
+
+
 @pytest.fixture(scope='function')
 def issued_datetime() -> datetime:
     """Datetime that indicates when a token has been issued."""
@@ -397,7 +445,8 @@ def psql_uri():
 def db(psql_uri: str) -> SqlEngine:
     """Yield postgress engine instance."""
 
-    with patch('auth_api.db.db.uri', new=psql_uri):
+    with patch('auth_api.db.db.uri', new=psql_uri), \
+            patch('auth_api.db.outbox_db.uri', new=psql_uri):
         yield _db
 
 
@@ -411,6 +460,30 @@ def mock_session(db: SqlEngine) -> SqlEngine.Session:
         yield session
 
 
+@pytest.fixture(scope='function')
+def sql_budget() -> Callable[..., ContextManager[SqlStats]]:
+    """
+    Assert the SQL statements executed within a block stay within a budget.
+
+    Usage:
+
+        with sql_budget(statements=4):
+            client.get(...)
+    """
+
+    @contextmanager
+    def _sql_budget(statements: int) -> Iterator[SqlStats]:
+        with count_statements() as counter:
+            yield counter
+
+        assert counter.statements <= statements, (
+            f'Executed {counter.statements} SQL statements, '
+            f'expected at most {statements}'
+        )
+
+    return _sql_budget
+
+
 # # -- Requests ---------------------------------------------------------------
 
 
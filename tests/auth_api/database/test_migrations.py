@@ -64,3 +64,130 @@ class TestRunMigrations(object):
         # -- Clean up --------------------------------------------------------
 
         os.chdir('..')
+
+    @pytest.mark.unittest
+    def test__covering_primary_key__should_drop_every_unique_constraint(
+            self,
+            db: SqlEngine
+    ):
+        """
+        Test that upgrading drops the unique constraints on opaque_token.
+
+        Databases migrated from the baseline may have a second, unnamed
+        unique constraint (token_opaque_token_key1), which should be dropped
+        as well, and restored when downgrading.
+
+        :param db: SqlEngine (required for getting a running PSQL instance)
+        """
+
+        # -- Arrange ---------------------------------------------------------
+
+        def migrate(*argv):
+            alembic.config.main(argv=[
+                '--raiseerr',
+                '--config=migrations/alembic.ini',
+                *argv,
+            ])
+
+        def unique_constraints():
+            with db.engine.connect() as connection:
+                return connection.exec_driver_sql(
+                    "SELECT conname FROM pg_constraint "
+                    "WHERE conrelid = 'token'::regclass AND contype = 'u' "
+                    "ORDER BY conname"
+                ).scalars().all()
+
+        os.chdir(os.getcwd() + '/src')
+
+        try:
+            migrate('upgrade', '7c454b8ab0d9')
+
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    'ALTER TABLE token ADD UNIQUE (opaque_token)')
+
+            # -- Act ---------------------------------------------------------
+
+            migrate('upgrade', '719de39f4ff3')
+            upgraded = unique_constraints()
+
+            migrate('downgrade', '7c454b8ab0d9')
+            downgraded = unique_constraints()
+
+        # -- Clean up --------------------------------------------------------
+
+        finally:
+            os.chdir('..')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert upgraded == []
+        assert downgraded == [
+            'token_opaque_token_key',
+            'token_opaque_token_key1',
+        ]
+
+    @pytest.mark.unittest
+    def test__native_uuid_keys__downgrade_should_restore_unique_constraints(
+            self,
+            db: SqlEngine
+    ):
+        """
+        Test that downgrading restores the unique constraints on the keys.
+
+        Upgrading drops the unique constraints duplicating the primary keys
+        of user and company (ie. company_id_key, which databases migrated
+        from the baseline may have), so downgrading should restore them.
+
+        :param db: SqlEngine (required for getting a running PSQL instance)
+        """
+
+        # -- Arrange ---------------------------------------------------------
+
+        def migrate(*argv):
+            alembic.config.main(argv=[
+                '--raiseerr',
+                '--config=migrations/alembic.ini',
+                *argv,
+            ])
+
+        def unique_constraints():
+            with db.engine.connect() as connection:
+                return connection.exec_driver_sql(
+                    "SELECT conname FROM pg_constraint "
+                    "WHERE conrelid IN ('\"user\"'::regclass, "
+                    "'company'::regclass, 'user_company'::regclass) "
+                    "AND contype = 'u' "
+                    "ORDER BY conname"
+                ).scalars().all()
+
+        os.chdir(os.getcwd() + '/src')
+
+        try:
+            migrate('upgrade', '80b23e473daa')
+
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    'ALTER TABLE company ADD UNIQUE (id)')
+
+            before = unique_constraints()
+
+            # -- Act ---------------------------------------------------------
+
+            migrate('upgrade', 'ec18afcdb199')
+            upgraded = unique_constraints()
+
+            migrate('downgrade', '80b23e473daa')
+            downgraded = unique_constraints()
+
+        # -- Clean up --------------------------------------------------------
+
+        finally:
+            os.chdir('..')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert 'company_id_key' in before
+        assert 'user_subject_key' in before
+        assert upgraded == ['company_tin_key', 'user_ssn_key']
+        assert downgraded == before
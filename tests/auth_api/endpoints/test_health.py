@@ -0,0 +1,43 @@
+"""Tests the readiness check."""
+import json
+import pytest
+from unittest.mock import patch
+from flask.testing import FlaskClient
+
+from auth_api.oidc import session
+
+
+class TestReadinessCheck(object):
+    """Tests the readiness check."""
+
+    @pytest.mark.integrationtest
+    def test__ready__jwks_not_required__should_return_200(
+            self,
+            client: FlaskClient,
+    ):
+        """Workers should be ready regardless of the JWKS by default."""
+
+        with patch.object(session.jwks, '_jwks', None):
+            r = client.get('/ready')
+
+        assert r.status_code == 200
+
+    @pytest.mark.integrationtest
+    @pytest.mark.parametrize('jwks, expected_status', (
+        (None, 503),
+        (json.dumps({'keys': []}), 200),
+    ))
+    def test__ready__jwks_required__should_return_expected_status(
+            self,
+            client: FlaskClient,
+            jwks,
+            expected_status: int,
+    ):
+        """Workers should not be ready until the JWKS has been fetched."""
+
+        with patch('auth_api.endpoints.health'
+                   '.OIDC_JWKS_REQUIRED_FOR_READINESS', True), \
+                patch.object(session.jwks, '_jwks', jwks):
+            r = client.get('/ready')
+
+        assert r.status_code == expected_status
@@ -306,15 +306,20 @@ class TestOidcCallbackEndpoints(object):
 
         # -- Act -------------------------------------------------------------
 
-        res = client.get(
-            path=callback_endpoint_path,
-            query_string={'state': state_encoded},
-        )
+        with patch('auth_api.endpoints.oidc.db_controller.queue_logout') \
+                as queue_logout:
+            res = client.get(
+                path=callback_endpoint_path,
+                query_string={'state': state_encoded},
+            )
 
         # -- Assert ----------------------------------------------------------
 
         assert res.status_code == 307
 
+        # The user is logged out at the Identity Provider (later)
+        assert queue_logout.call_args.kwargs['id_token'] == token.id_token
+
         assert_base_url(
             url=res.headers['Location'],
             expected_base_url=return_url,
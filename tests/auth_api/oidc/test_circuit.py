@@ -0,0 +1,194 @@
+"""Tests the circuit breaker around the OpenID Connect backend."""
+
+# Standard Library
+from unittest.mock import MagicMock
+from urllib.parse import parse_qs, urlsplit
+
+# Third party
+import pytest
+import requests
+from authlib.integrations.base_client import OAuthError
+from flask.testing import FlaskClient
+
+# First party
+from origin.tokens import TokenEncoder
+
+# Local
+from auth_api.circuit_breaker import CircuitBreaker, CircuitOpenError
+from auth_api.config import OIDC_LOGIN_CALLBACK_PATH
+from auth_api.deadline import DeadlineExceeded, deadline
+from auth_api.endpoints import AuthState
+from auth_api.oidc import oidc_backend
+from auth_api.oidc.circuit import CircuitBreakerBackend
+
+
+@pytest.fixture(scope='function')
+def backend() -> MagicMock:
+    """Return a mocked backend to wrap."""
+
+    return MagicMock()
+
+
+@pytest.fixture(scope='function')
+def circuit_backend(backend: MagicMock) -> CircuitBreakerBackend:
+    """Return a backend wrapping the mock, opening after 2 failures."""
+
+    return CircuitBreakerBackend(
+        backend=backend,
+        failure_rate=1,
+        window_size=2,
+        min_calls=2,
+        open_duration=30,
+    )
+
+
+def open_circuit(breaker: CircuitBreaker):
+    """Make calls which open the circuit."""
+
+    def fail():
+        raise RuntimeError('failed')
+
+    for _ in range(breaker.min_calls):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+class TestCircuitBreakerBackend:
+    """Tests CircuitBreakerBackend."""
+
+    @pytest.mark.unittest
+    def test__fetch_token__circuit_open__should_raise_without_calling(
+            self,
+            circuit_backend: CircuitBreakerBackend,
+            backend: MagicMock,
+    ):
+        """Fetching tokens should fail immediately while the IdP fails."""
+
+        backend.fetch_token.side_effect = RuntimeError('failed')
+
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                circuit_backend.fetch_token(code='code')
+
+        with pytest.raises(CircuitOpenError):
+            circuit_backend.fetch_token(code='code')
+
+        assert backend.fetch_token.call_count == 2
+
+    @pytest.mark.unittest
+    def test__fetch_token__errors_reported_by_idp__should_not_open(
+            self,
+            circuit_backend: CircuitBreakerBackend,
+            backend: MagicMock,
+    ):
+        """Errors reported by the IdP (ie. invalid code) are not failures."""
+
+        backend.fetch_token.side_effect = OAuthError('invalid_grant')
+
+        for _ in range(3):
+            with pytest.raises(OAuthError):
+                circuit_backend.fetch_token(code='code')
+
+        assert backend.fetch_token.call_count == 3
+
+    @pytest.mark.unittest
+    def test__fetch_token__timed_out_by_deadline__should_not_open(
+            self,
+            circuit_backend: CircuitBreakerBackend,
+            backend: MagicMock,
+    ):
+        """Timeouts shortened by the deadline are not failures of the IdP."""
+
+        backend.fetch_token.side_effect = requests.Timeout()
+
+        with deadline(-1):
+            for _ in range(3):
+                with pytest.raises(DeadlineExceeded):
+                    circuit_backend.fetch_token(code='code')
+
+        assert backend.fetch_token.call_count == 3
+
+    @pytest.mark.unittest
+    def test__fetch_token__timed_out_within_deadline__should_open(
+            self,
+            circuit_backend: CircuitBreakerBackend,
+            backend: MagicMock,
+    ):
+        """Timeouts with time left of the deadline are failures of the IdP."""
+
+        backend.fetch_token.side_effect = requests.Timeout()
+
+        with deadline(60):
+            for _ in range(2):
+                with pytest.raises(requests.Timeout):
+                    circuit_backend.fetch_token(code='code')
+
+            with pytest.raises(CircuitOpenError):
+                circuit_backend.fetch_token(code='code')
+
+        assert backend.fetch_token.call_count == 2
+
+    @pytest.mark.unittest
+    def test__logout__circuit_open__should_raise_without_calling(
+            self,
+            circuit_backend: CircuitBreakerBackend,
+            backend: MagicMock,
+    ):
+        """Logging out should fail immediately while the IdP fails."""
+
+        open_circuit(circuit_backend.breakers['logout'])
+
+        with pytest.raises(CircuitOpenError):
+            circuit_backend.logout('id-token')
+
+        backend.logout.assert_not_called()
+
+
+class TestOidcLoginCallbackCircuitOpen:
+    """Tests the login callback while the IdP's circuit is open."""
+
+    @pytest.mark.integrationtest
+    def test__circuit_open__should_redirect_with_e505_without_calling_idp(
+            self,
+            client: FlaskClient,
+            mock_fetch_token: MagicMock,
+            state_encoder: TokenEncoder[AuthState],
+    ):
+        """
+        The callback should fail immediately while the IdP is failing.
+
+        :param client: API client
+        :param mock_fetch_token: Mocked fetch_token() method @ OAuth2Session
+               object
+        :param state_encoder: AuthState encoder
+        """
+
+        # -- Arrange ---------------------------------------------------------
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+        )
+
+        breaker = oidc_backend.breakers['fetch_token']
+        open_circuit(breaker)
+
+        # -- Act -------------------------------------------------------------
+
+        try:
+            res = client.get(
+                path=OIDC_LOGIN_CALLBACK_PATH,
+                query_string={'state': state_encoder.encode(state)},
+            )
+        finally:
+            breaker.reset()
+
+        # -- Assert ----------------------------------------------------------
+
+        query = parse_qs(urlsplit(res.headers['Location']).query)
+
+        assert res.status_code == 307
+        assert query['error_code'] == ['E505']
+        mock_fetch_token.assert_not_called()
@@ -0,0 +1,423 @@
+"""Tests for caching the Identity Provider's JWKS."""
+
+# Standard Library
+import json
+import base64
+from unittest.mock import MagicMock, patch
+
+# Third party
+import pytest
+import requests
+import requests_mock
+from authlib.jose import JsonWebKey, jwk, jwt
+
+# Local
+from auth_api.oidc import OAuth2Session, SignaturgruppenBackend
+from auth_api.oidc.jwks import (
+    JwkSet,
+    JwksCache,
+    JwksRefresher,
+    get_kid,
+    get_kids,
+    get_max_age,
+)
+
+from ..keys import PRIVATE_KEY, PUBLIC_KEY
+
+
+JWKS_URL = 'http://idp.test/jwks'
+
+JWKS_1 = json.dumps({'keys': [{'kid': 'key1'}]})
+JWKS_2 = json.dumps({'keys': [{'kid': 'key1'}, {'kid': 'key2'}]})
+
+
+@pytest.fixture(scope='function')
+def session() -> OAuth2Session:
+    """Return a session with an empty JWKS cache."""
+
+    session = OAuth2Session(
+        jwk_endpoint=JWKS_URL,
+        api_logout_url='http://idp.test/logout',
+        client_id='client_id',
+        client_secret='client_secret',
+    )
+    session.jwks.default_ttl = 3600
+    session.jwks.refresh_interval = 60
+    session.jwks.grace_period = 600
+    return session
+
+
+@pytest.fixture(scope='function')
+def now():
+    """Patch the clock used by the JWKS cache (set now.return_value)."""
+
+    with patch('auth_api.oidc.jwks.time.monotonic') as monotonic:
+        monotonic.return_value = 1000
+        yield monotonic
+
+
+class TestGetJwk:
+    """Tests OAuth2Session.get_jwk()."""
+
+    @pytest.mark.unittest
+    def test__get_jwk__cached__should_not_fetch_again(
+            self,
+            session: OAuth2Session,
+            now,
+    ):
+        """JWKS should be fetched once within its TTL."""
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(JWKS_URL, text=JWKS_1)
+
+            assert session.get_jwk() == JWKS_1
+            now.return_value += 3599
+            assert session.get_jwk(kid='key1') == JWKS_1
+            assert mocker.call_count == 1
+
+    @pytest.mark.unittest
+    def test__get_jwk__expired__should_fetch_again(
+            self,
+            session: OAuth2Session,
+            now,
+    ):
+        """JWKS should be fetched again once its TTL has passed."""
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(JWKS_URL, [{'text': JWKS_1}, {'text': JWKS_2}])
+
+            assert session.get_jwk() == JWKS_1
+            now.return_value += 3600
+            assert session.get_jwk() == JWKS_2
+            assert mocker.call_count == 2
+
+    @pytest.mark.unittest
+    def test__get_jwk__cache_control_max_age__should_use_as_ttl(
+            self,
+            session: OAuth2Session,
+            now,
+    ):
+        """The IdP's Cache-Control header should override the default TTL."""
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(JWKS_URL, text=JWKS_1,
+                       headers={'Cache-Control': 'public, max-age=10'})
+
+            session.get_jwk()
+            now.return_value += 9
+            session.get_jwk()
+            assert mocker.call_count == 1
+
+            now.return_value += 1
+            session.get_jwk()
+            assert mocker.call_count == 2
+
+    @pytest.mark.unittest
+    def test__get_jwk__unknown_kid__should_refresh_once_per_interval(
+            self,
+            session: OAuth2Session,
+            now,
+    ):
+        """Unknown key IDs should trigger a refresh, but rate-limited."""
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(JWKS_URL, [{'text': JWKS_1}, {'text': JWKS_2}])
+
+            assert session.get_jwk(kid='key1') == JWKS_1
+
+            # Refreshed recently (when first fetched)
+            assert session.get_jwk(kid='key2') == JWKS_1
+            assert mocker.call_count == 1
+
+            now.return_value += 60
+            assert session.get_jwk(kid='key2') == JWKS_2
+            assert session.get_jwk(kid='bogus') == JWKS_2
+            assert mocker.call_count == 2
+
+    @pytest.mark.unittest
+    def test__get_jwk__idp_unreachable_within_grace__should_serve_stale(
+            self,
+            session: OAuth2Session,
+            now,
+    ):
+        """An expired JWKS should be served if the IdP is unreachable."""
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(JWKS_URL, [
+                {'text': JWKS_1},
+                {'exc': requests.exceptions.ConnectTimeout},
+                {'text': JWKS_2},
+            ])
+
+            session.get_jwk()
+            now.return_value += 3600 + 599
+            assert session.get_jwk() == JWKS_1
+            assert mocker.call_count == 2
+
+            # Backs off instead of retrying for every call
+            assert session.get_jwk() == JWKS_1
+            assert mocker.call_count == 2
+
+            now.return_value += 60
+            assert session.get_jwk() == JWKS_2
+            assert mocker.call_count == 3
+
+    @pytest.mark.unittest
+    def test__get_jwk__idp_unreachable_after_grace__should_raise(
+            self,
+            session: OAuth2Session,
+            now,
+    ):
+        """An expired JWKS should not be served after the grace period."""
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(JWKS_URL, [{'text': JWKS_1}, {'status_code': 503}])
+
+            session.get_jwk()
+            now.return_value += 3600 + 600
+
+            with pytest.raises(requests.exceptions.HTTPError):
+                session.get_jwk()
+
+
+def sign(kid=None) -> str:
+    """Return a JWT signed with the test key (with kid in its header)."""
+
+    header = {'alg': 'RS256'}
+
+    if kid:
+        header['kid'] = kid
+
+    return jwt.encode(
+        header=header,
+        payload={'sub': 'subject'},
+        key=jwk.dumps(PRIVATE_KEY, kty='RSA'),
+    ).decode()
+
+
+def public_jwk(**params) -> dict:
+    """Return the test public key as a JWK."""
+
+    return {**jwk.dumps(PUBLIC_KEY, kty='RSA'), **params}
+
+
+class TestJwkSet:
+    """Tests JwkSet."""
+
+    @pytest.mark.unittest
+    def test__decode__kid_in_set__should_verify_with_key(self):
+        """Tokens should be verified with the key matching their kid."""
+
+        key_set = JwkSet(json.dumps({'keys': [
+            JsonWebKey.generate_key('RSA', 2048).as_dict(kid='other'),
+            public_jwk(kid='key1'),
+        ]}))
+
+        assert 'key1' in key_set
+        assert jwt.decode(sign(kid='key1'), key=key_set)['sub'] == 'subject'
+
+    @pytest.mark.unittest
+    @pytest.mark.parametrize('kid', (None, 'key2'))
+    def test__decode__kid_not_in_set__should_raise(self, kid):
+        """Tokens with unknown (or without) kid should not be verified."""
+
+        key_set = JwkSet({'keys': [public_jwk(kid='key1')]})
+
+        assert 'key2' not in key_set
+
+        with pytest.raises(ValueError):
+            jwt.decode(sign(kid=kid), key=key_set)
+
+    @pytest.mark.unittest
+    @pytest.mark.parametrize('kid', (None, 'key1'))
+    def test__decode__single_jwk_without_kid__should_verify_with_it(self, kid):
+        """A single JWK without kid should be used for all tokens."""
+
+        key_set = JwkSet(public_jwk())
+
+        assert jwt.decode(sign(kid=kid), key=key_set)['sub'] == 'subject'
+
+
+class TestSignaturgruppenBackend:
+    """Tests the key set held by SignaturgruppenBackend."""
+
+    @pytest.mark.unittest
+    def test__get_key_set__jwks_unchanged__should_reuse_key_set(self):
+        """The keys should only be parsed again when the JWKS changes."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        session = MagicMock()
+        session.get_jwk.side_effect = [
+            json.dumps(public_jwk(kid='key1')),
+            json.dumps(public_jwk(kid='key1')),
+            json.dumps(public_jwk(kid='key2')),
+        ]
+
+        backend = SignaturgruppenBackend(
+            session=session,
+            authorization_endpoint='http://idp.test/authorize',
+            token_endpoint='http://idp.test/token',
+        )
+
+        # -- Act -------------------------------------------------------------
+
+        key_set_1 = backend.get_key_set(kid='key1')
+        key_set_2 = backend.get_key_set(kid='key1')
+        key_set_3 = backend.get_key_set(kid='key2')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert key_set_1 is key_set_2
+        assert key_set_3 is not key_set_1
+        assert 'key2' in key_set_3
+        session.get_jwk.assert_called_with(kid='key2')
+
+
+class TestJwksRefresher:
+    """Tests JwksRefresher."""
+
+    @pytest.fixture(scope='function')
+    def jwks(self) -> JwksCache:
+        """Return an empty cache, fetching a JWKS which expires in 300s."""
+
+        response = MagicMock(
+            content=JWKS_1.encode(),
+            headers={'Cache-Control': 'max-age=300'},
+        )
+
+        return JwksCache(
+            fetch=MagicMock(return_value=response),
+            default_ttl=3600,
+            refresh_interval=60,
+            grace_period=600,
+        )
+
+    @pytest.mark.unittest
+    def test__refresh_once__should_load_and_wait_until_before_expiry(
+            self,
+            jwks: JwksCache,
+            now,
+    ):
+        """The JWKS should be fetched and warmed, then refreshed early."""
+
+        warm = MagicMock()
+        refresher = JwksRefresher(jwks=jwks, warm=warm, lead_time=30)
+
+        assert refresher.refresh_once() == 300 - 30
+        assert refresher.loaded.is_set()
+        assert jwks.get() == JWKS_1
+        assert jwks.fetch.call_count == 1
+        warm.assert_called_once()
+
+    @pytest.mark.unittest
+    def test__refresh_once__short_ttl__should_wait_min_interval(
+            self,
+            jwks: JwksCache,
+            now,
+    ):
+        """The IdP should not be polled more often than min_interval."""
+
+        refresher = JwksRefresher(jwks=jwks, lead_time=299, min_interval=60)
+
+        assert refresher.refresh_once() == 60
+
+    @pytest.mark.unittest
+    def test__refresh_once__fetch_fails__should_wait_retry_interval(
+            self,
+            jwks: JwksCache,
+            now,
+    ):
+        """Failing to fetch the JWKS should be retried."""
+
+        jwks.fetch.side_effect = requests.exceptions.ConnectTimeout
+        refresher = JwksRefresher(jwks=jwks, retry_interval=5)
+
+        assert refresher.refresh_once() == 5
+        assert not refresher.loaded.is_set()
+
+    @pytest.mark.unittest
+    def test__refresh_once__fetch_fails_within_grace__should_wait_retry_interval(  # noqa: E501
+            self,
+            jwks: JwksCache,
+            now,
+    ):
+        """A failed refresh should be retried while serving the stale JWKS."""
+
+        refresher = JwksRefresher(jwks=jwks, min_interval=60, retry_interval=5)
+        refresher.refresh_once()
+
+        jwks.fetch.side_effect = requests.exceptions.ConnectTimeout
+        now.return_value += 300
+
+        assert refresher.refresh_once() == 5
+        assert jwks.get() == JWKS_1
+
+    @pytest.mark.unittest
+    def test__start__should_load_in_background(self, jwks: JwksCache):
+        """Starting the refresher should load the JWKS in the background."""
+
+        refresher = JwksRefresher(jwks=jwks)
+        refresher.start()
+
+        try:
+            assert refresher.loaded.wait(5)
+            assert jwks.loaded
+        finally:
+            refresher.stop()
+
+        assert not refresher.is_alive()
+
+
+class TestHelpers:
+    """Tests the helpers used by the JWKS cache."""
+
+    @pytest.mark.unittest
+    @pytest.mark.parametrize('cache_control, expected', (
+        (None, None),
+        ('public', None),
+        ('public, max-age=300', 300),
+        ('Max-Age="60"', 60),
+        ('no-cache', 0),
+        ('no-store, max-age=300', 0),
+    ))
+    def test__get_max_age__should_return_expected(
+            self,
+            cache_control,
+            expected,
+    ):
+        """Cache-Control header should be parsed."""
+
+        assert get_max_age(cache_control) == expected
+
+    @pytest.mark.unittest
+    @pytest.mark.parametrize('jwks, expected', (
+        (JWKS_2, {'key1', 'key2'}),
+        (json.dumps({'kty': 'RSA', 'kid': 'key1'}), {'key1'}),
+        (json.dumps({'kty': 'RSA'}), set()),
+        ('not json', set()),
+    ))
+    def test__get_kids__should_return_expected(self, jwks, expected):
+        """Key IDs should be read from a JWKS or a single JWK."""
+
+        assert get_kids(jwks) == expected
+
+    @pytest.mark.unittest
+    @pytest.mark.parametrize('header, expected', (
+        ({'alg': 'RS256', 'kid': 'key1'}, 'key1'),
+        ({'alg': 'RS256'}, None),
+        ({'alg': 'RS256', 'kid': 1}, None),
+    ))
+    def test__get_kid__should_return_expected(self, header, expected):
+        """Key ID should be read from the header of a JWT."""
+
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(header).encode()).decode().rstrip('=')
+
+        assert get_kid(f'{encoded}.payload.signature') == expected
+
+    @pytest.mark.unittest
+    def test__get_kid__invalid_token__should_return_none(self):
+        """Malformed tokens should not raise."""
+
+        assert get_kid('not a jwt') is None
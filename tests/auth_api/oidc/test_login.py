@@ -11,6 +11,7 @@ from origin.tokens import TokenEncoder
 
 # Local
 from auth_api.endpoints import AuthState
+from auth_api.endpoints.oidc import CALLBACK_NONCE_COOKIE_NAME
 
 # -- Helpers -----------------------------------------------------------------
 
@@ -76,6 +77,35 @@ class TestOidcLogin:
         assert actual_state.return_url == 'https://foobar.com/'
         assert actual_state.fe_url == 'https://spam.com/'
 
+    @pytest.mark.unittest
+    def test__should_set_random_callback_nonce_cookie(
+            self,
+            client: FlaskClient,
+    ):
+        """Each login should bind its callback to the browser with a nonce."""
+
+        # -- Act -------------------------------------------------------------
+
+        first, second = (
+            client.get(
+                path='/oidc/login',
+                query_string={
+                    'fe_url': 'https://spam.com/',
+                    'return_url': 'https://foobar.com/',
+                },
+            )
+            for _ in range(2)
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        cookies = [r.headers['Set-Cookie'] for r in (first, second)]
+
+        assert all(c.startswith(f'{CALLBACK_NONCE_COOKIE_NAME}=')
+                   for c in cookies)
+        assert all('HttpOnly' in c and 'Secure' in c for c in cookies)
+        assert cookies[0] != cookies[1]
+
     @pytest.mark.unittest
     def test__omit_parameter_return_url__should_return_status_400(
             self,
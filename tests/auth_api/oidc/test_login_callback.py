@@ -1,14 +1,18 @@
 # Standard Library
-from typing import Any, Dict
-from unittest.mock import MagicMock
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, ContextManager, Dict, Optional, Type
+from unittest.mock import MagicMock, patch
 from urllib.parse import parse_qs, urlsplit
 
 # Third party
 import pytest
+import requests
 import requests_mock
 from flask.testing import FlaskClient
 
 # First party
+from origin.api import Cookie, TemporaryRedirect
 from origin.api.testing import assert_base_url
 from origin.encrypt import aes256_decrypt
 from origin.tokens import TokenEncoder
@@ -19,8 +23,17 @@ from auth_api.config import (
     STATE_ENCRYPTION_SECRET,
 )
 from auth_api.db import db
-from auth_api.endpoints import AuthState
+from auth_api.deadline import DeadlineExceeded
+from auth_api.endpoints import AuthState, OpenIDCallbackEndpoint
+from auth_api.endpoints.oidc import (
+    CALLBACK_NONCE_COOKIE_NAME,
+    OidcCallbackParams,
+)
+from auth_api.models import DbRelationsOutbox, DbToken, DbUser
 from auth_api.queries import CompanyQuery, UserQuery
+from auth_api.sql_stats import SqlStats
+
+from .bases import OidcCallbackEndpointsSubjectKnownBase
 
 
 class TestOidcLoginCallbackSubjectUnknown:
@@ -127,7 +140,7 @@ class TestOidcLoginCallbackCreateRelations:
     """
 
     @pytest.mark.integrationtest
-    def test__user_does_not_exist__should_call_datasync_create_relations_endpoint(  # noqa: E501
+    def test__user_does_not_exist__should_queue_datasync_create_relations_request(  # noqa: E501
         self,
         client: FlaskClient,
         mock_session: db.Session,
@@ -140,11 +153,13 @@ class TestOidcLoginCallbackCreateRelations:
         token_tin: str,
     ):
         """
-        User does not exist and should call datasync create relations endpoint.
+        User does not exist and should queue a create relations request.
 
-        During creating of user and company the endpoint should, call the
-        datasync service in order to create relations between the user
-        and the user's meteringpoitns.
+        During creating of user and company the endpoint should queue a
+        request to the datasync service (in the relations outbox) in order
+        to create relations between the user and the user's meteringpoitns.
+        The request is sent afterwards by the outbox worker, so datasync
+        is not called during the login.
 
         :param client: API client
         :param requests_mock: Mocked datasync endpoint
@@ -168,11 +183,6 @@ class TestOidcLoginCallbackCreateRelations:
         mock_get_jwk.return_value = jwk_public
         mock_fetch_token.return_value = ip_token
 
-        expected_datasync_request_body = {
-            'tin': token_tin,
-            'ssn': None
-        }
-
         # -- Act --------------------------------------------------------------
 
         client.get(
@@ -182,9 +192,14 @@ class TestOidcLoginCallbackCreateRelations:
 
         # -- Assert -----------------------------------------------------------
 
-        assert requests_mock.call_count == 1
-        assert requests_mock.request_history[0].json() == \
-            expected_datasync_request_body
+        queued = mock_session.query(DbRelationsOutbox).one()
+        token = mock_session.query(DbToken).one()
+
+        assert requests_mock.call_count == 0
+        assert queued.tin == token_tin
+        assert queued.ssn is None
+        assert queued.internal_token == token.internal_token
+        assert queued.attempts == 0
 
     @pytest.mark.integrationtest
     def test__user_does_not_exist__should_create_new_user_in_database(  # noqa: E501
@@ -287,3 +302,482 @@ class TestOidcLoginCallbackCreateRelations:
         query = CompanyQuery(mock_session)
 
         assert query.count() == 1
+
+
+class TestOidcLoginCallbackCreateRelationsSubjectKnown(
+    OidcCallbackEndpointsSubjectKnownBase,
+):
+    """
+    Test that the callback endpoint only creates relations when needed.
+
+    Relations are not created again when a known user logs in, unless they
+    were created more than DATASYNC_RELATIONS_MAX_AGE seconds ago.
+    """
+
+    @pytest.mark.integrationtest
+    @pytest.mark.parametrize('relations_age, expected_queued', [
+        (None, 1),
+        (timedelta(minutes=5), 0),
+        (timedelta(days=2), 1),
+    ])
+    def test__should_only_queue_relations_if_missing_or_stale(
+        self,
+        client: FlaskClient,
+        mock_session: db.Session,
+        requests_mock: requests_mock.Adapter,
+        internal_subject: str,
+        state_encoded: str,
+        relations_age: timedelta,
+        expected_queued: int,
+    ):
+        """
+        Queue relations only if never created, or created too long ago.
+
+        :param client: API client
+        :param mock_session: Mocked database session
+        :param requests_mock: Mocked datasync endpoint
+        :param internal_subject: Internal subject of the known user
+        :param state_encoded: AuthState, encoded
+        :param relations_age: Time since relations were created (if ever)
+        :param expected_queued: Expected number of queued requests
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        if relations_age is not None:
+            mock_session.query(DbUser) \
+                .filter(DbUser.subject == internal_subject) \
+                .update({
+                    'relations_created':
+                        datetime.now(tz=timezone.utc) - relations_age,
+                })
+            mock_session.commit()
+
+        # -- Act --------------------------------------------------------------
+
+        res = client.get(
+            path=OIDC_LOGIN_CALLBACK_PATH,
+            query_string={'state': state_encoded},
+        )
+
+        # -- Assert -----------------------------------------------------------
+
+        assert res.status_code == 307
+        assert mock_session.query(DbRelationsOutbox).count() == \
+            expected_queued
+        assert requests_mock.call_count == 0
+
+
+class TestOidcLoginCallbackSqlBudget:
+    """
+    Test the number of SQL statements executed by the callback endpoint.
+
+    Logging in should execute a small, fixed number of statements, no
+    matter if the user exists or not.
+    """
+
+    @pytest.mark.integrationtest
+    def test__user_does_not_exist__should_execute_at_most_9_statements(
+        self,
+        client: FlaskClient,
+        mock_session: db.Session,
+        mock_get_jwk: MagicMock,
+        mock_fetch_token: MagicMock,
+        state_encoder: TokenEncoder[AuthState],
+        jwk_public: str,
+        ip_token: Dict[str, Any],
+        sql_budget: Callable[..., ContextManager[SqlStats]],
+    ):
+        """
+        Insert the user, external user, company and membership as well.
+
+        The external subject is only looked up once, as creating the user
+        reuses the callback's lookup.
+
+        :param client: API client
+        :param mock_session: Mocked database session
+        :param mock_get_jwk: Mocked get_jwk() method @ OAuth2Session object
+        :param mock_fetch_token: Mocked fetch_token() method @ OAuth2Session
+               object
+        :param state_encoder: AuthState encoder
+        :param jwk_public: Mocked public key from Identity Provider
+        :param ip_token: Mocked token from Identity Provider (unencoded)
+        :param sql_budget: Asserts the number of SQL statements executed
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+            terms_accepted=True,
+        )
+
+        mock_get_jwk.return_value = jwk_public
+        mock_fetch_token.return_value = ip_token
+
+        # -- Act --------------------------------------------------------------
+
+        with sql_budget(statements=9):
+            res = client.get(
+                path=OIDC_LOGIN_CALLBACK_PATH,
+                query_string={'state': state_encoder.encode(state)},
+            )
+
+        # -- Assert -----------------------------------------------------------
+
+        assert res.status_code == 307
+        assert UserQuery(mock_session).count() == 1
+
+
+class TestOidcLoginCallbackSqlBudgetSubjectKnown(
+    OidcCallbackEndpointsSubjectKnownBase,
+):
+    """Test the number of SQL statements executed when a known user logs in."""
+
+    @pytest.mark.integrationtest
+    def test__user_exists__should_execute_at_most_4_statements(
+        self,
+        client: FlaskClient,
+        mock_session: db.Session,
+        internal_subject: str,
+        state_encoded: str,
+        sql_budget: Callable[..., ContextManager[SqlStats]],
+    ):
+        """
+        Look up the user and company, and insert login record and token.
+
+        Relations were created recently, so they are not queued.
+
+        :param client: API client
+        :param mock_session: Mocked database session
+        :param internal_subject: Internal subject of the known user
+        :param state_encoded: AuthState, encoded
+        :param sql_budget: Asserts the number of SQL statements executed
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        mock_session.query(DbUser) \
+            .filter(DbUser.subject == internal_subject) \
+            .update({'relations_created': datetime.now(tz=timezone.utc)})
+        mock_session.commit()
+
+        # -- Act --------------------------------------------------------------
+
+        with sql_budget(statements=4):
+            res = client.get(
+                path=OIDC_LOGIN_CALLBACK_PATH,
+                query_string={'state': state_encoded},
+            )
+
+        # -- Assert -----------------------------------------------------------
+
+        assert res.status_code == 307
+
+
+class TestOidcLoginCallbackReplayed:
+    """
+    Tests that replayed callbacks do not exchange the code again.
+
+    Browsers and proxies may replay the callback (same code and state),
+    ie. on refresh or double-submit. The code can only be exchanged once,
+    so replays by the browser which started the login (same nonce cookie)
+    must reuse the outcome of the first callback.
+    """
+
+    @pytest.fixture(scope='function')
+    def query_string(
+        self,
+        mock_get_jwk: MagicMock,
+        mock_fetch_token: MagicMock,
+        state_encoder: TokenEncoder[AuthState],
+        jwk_public: str,
+        ip_token: Dict[str, Any],
+    ) -> Dict[str, str]:
+        """
+        Return the query string of a callback after a successful login.
+
+        :param mock_get_jwk: Mocked get_jwk() method @ OAuth2Session object
+        :param mock_fetch_token: Mocked fetch_token() method @ OAuth2Session
+               object
+        :param state_encoder: AuthState encoder
+        :param jwk_public: Mocked public key from Identity Provider
+        :param ip_token: Mocked token from Identity Provider (unencoded)
+        """
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+            terms_accepted=True,
+        )
+
+        mock_get_jwk.return_value = jwk_public
+        mock_fetch_token.return_value = ip_token
+
+        return {
+            'state': state_encoder.encode(state),
+            'code': 'authorization-code',
+        }
+
+    @pytest.mark.integrationtest
+    def test__callback_replayed__should_reuse_outcome_without_fetching_token(
+        self,
+        client: FlaskClient,
+        mock_session: db.Session,
+        mock_fetch_token: MagicMock,
+        query_string: Dict[str, str],
+    ):
+        """
+        A replayed callback should get the same redirect and cookie.
+
+        :param client: API client
+        :param mock_session: Mocked database session
+        :param mock_fetch_token: Mocked fetch_token() method @ OAuth2Session
+               object
+        :param query_string: Query string of the callback
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        client.set_cookie('localhost', CALLBACK_NONCE_COOKIE_NAME, 'nonce')
+
+        # -- Act --------------------------------------------------------------
+
+        first, second = (
+            client.get(OIDC_LOGIN_CALLBACK_PATH, query_string=query_string)
+            for _ in range(2)
+        )
+
+        # -- Assert -----------------------------------------------------------
+
+        assert mock_fetch_token.call_count == 1
+        assert second.status_code == first.status_code == 307
+        assert second.headers['Location'] == first.headers['Location']
+        assert second.headers['Set-Cookie'] == first.headers['Set-Cookie']
+        assert mock_session.query(DbToken).count() == 1
+
+    @pytest.mark.integrationtest
+    @pytest.mark.parametrize('replay_nonce', [None, 'another-nonce'])
+    def test__callback_replayed_by_another_browser__should_not_reuse_outcome(
+        self,
+        client: FlaskClient,
+        mock_session: db.Session,
+        mock_fetch_token: MagicMock,
+        query_string: Dict[str, str],
+        replay_nonce: Optional[str],
+    ):
+        """
+        A callback replayed without the nonce cookie should not get the token.
+
+        The code is exchanged again instead, which the Identity Provider
+        refuses (here it is mocked to succeed).
+
+        :param client: API client
+        :param mock_session: Mocked database session
+        :param mock_fetch_token: Mocked fetch_token() method @ OAuth2Session
+               object
+        :param query_string: Query string of the callback
+        :param replay_nonce: Nonce cookie of the replaying browser (if any)
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        client.set_cookie('localhost', CALLBACK_NONCE_COOKIE_NAME, 'nonce')
+        first = client.get(
+            OIDC_LOGIN_CALLBACK_PATH, query_string=query_string)
+
+        client.delete_cookie('localhost', CALLBACK_NONCE_COOKIE_NAME)
+        if replay_nonce is not None:
+            client.set_cookie(
+                'localhost', CALLBACK_NONCE_COOKIE_NAME, replay_nonce)
+
+        # -- Act --------------------------------------------------------------
+
+        second = client.get(
+            OIDC_LOGIN_CALLBACK_PATH, query_string=query_string)
+
+        # -- Assert -----------------------------------------------------------
+
+        assert mock_fetch_token.call_count == 2
+        assert second.headers['Set-Cookie'] != first.headers['Set-Cookie']
+
+    @pytest.mark.integrationtest
+    def test__callback_failed__should_not_reuse_outcome(
+        self,
+        client: FlaskClient,
+        mock_session: db.Session,
+        mock_fetch_token: MagicMock,
+        query_string: Dict[str, str],
+    ):
+        """
+        A callback which failed should not be reused when replayed.
+
+        :param client: API client
+        :param mock_session: Mocked database session
+        :param mock_fetch_token: Mocked fetch_token() method @ OAuth2Session
+               object
+        :param query_string: Query string of the callback
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        client.set_cookie('localhost', CALLBACK_NONCE_COOKIE_NAME, 'nonce')
+        mock_fetch_token.side_effect = Exception('Transient IdP failure')
+
+        # -- Act --------------------------------------------------------------
+
+        first, second = (
+            client.get(OIDC_LOGIN_CALLBACK_PATH, query_string=query_string)
+            for _ in range(2)
+        )
+
+        # -- Assert -----------------------------------------------------------
+
+        assert mock_fetch_token.call_count == 2
+        assert 'error_code=E505' in first.headers['Location']
+        assert 'error_code=E505' in second.headers['Location']
+
+    @pytest.mark.unittest
+    def test__callback_replayed_while_in_flight__should_wait_for_outcome(self):
+        """A callback replayed while the first is in flight should wait."""
+
+        # -- Arrange ----------------------------------------------------------
+
+        endpoint = OpenIDCallbackEndpoint(url='https://auth.test/callback')
+        request = OidcCallbackParams(state='state', code='in-flight-code')
+        context = MagicMock(cookies={CALLBACK_NONCE_COOKIE_NAME: 'nonce'})
+        outcome = TemporaryRedirect(
+            url='https://redirect-here.com/',
+            cookies=(Cookie(name='token', value='opaque-token'),),
+        )
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def handle_callback(request: OidcCallbackParams):
+            started.set()
+            release.wait(timeout=10)
+            return outcome
+
+        def replay():
+            results.append(endpoint.handle_request(
+                request=request,
+                context=context,
+            ))
+
+        # -- Act --------------------------------------------------------------
+
+        with patch.object(endpoint, 'handle_callback') as mock:
+            mock.side_effect = handle_callback
+
+            first = threading.Thread(target=replay)
+            first.start()
+            started.wait(timeout=10)
+
+            second = threading.Thread(target=replay)
+            second.start()
+            release.set()
+
+            first.join(timeout=10)
+            second.join(timeout=10)
+
+        # -- Assert -----------------------------------------------------------
+
+        assert mock.call_count == 1
+        assert results == [outcome, outcome]
+
+
+class TestOidcLoginCallbackDeadline:
+    """
+    Tests that the callback endpoint fails fast when dependencies are slow.
+
+    Calls to the Identity Provider must complete within the callback's
+    deadline, otherwise the client is redirected with error code E505,
+    and no token is committed.
+    """
+
+    @pytest.mark.integrationtest
+    def test__deadline_exhausted__should_redirect_with_e505_without_calls(
+        self,
+        client: FlaskClient,
+        mock_session: db.Session,
+        requests_mock: requests_mock.Adapter,
+        mock_get_jwk: MagicMock,
+        mock_fetch_token: MagicMock,
+        state_encoder: TokenEncoder[AuthState],
+    ):
+        """
+        No calls should be made once the deadline has passed.
+
+        :param client: API client
+        :param mock_session: Mocked database session
+        :param requests_mock: Mocked datasync endpoint
+        :param mock_get_jwk: Mocked get_jwk() method @ OAuth2Session object
+        :param mock_fetch_token: Mocked fetch_token() method @ OAuth2Session
+               object
+        :param state_encoder: AuthState encoder
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+            terms_accepted=True,
+        )
+
+        # -- Act --------------------------------------------------------------
+
+        with patch('auth_api.endpoints.oidc.OIDC_CALLBACK_DEADLINE', 0):
+            res = client.get(
+                path=OIDC_LOGIN_CALLBACK_PATH,
+                query_string={'state': state_encoder.encode(state)},
+            )
+
+        # -- Assert -----------------------------------------------------------
+
+        query = parse_qs(urlsplit(res.headers['Location']).query)
+
+        assert res.status_code == 307
+        assert query['error_code'] == ['E505']
+        assert mock_fetch_token.call_count == 0
+        assert requests_mock.call_count == 0
+
+    @pytest.mark.unittest
+    @pytest.mark.parametrize('exception', [
+        DeadlineExceeded,
+        requests.exceptions.ReadTimeout,
+        requests.exceptions.ConnectTimeout,
+    ])
+    def test__fetch_token_times_out__should_raise_to_roll_back(
+        self,
+        exception: Type[Exception],
+    ):
+        """
+        Timeouts fetching the token should not be turned into a redirect.
+
+        They are raised to handle_callback(), which rolls back the
+        transaction before redirecting with error code E505.
+
+        :param exception: Exception raised when fetching the token
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        endpoint = OpenIDCallbackEndpoint(url='https://auth.test/callback')
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+        )
+
+        # -- Act & Assert -----------------------------------------------------
+
+        with patch('auth_api.endpoints.oidc.oidc_backend.fetch_token') as mock:
+            mock.side_effect = exception()
+
+            with pytest.raises(exception):
+                endpoint.on_oidc_flow_succeeded(
+                    state=state,
+                    params=OidcCallbackParams(state='state', code='code'),
+                    session=MagicMock(),
+                )
@@ -2,6 +2,7 @@
 
 # Standard Library
 from datetime import datetime, timedelta
+from uuid import uuid4
 
 # Third party
 import pytest
@@ -11,6 +12,7 @@ from flask.testing import FlaskClient
 # First party
 from origin.api.testing import CookieTester
 from origin.auth import TOKEN_COOKIE_NAME
+from origin.encrypt import aes256_encrypt
 from origin.models.auth import InternalToken
 from origin.tokens import TokenEncoder
 
@@ -21,9 +23,11 @@ from auth_api.config import (
     TOKEN_COOKIE_PATH,
     INVALIDATE_PENDING_LOGIN_PATH,
     OIDC_API_LOGOUT_URL,
+    STATE_ENCRYPTION_SECRET,
 )
 from auth_api.db import db
-from auth_api.models import DbToken
+from auth_api.models import DbLogoutOutbox, DbToken, DbTokenIdToken
+from auth_api.outbox import process_logouts
 from auth_api.queries import TokenQuery
 from auth_api.state import AuthState
 
@@ -91,13 +95,15 @@ class TestOIDCEndpoint:
             oidc_adapter: requests_mock.Adapter,
             internal_token_encoded: str,
             opaque_token: str,
+            opaque_token_cookie: str,
             id_token: str,
     ):
         """
         Call OIDC endpoint with correct body on logout.
 
         When logging out, this is tests that the HTTP request payload
-        sent to the OIDC logout endpoint, is actually correct.
+        sent to the OIDC logout endpoint (by the logout worker), is
+        actually correct.
         """
 
         # -- Arrange ---------------------------------------------------------
@@ -106,7 +112,7 @@ class TestOIDCEndpoint:
         client.set_cookie(
             server_name='domain.com',
             key=TOKEN_COOKIE_NAME,
-            value=opaque_token,
+            value=opaque_token_cookie,
         )
 
         # -- Act -------------------------------------------------------------
@@ -118,6 +124,8 @@ class TestOIDCEndpoint:
             }
         )
 
+        process_logouts()
+
         # -- Assert ----------------------------------------------------------
 
         assert oidc_adapter.call_count == 1
@@ -126,6 +134,54 @@ class TestOIDCEndpoint:
         # sent to the OIDC logout url is correct
         assert oidc_adapter.last_request.json() == {'id_token': id_token}
 
+    @pytest.mark.integrationtest
+    def test__logout__idp_fails__should_log_out_locally_and_retry_later(
+            self,
+            client: FlaskClient,
+            seeded_session: db.Session,
+            request_mocker: requests_mock.Mocker,
+            internal_token_encoded: str,
+            opaque_token: str,
+            opaque_token_cookie: str,
+    ):
+        """
+        Logging out should not wait for, or fail because of, the IdP.
+
+        The token is deleted immediately, and the logout at the IdP is
+        kept in the outbox, to retry it later.
+        """
+
+        # -- Arrange ---------------------------------------------------------
+
+        adapter = request_mocker.post(OIDC_API_LOGOUT_URL, status_code=500)
+
+        client.set_cookie(
+            server_name='domain.com',
+            key=TOKEN_COOKIE_NAME,
+            value=opaque_token_cookie,
+        )
+
+        # -- Act -------------------------------------------------------------
+
+        response = client.post(
+            path='/logout',
+            headers={
+                'Authorization': 'Bearer: ' + internal_token_encoded
+            }
+        )
+
+        process_logouts()
+
+        # -- Assert ----------------------------------------------------------
+
+        seeded_session.expire_all()
+        queued = seeded_session.query(DbLogoutOutbox).one()
+
+        assert response.status_code == 200
+        assert adapter.call_count == 1
+        assert seeded_session.query(DbToken).count() == 0
+        assert queued.attempts == 1
+
     @pytest.mark.integrationtest
     def test__logout_with_invalid_token__does_not_call_oidc(
             self,
@@ -215,6 +271,7 @@ class TestDatabaseTokens:
             seeded_session: db.Session,
             oidc_adapter: requests_mock.Adapter,
             opaque_token: str,
+            opaque_token_cookie: str,
             id_token: str,
             internal_token_encoded: str,
     ):
@@ -229,7 +286,7 @@ class TestDatabaseTokens:
 
         # Add new token record in the database
         # that's not supposed to get deleted
-        opaque_token_2 = 'opaque_token_test'
+        opaque_token_2 = str(uuid4())
 
         seeded_session.add(DbToken(
             subject='subject',
@@ -246,7 +303,7 @@ class TestDatabaseTokens:
         client.set_cookie(
             server_name='domain.com',
             key=TOKEN_COOKIE_NAME,
-            value=opaque_token,
+            value=opaque_token_cookie,
         )
 
         # -- Act -------------------------------------------------------------
@@ -268,6 +325,9 @@ class TestDatabaseTokens:
             .has_opaque_token(opaque_token_2) \
             .exists()
 
+        assert seeded_session.query(DbTokenIdToken.opaque_token) \
+            .all() == [(opaque_token_2,)]
+
 
 class TestHTTPResponse:
     """Tests the HTTP response returned by the endpoint."""
@@ -279,6 +339,7 @@ class TestHTTPResponse:
             oidc_adapter: requests_mock.Adapter,
             internal_token_encoded: str,
             opaque_token: str,
+            opaque_token_cookie: str,
     ):
         """On logout success the returned cookie is expired."""
 
@@ -288,7 +349,7 @@ class TestHTTPResponse:
         client.set_cookie(
             server_name='domain.com',
             key=TOKEN_COOKIE_NAME,
-            value=opaque_token,
+            value=opaque_token_cookie,
         )
 
         # -- Act -------------------------------------------------------------
@@ -331,6 +392,7 @@ class TestHTTPResponse:
             oidc_adapter: requests_mock.Adapter,
             internal_token_encoded: str,
             opaque_token: str,
+            opaque_token_cookie: str,
     ):
         """When logging out, test that the response body is correct."""
 
@@ -340,7 +402,7 @@ class TestHTTPResponse:
         client.set_cookie(
             server_name='domain.com',
             key=TOKEN_COOKIE_NAME,
-            value=opaque_token,
+            value=opaque_token_cookie,
         )
 
         # -- Act -------------------------------------------------------------
@@ -359,6 +421,7 @@ class TestHTTPResponse:
     def test__invalidate_succeeds__returned_status_200(
         self,
         client: FlaskClient,
+        mock_session: db.Session,
         id_token: str,
         an_url: str,
         state_encoder: TokenEncoder[AuthState],
@@ -369,7 +432,7 @@ class TestHTTPResponse:
         state = AuthState(
             fe_url=an_url,
             return_url=an_url,
-            id_token=id_token,
+            id_token=aes256_encrypt(id_token, STATE_ENCRYPTION_SECRET),
         )
 
         state_encoded = state_encoder.encode(state)
@@ -385,7 +448,11 @@ class TestHTTPResponse:
 
         # -- Assert ----------------------------------------------------------
 
-        assert oidc_adapter.call_count == 1
+        queued = mock_session.query(DbLogoutOutbox).one()
+
+        # The id_token is encrypted in the state, but queued decrypted
+        assert oidc_adapter.call_count == 0
+        assert queued.id_token == id_token
 
         assert response.status_code == 200
 
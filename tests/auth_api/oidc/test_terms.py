@@ -12,6 +12,7 @@ from origin.api.testing import (
 )
 
 from auth_api.db import db
+from auth_api.models import DbLogoutOutbox
 from auth_api.state import AuthState
 
 
@@ -243,7 +244,9 @@ class TestTermsDecline:
 
         # -- Assert -----------------------------------------------------------
 
-        assert oidc_adapter.call_count == 1
+        # The user is logged out at the Identity Provider by the logout worker
+        assert oidc_adapter.call_count == 0
+        assert mock_session.query(DbLogoutOutbox).count() == 1
 
         assert res.status_code == 200
 
@@ -1,16 +1,19 @@
 # Standard Library
+import threading
 from typing import Any, Dict
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from uuid import uuid4
 from auth_api.config import DATASYNC_BASE_URL, DATASYNC_CREATE_RELATIONS_PATH
 # Third party
 import pytest
 import requests_mock
 # Local
+from auth_api.controller import db_controller
 from auth_api.db import db
 from auth_api.endpoints import AuthState
-from auth_api.models import DbExternalUser, DbUser
+from auth_api.models import DbCompany, DbExternalUser, DbUser, DbUserCompany
 from auth_api.queries import UserQuery
+from auth_api.sql_stats import count_statements
 from auth_api.user import create_or_get_user
 
 # -- Tests --------------------------------------------------------------------
@@ -173,6 +176,154 @@ class TestCreateUser:
         # Asser that it returns the existing user
         assert internal_subject == user.subject
 
+    @pytest.mark.integrationtest
+    def test__create_user__when_first_logins_are_concurrent__it_should_insert_one_user(  # noqa: E501
+        self,
+        mock_session: db.Session,
+        token_tin: str,
+        token_idp: str,
+        token_subject: str,
+        id_token_encrypted: str,
+    ):
+        """
+        Two first logins by the same external user run concurrently.
+
+        Both look up the external user before either has created it, and
+        should end up with the same (single) user.
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+            tin=token_tin,
+            id_token=id_token_encrypted,
+            terms_accepted=True,
+            terms_version='0.1',
+            identity_provider=token_idp,
+            external_subject=token_subject,
+        )
+
+        looked_up = threading.Barrier(2, timeout=10)
+        subjects = []
+        errors = []
+
+        def get_user_by_external_subject(**kwargs):
+            user = get_user(**kwargs)
+            looked_up.wait()
+            return user
+
+        def login():
+            session = db.make_session()
+
+            try:
+                user = create_or_get_user(session=session, state=state)
+                session.commit()
+                subjects.append(user.subject)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                session.close()
+
+        get_user = db_controller.get_user_by_external_subject
+        threads = [threading.Thread(target=login) for _ in range(2)]
+
+        # -- Act --------------------------------------------------------------
+
+        with patch('auth_api.user.db_controller.get_user_by_external_subject',
+                   side_effect=get_user_by_external_subject):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # -- Assert -----------------------------------------------------------
+
+        assert errors == []
+        assert len(subjects) == 2
+        assert subjects[0] == subjects[1]
+        assert UserQuery(mock_session).count() == 1
+        assert mock_session.query(DbExternalUser).count() == 1
+
+    @pytest.mark.integrationtest
+    def test__create_user__when_already_looked_up__it_should_not_look_up_again(  # noqa: E501
+        self,
+        mock_session: db.Session,
+        token_tin: str,
+        token_idp: str,
+        token_subject: str,
+        id_token_encrypted: str,
+    ):
+        """The caller's lookup of the external user should be reused."""
+
+        # -- Arrange ----------------------------------------------------------
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+            tin=token_tin,
+            id_token=id_token_encrypted,
+            terms_accepted=True,
+            terms_version='0.1',
+            identity_provider=token_idp,
+            external_subject=token_subject,
+        )
+
+        # -- Act --------------------------------------------------------------
+
+        with patch('auth_api.user.db_controller.get_user_by_external_subject') as get_user:  # noqa: E501
+            user = create_or_get_user(
+                session=mock_session,
+                state=state,
+                look_up=False,
+            )
+
+        # -- Assert -----------------------------------------------------------
+
+        assert get_user.call_count == 0
+        assert mock_session.query(DbExternalUser) \
+            .filter_by(subject=user.subject) \
+            .count() == 1
+
+    @pytest.mark.integrationtest
+    def test__create_user__should_not_commit_the_session(
+        self,
+        mock_session: db.Session,
+        token_tin: str,
+        token_idp: str,
+        token_subject: str,
+        id_token_encrypted: str,
+    ):
+        """The user should be written in the caller's transaction."""
+
+        # -- Arrange ----------------------------------------------------------
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+            tin=token_tin,
+            id_token=id_token_encrypted,
+            terms_accepted=True,
+            terms_version='0.1',
+            identity_provider=token_idp,
+            external_subject=token_subject,
+        )
+
+        # -- Act --------------------------------------------------------------
+
+        create_or_get_user(
+            session=mock_session,
+            state=state,
+        )
+
+        mock_session.rollback()
+
+        # -- Assert -----------------------------------------------------------
+
+        assert UserQuery(mock_session).count() == 0
+        assert mock_session.query(DbExternalUser).count() == 0
+
     @pytest.mark.integrationtest
     def test__create_user__when_terms_have_not_been_accepted__it_should_not_insert_a_user(  # noqa: E501
         self,
@@ -214,3 +365,73 @@ class TestCreateUser:
         # Querying the db to make sure a user has not been created
         assert UserQuery(mock_session) \
             .count() == 0
+
+
+class TestGetOrCreateCompany:
+    """Tests cases when a company is looked up (or created) by tin."""
+
+    @pytest.mark.integrationtest
+    def test__get_or_create_company__when_company_exists__it_should_return_it_without_updating_it(  # noqa: E501
+        self,
+        mock_session: db.Session,
+    ):
+        """An existing company should be selected, not upserted."""
+
+        # -- Arrange ----------------------------------------------------------
+
+        company = db_controller.create_company(
+            session=mock_session,
+            tin='12345678',
+        )
+        mock_session.commit()
+
+        # -- Act --------------------------------------------------------------
+
+        with count_statements() as counter:
+            existing = db_controller.get_or_create_company(
+                session=mock_session,
+                tin='12345678',
+            )
+
+        # -- Assert -----------------------------------------------------------
+
+        assert existing.id == company.id
+        assert counter.rows == 1
+        assert mock_session.query(DbCompany).count() == 1
+
+
+class TestAttachUserToCompany:
+    """Tests cases when a user is added to a company."""
+
+    @pytest.mark.integrationtest
+    def test__attach_user_to_company__when_already_attached__it_should_not_insert_twice(  # noqa: E501
+        self,
+        mock_session: db.Session,
+    ):
+        """Attaching a user to a company twice should add it only once."""
+
+        # -- Arrange ----------------------------------------------------------
+
+        user = db_controller.create_user(session=mock_session)
+        company = db_controller.create_company(
+            session=mock_session,
+            tin='12345678',
+        )
+
+        # -- Act --------------------------------------------------------------
+
+        for _ in range(2):
+            db_controller.attach_user_to_company(
+                session=mock_session,
+                company=company,
+                user=user,
+            )
+
+        mock_session.commit()
+
+        # -- Assert -----------------------------------------------------------
+
+        membership = mock_session.query(DbUserCompany).one()
+
+        assert membership.company_id == company.id
+        assert membership.user_id == user.subject
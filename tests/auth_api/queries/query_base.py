@@ -17,37 +17,37 @@ from datetime import datetime, timezone, timedelta
 # -- Fixtures ----------------------------------------------------------------
 
 DB_USER_1 = {
-    "subject": 'SUBJECT_1',
+    "subject": str(uuid4()),
     "ssn": "SSN_1",
     "companies": [],
 }
 
 DB_USER_2 = {
-    "subject": 'SUBJECT_2',
+    "subject": str(uuid4()),
     "ssn": "SSN_2",
     "companies": [],
 }
 
 DB_USER_3 = {
-    "subject": 'SUBJECT_3',
+    "subject": str(uuid4()),
     "ssn": "SSN_3",
     "companies": [],
 }
 
 DB_COMPANY_1 = {
-    "id": "COMPANY_1",
+    "id": str(uuid4()),
     "tin": "TIN_1",
     "users": [DB_USER_1],
 }
 
 DB_COMPANY_2 = {
-    "id": "COMPANY_2",
+    "id": str(uuid4()),
     "tin": "TIN_2",
     "users": [DB_USER_2],
 }
 
 DB_COMPANY_3 = {
-    "id": "COMPANY_3",
+    "id": str(uuid4()),
     "tin": "TIN_3",
     "users": [DB_USER_3],
 }
@@ -58,19 +58,19 @@ DB_USER_2['companies'] = [DB_COMPANY_2]
 DB_USER_3['companies'] = [DB_COMPANY_3]
 
 EXTERNAL_USER_4 = {
-    "subject": 'SUBJECT_1',
+    "subject": DB_USER_1['subject'],
     "identity_provider": "mitid",
     "external_subject": 'SUBJECT_4'
 }
 
 EXTERNAL_USER_5 = {
-    "subject": 'SUBJECT_1',
+    "subject": DB_USER_1['subject'],
     "identity_provider": "nemid",
     "external_subject": 'SUBJECT_5'
 }
 
 EXTERNAL_USER_6 = {
-    "subject": 'SUBJECT_3',
+    "subject": DB_USER_3['subject'],
     "identity_provider": "nemid",
     "external_subject": 'SUBJECT_6'
 }
@@ -1,4 +1,5 @@
 import pytest
+from uuid import uuid4
 
 from auth_api.db import db
 from auth_api.models import DbCompany
@@ -36,20 +37,26 @@ class TestCompanyQueries(TestQueryBase):
         assert fetched_company is not None
         assert fetched_company.id == company['id']
 
+    @pytest.mark.parametrize('company_id', [
+        str(uuid4()),
+        'THIS_ID_DOES_NOT_EXIST',  # Not a valid UUID
+    ])
     def test__has_id__id_does_not_exists__return_none(
         self,
         seeded_session: db.Session,
+        company_id: str,
     ):
         """
         If company with id does not exist return none.
 
         :param seeded_session: Mocked database session
+        :param company_id: Id which does not exist
         """
 
         # -- Act -------------------------------------------------------------
 
         fetched_company: DbCompany = CompanyQuery(seeded_session) \
-            .has_id("THIS_ID_DOES_NOT_EXIST") \
+            .has_id(company_id) \
             .one_or_none()
 
         # -- Assert ----------------------------------------------------------
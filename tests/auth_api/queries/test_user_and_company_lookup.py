@@ -0,0 +1,78 @@
+import pytest
+from typing import Optional
+
+from auth_api.db import db
+from auth_api.queries import USER_AND_COMPANY_LOOKUP
+from tests.auth_api.queries.query_base import (
+    DB_COMPANY_1,
+    DB_COMPANY_3,
+    EXTERNAL_USER_4,
+    EXTERNAL_USER_6,
+    TestQueryBase,
+)
+
+
+class TestUserAndCompanyLookup(TestQueryBase):
+    """Test looking up the user and company when logging in."""
+
+    @pytest.mark.parametrize('external_user, tin, expected_company', [
+        (EXTERNAL_USER_4, DB_COMPANY_1['tin'], DB_COMPANY_1['id']),
+        (EXTERNAL_USER_6, DB_COMPANY_3['tin'], DB_COMPANY_3['id']),
+        (EXTERNAL_USER_4, 'TIN_DOES_NOT_EXIST', None),
+        (EXTERNAL_USER_4, None, None),
+    ])
+    def test__external_subject_exists__return_user_and_company(
+        self,
+        seeded_session: db.Session,
+        external_user: dict,
+        tin: Optional[str],
+        expected_company: Optional[str],
+    ):
+        """
+        If the external subject exists return its user, and the company.
+
+        :param seeded_session: Mocked database session
+        :param external_user: External user inserted into the test
+        :param tin: Tax Identification Number of the company
+        :param expected_company: Id of the company expected (if any)
+        """
+
+        # -- Act -------------------------------------------------------------
+
+        row = seeded_session.execute(USER_AND_COMPANY_LOOKUP, {
+            'identity_provider': external_user['identity_provider'],
+            'external_subject': external_user['external_subject'],
+            'tin': tin,
+        }).one()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert row.DbUser.subject == external_user['subject']
+
+        if expected_company is None:
+            assert row.DbCompany is None
+        else:
+            assert row.DbCompany.id == expected_company
+
+    def test__external_subject_does_not_exist__return_only_company(
+        self,
+        seeded_session: db.Session,
+    ):
+        """
+        If the external subject does not exist still return the company.
+
+        :param seeded_session: Mocked database session
+        """
+
+        # -- Act -------------------------------------------------------------
+
+        row = seeded_session.execute(USER_AND_COMPANY_LOOKUP, {
+            'identity_provider': EXTERNAL_USER_4['identity_provider'],
+            'external_subject': 'SUBJECT_DOES_NOT_EXIST',
+            'tin': DB_COMPANY_1['tin'],
+        }).one()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert row.DbUser is None
+        assert row.DbCompany.id == DB_COMPANY_1['id']
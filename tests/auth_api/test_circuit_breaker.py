@@ -0,0 +1,178 @@
+"""Tests for the circuit breaker."""
+
+# Standard Library
+from unittest.mock import Mock, patch
+
+# Third party
+import pytest
+
+# Local
+from auth_api.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture(scope='function')
+def now():
+    """Patch the clock used by circuit breakers (set now.return_value)."""
+
+    with patch('auth_api.circuit_breaker.time.monotonic') as monotonic:
+        monotonic.return_value = 1000
+        yield monotonic
+
+
+@pytest.fixture(scope='function')
+def breaker() -> CircuitBreaker:
+    """Return a circuit breaker opening at 50% failures of 4+ calls."""
+
+    return CircuitBreaker(
+        name='test',
+        failure_rate=0.5,
+        window_size=4,
+        min_calls=4,
+        slow_call_duration=5,
+        open_duration=30,
+        ignore=(KeyError,),
+    )
+
+
+def fail():
+    """Call which fails."""
+    raise ValueError('failed')
+
+
+def trip(breaker: CircuitBreaker):
+    """Make calls which open the circuit."""
+
+    breaker.call(lambda: None)
+    breaker.call(lambda: None)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            breaker.call(fail)
+
+
+class TestCircuitBreaker:
+    """Tests CircuitBreaker."""
+
+    @pytest.mark.unittest
+    def test__call__failure_rate_reached__should_open(
+            self,
+            breaker: CircuitBreaker,
+            now,
+    ):
+        """Reaching the failure rate should open the circuit."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        function = Mock()
+
+        # -- Act -------------------------------------------------------------
+
+        trip(breaker)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert breaker.state == CircuitBreaker.OPEN
+
+        with pytest.raises(CircuitOpenError):
+            breaker.call(function)
+
+        function.assert_not_called()
+
+    @pytest.mark.unittest
+    def test__call__below_min_calls__should_stay_closed(
+            self,
+            breaker: CircuitBreaker,
+            now,
+    ):
+        """Too few calls should not open the circuit."""
+
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                breaker.call(fail)
+
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    @pytest.mark.unittest
+    def test__call__ignored_exceptions__should_not_count_as_failed(
+            self,
+            breaker: CircuitBreaker,
+            now,
+    ):
+        """Ignored exceptions should be raised, but not open the circuit."""
+
+        def raise_key_error():
+            raise KeyError()
+
+        for _ in range(4):
+            with pytest.raises(KeyError):
+                breaker.call(raise_key_error)
+
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    @pytest.mark.unittest
+    def test__call__slow_calls__should_count_as_failed(
+            self,
+            breaker: CircuitBreaker,
+            now,
+    ):
+        """Calls slower than slow_call_duration should open the circuit."""
+
+        def slow():
+            now.return_value += 5
+            return 'result'
+
+        for _ in range(4):
+            assert breaker.call(slow) == 'result'
+
+        assert breaker.state == CircuitBreaker.OPEN
+
+    @pytest.mark.unittest
+    def test__call__open_duration_elapsed__should_let_one_probe_through(
+            self,
+            breaker: CircuitBreaker,
+            now,
+    ):
+        """After open_duration, a single probe should be let through."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        trip(breaker)
+        now.return_value += 30
+
+        def probe():
+            # Other calls are rejected while the probe is in flight
+            with pytest.raises(CircuitOpenError):
+                breaker.call(Mock())
+
+            return 'result'
+
+        # -- Act -------------------------------------------------------------
+
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        result = breaker.call(probe)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert result == 'result'
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    @pytest.mark.unittest
+    def test__call__probe_fails__should_open_again(
+            self,
+            breaker: CircuitBreaker,
+            now,
+    ):
+        """A failed probe should open the circuit for open_duration."""
+
+        trip(breaker)
+        now.return_value += 30
+
+        with pytest.raises(ValueError):
+            breaker.call(fail)
+
+        assert breaker.state == CircuitBreaker.OPEN
+
+        now.return_value += 29
+
+        with pytest.raises(CircuitOpenError):
+            breaker.call(Mock())
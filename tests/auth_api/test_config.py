@@ -1,8 +1,10 @@
 import pytest
+from datetime import datetime, timedelta, timezone
 
 from auth_api.config import (
     TOKEN_COOKIE_SAMESITE,
     TOKEN_COOKIE_HTTP_ONLY,
+    parse_utc_datetime,
 )
 
 
@@ -24,3 +26,28 @@ def test__token_cookie_http_only__value_omitted__should_return_default_true():
     Should default to True.
     """
     assert TOKEN_COOKIE_HTTP_ONLY is True
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2026-12-01', datetime(2026, 12, 1, tzinfo=timezone.utc)),
+    ('2026-12-01T12:00:00', datetime(2026, 12, 1, 12, tzinfo=timezone.utc)),
+    (
+        '2026-12-01T12:00:00+01:00',
+        datetime(2026, 12, 1, 12, tzinfo=timezone(timedelta(hours=1))),
+    ),
+])
+@pytest.mark.unittest
+def test__parse_utc_datetime__should_return_timezone_aware_datetime(
+        value: str,
+        expected: datetime,
+):
+    """
+    Test that times without a timezone are parsed as UTC.
+
+    Times are compared with timezone aware times, which fails for naive
+    times.
+    """
+    parsed = parse_utc_datetime(value)
+
+    assert parsed == expected
+    assert parsed.utcoffset() == expected.utcoffset()
@@ -0,0 +1,76 @@
+"""Tests for deadlines of outbound calls."""
+
+# Standard Library
+from unittest.mock import patch
+
+# Third party
+import pytest
+
+# Local
+from auth_api.deadline import (
+    DeadlineExceeded,
+    deadline,
+    get_remaining,
+    get_timeout,
+)
+
+
+@pytest.fixture(scope='function')
+def now():
+    """Patch the clock used by deadlines (set now.return_value)."""
+
+    with patch('auth_api.deadline.time.monotonic') as monotonic:
+        monotonic.return_value = 1000
+        yield monotonic
+
+
+class TestDeadline:
+    """Tests deadline() and get_timeout()."""
+
+    @pytest.mark.unittest
+    def test__get_timeout__no_deadline__should_return_timeouts(self):
+        """Outside a deadline, the dependency's timeouts should be used."""
+
+        assert get_remaining() is None
+        assert get_timeout(3, 10) == (3, 10)
+
+    @pytest.mark.unittest
+    def test__get_timeout__within_deadline__should_shorten_timeouts(
+            self,
+            now,
+    ):
+        """Timeouts should not exceed the time left of the deadline."""
+
+        with deadline(20):
+            assert get_timeout(3, 10) == (3, 10)
+
+            now.return_value += 15
+            assert get_timeout(3, 10) == (3, 5)
+
+            now.return_value += 3
+            assert get_timeout(3, 10) == (2, 2)
+
+        assert get_remaining() is None
+
+    @pytest.mark.unittest
+    def test__get_timeout__deadline_passed__should_raise(self, now):
+        """No calls should be made once the deadline has passed."""
+
+        with deadline(20):
+            now.return_value += 20
+
+            with pytest.raises(DeadlineExceeded):
+                get_timeout(3, 10)
+
+    @pytest.mark.unittest
+    def test__deadline__nested__should_not_extend_deadline(self, now):
+        """Nested deadlines should only shorten the deadline."""
+
+        with deadline(5):
+            with deadline(20):
+                assert get_remaining() == 5
+
+            with deadline(2):
+                assert get_remaining() == 2
+
+            assert get_remaining() == 5
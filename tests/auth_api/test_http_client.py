@@ -0,0 +1,125 @@
+"""Tests for the shared, pooled HTTP client."""
+
+# Standard Library
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Third party
+import pytest
+from flask.testing import FlaskClient
+
+# Local
+from auth_api.oidc import session
+from auth_api.http_client import http_adapter, http_client, http_stats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+
+    def do_GET(self):  # noqa: N802
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'OK')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='function')
+def server_url():
+    """Run a local keep-alive HTTP server, and return its URL."""
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{server.server_port}/'
+
+    http_adapter.poolmanager.clear()
+    server.shutdown()
+    server.server_close()
+
+
+class TestHttpClient:
+    """Tests http_client."""
+
+    @pytest.mark.unittest
+    def test__get__several_requests__should_reuse_connection(
+            self,
+            server_url: str,
+    ):
+        """Requests to the same host should reuse a keep-alive connection."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        http_stats.reset()
+
+        # -- Act -------------------------------------------------------------
+
+        responses = [http_client.get(server_url) for _ in range(3)]
+
+        # -- Assert ----------------------------------------------------------
+
+        assert [r.text for r in responses] == ['OK'] * 3
+        assert http_stats.as_dict() == {
+            'requests': 3,
+            'connections_opened': 1,
+            'connections_reused': 2,
+        }
+
+    @pytest.mark.unittest
+    def test__oauth2_session__should_share_connection_pools(
+            self,
+            server_url: str,
+    ):
+        """The OAuth2Session should send requests using the same pools."""
+
+        http_stats.reset()
+
+        http_client.get(server_url)
+        session.get(server_url, withhold_token=True)
+
+        assert session.get_adapter(server_url) is http_adapter
+        assert http_stats.connections_opened == 1
+        assert http_stats.connections_reused == 1
+
+
+class TestGetHttpMetrics:
+    """Tests the /metrics/http endpoint."""
+
+    @pytest.mark.integrationtest
+    def test__metrics_http__should_return_counters(
+            self,
+            client: FlaskClient,
+            internal_token_encoded: str,
+    ):
+        """Should return the counters of this worker."""
+
+        http_stats.reset()
+        http_stats.count_request()
+        http_stats.count_request()
+        http_stats.count_connection_opened()
+
+        r = client.get(
+            '/metrics/http',
+            headers={'Authorization': f'Bearer: {internal_token_encoded}'},
+        )
+
+        assert r.status_code == 200
+        assert r.json == {
+            'requests': 2,
+            'connections_opened': 1,
+            'connections_reused': 1,
+        }
+
+    @pytest.mark.integrationtest
+    def test__metrics_http__no_token__should_return_401(
+            self,
+            client: FlaskClient,
+    ):
+        """Should not return the counters without an internal token."""
+
+        r = client.get('/metrics/http')
+
+        assert r.status_code == 401
@@ -0,0 +1,421 @@
+"""Tests for sending queued requests to eo-datasync."""
+
+# Standard Library
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+# Third party
+import pytest
+import requests
+import requests_mock
+
+# Local
+from auth_api.circuit_breaker import CircuitOpenError
+from auth_api.config import (
+    DATASYNC_BASE_URL,
+    DATASYNC_CREATE_RELATIONS_PATH,
+    OIDC_API_LOGOUT_URL,
+)
+from auth_api.controller import db_controller
+from auth_api.db import db
+from auth_api.models import DbCompany, DbLogoutOutbox, DbRelationsOutbox
+from auth_api.outbox import (
+    claim_logouts,
+    claim_relations,
+    complete_relations,
+    get_backoff,
+    get_lease,
+    process_logouts,
+    process_relations,
+    retry_relations,
+)
+
+DATASYNC_URL = f'{DATASYNC_BASE_URL}{DATASYNC_CREATE_RELATIONS_PATH}'
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def queued(mock_session: db.Session) -> DbRelationsOutbox:
+    """Queue a request to create relations for a company."""
+
+    db_controller.queue_relations(
+        session=mock_session,
+        subject='subject',
+        internal_token='internal-token',
+        tin='12345678',
+    )
+    mock_session.commit()
+
+    return mock_session.query(DbRelationsOutbox).one()
+
+
+@pytest.fixture(scope='function')
+def queued_logout(mock_session: db.Session) -> DbLogoutOutbox:
+    """Queue a logout at the Identity Provider."""
+
+    db_controller.queue_logout(session=mock_session, id_token='id-token')
+    mock_session.commit()
+
+    return mock_session.query(DbLogoutOutbox).one()
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestGetBackoff:
+    """Tests get_backoff()."""
+
+    @pytest.mark.unittest
+    @pytest.mark.parametrize('attempts, expected', [
+        (1, 5),
+        (2, 10),
+        (3, 20),
+        (10, 60),
+    ])
+    def test__should_double_after_each_attempt_up_to_max(
+            self,
+            attempts: int,
+            expected: float,
+    ):
+        """The backoff should double after each attempt, up to the max."""
+
+        assert get_backoff(attempts, backoff=5, max_backoff=60) == expected
+
+
+class TestGetLease:
+    """Tests get_lease()."""
+
+    @pytest.mark.unittest
+    @pytest.mark.parametrize('lease, batch_size, expected', [
+        (60, 1, 60),
+        (60, 50, 400),
+        (600, 50, 600),
+    ])
+    def test__should_cover_sending_the_whole_batch(
+            self,
+            lease: float,
+            batch_size: int,
+            expected: float,
+    ):
+        """The lease should last until every request could time out."""
+
+        assert get_lease(lease, batch_size=batch_size, timeout=8) == expected
+
+
+class TestProcessRelations:
+    """Tests process_relations()."""
+
+    @pytest.mark.integrationtest
+    def test__datasync_responds_200__should_send_and_delete_request(
+            self,
+            mock_session: db.Session,
+            requests_mock: requests_mock.Mocker,
+            queued: DbRelationsOutbox,
+    ):
+        """A sent request should be removed from the outbox."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        adapter = requests_mock.post(DATASYNC_URL, text='', status_code=200)
+
+        # -- Act -------------------------------------------------------------
+
+        claimed = process_relations()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert claimed == 1
+        assert adapter.call_count == 1
+        assert adapter.last_request.json() == {
+            'ssn': None,
+            'tin': '12345678',
+        }
+        assert adapter.last_request.headers['Authorization'] == \
+            'Bearer: internal-token'
+        assert mock_session.query(DbRelationsOutbox).count() == 0
+
+    @pytest.mark.integrationtest
+    def test__datasync_responds_200__should_record_relations_created(
+            self,
+            mock_session: db.Session,
+            requests_mock: requests_mock.Mocker,
+            queued: DbRelationsOutbox,
+    ):
+        """Should record when relations were created for the company."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        requests_mock.post(DATASYNC_URL, text='', status_code=200)
+
+        db_controller.get_or_create_company(
+            session=mock_session,
+            tin='12345678',
+        )
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        process_relations()
+
+        # -- Assert ----------------------------------------------------------
+
+        mock_session.expire_all()
+        company = mock_session.query(DbCompany).one()
+
+        assert company.relations_created is not None
+        assert company.relations_created <= datetime.now(tz=timezone.utc)
+
+    @pytest.mark.integrationtest
+    @pytest.mark.parametrize('response', [
+        {'status_code': 500},
+        {'exc': requests.exceptions.ConnectTimeout},
+    ])
+    def test__datasync_fails__should_retry_request_later(
+            self,
+            mock_session: db.Session,
+            requests_mock: requests_mock.Mocker,
+            queued: DbRelationsOutbox,
+            response: dict,
+    ):
+        """A failed request should be kept, and retried after a backoff."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        adapter = requests_mock.post(DATASYNC_URL, **response)
+
+        # -- Act -------------------------------------------------------------
+
+        process_relations()
+        process_relations()
+
+        # -- Assert ----------------------------------------------------------
+
+        mock_session.expire_all()
+        retry = mock_session.query(DbRelationsOutbox).one()
+
+        assert adapter.call_count == 1
+        assert retry.attempts == 1
+        assert retry.next_attempt > datetime.now(tz=timezone.utc)
+
+    @pytest.mark.integrationtest
+    def test__max_attempts_reached__should_drop_request(
+            self,
+            mock_session: db.Session,
+            requests_mock: requests_mock.Mocker,
+            queued: DbRelationsOutbox,
+    ):
+        """A request which keeps failing should eventually be dropped."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        requests_mock.post(DATASYNC_URL, status_code=500)
+
+        queued.attempts = 9
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        process_relations()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert mock_session.query(DbRelationsOutbox).count() == 0
+
+
+class TestClaimRelations:
+    """Tests claim_relations()."""
+
+    @pytest.mark.integrationtest
+    def test__should_only_claim_due_requests_once(
+            self,
+            mock_session: db.Session,
+            queued: DbRelationsOutbox,
+    ):
+        """Claimed and postponed requests should not be claimed again."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        db_controller.queue_relations(
+            session=mock_session,
+            subject='subject',
+            internal_token='internal-token',
+            ssn='1234567890',
+        )
+        mock_session.add(DbRelationsOutbox(
+            subject='subject',
+            internal_token='internal-token',
+            ssn='1234567890',
+            next_attempt=datetime.now(tz=timezone.utc) + timedelta(hours=1),
+        ))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        first = claim_relations(batch_size=1)
+        second = claim_relations(batch_size=10)
+        third = claim_relations(batch_size=10)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert [row.id for row in first] == [queued.id]
+        assert [row.ssn for row in second] == ['1234567890']
+        assert third == []
+
+    @pytest.mark.integrationtest
+    def test__should_lease_long_enough_to_send_the_whole_batch(
+            self,
+            mock_session: db.Session,
+            queued: DbRelationsOutbox,
+    ):
+        """The lease should not expire while the batch is being sent."""
+
+        # -- Act -------------------------------------------------------------
+
+        claimed = claim_relations(batch_size=50, lease=60)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert claimed[0].next_attempt > \
+            datetime.now(tz=timezone.utc) + timedelta(seconds=390)
+
+
+class TestLostLease:
+    """Tests completing and retrying requests after the lease expired."""
+
+    @pytest.fixture(scope='function')
+    def reclaimed(
+            self,
+            mock_session: db.Session,
+            queued: DbRelationsOutbox,
+    ) -> DbRelationsOutbox:
+        """Claim the request, and let another worker claim it again."""
+
+        db_controller.get_or_create_company(
+            session=mock_session,
+            tin='12345678',
+        )
+        mock_session.commit()
+
+        claimed = claim_relations(batch_size=1)
+
+        mock_session.query(DbRelationsOutbox).update({
+            'next_attempt': datetime.now(tz=timezone.utc),
+        })
+        mock_session.commit()
+
+        claim_relations(batch_size=1)
+
+        return claimed[0]
+
+    @pytest.mark.integrationtest
+    def test__complete__should_leave_request_to_other_worker(
+            self,
+            mock_session: db.Session,
+            reclaimed: DbRelationsOutbox,
+    ):
+        """A worker should not delete a request claimed by another."""
+
+        # -- Act -------------------------------------------------------------
+
+        complete_relations(rows=[reclaimed])
+
+        # -- Assert ----------------------------------------------------------
+
+        mock_session.expire_all()
+        company = mock_session.query(DbCompany).one()
+
+        assert mock_session.query(DbRelationsOutbox).count() == 1
+        assert company.relations_created is None
+
+    @pytest.mark.integrationtest
+    def test__retry__should_leave_request_to_other_worker(
+            self,
+            mock_session: db.Session,
+            reclaimed: DbRelationsOutbox,
+    ):
+        """A worker should not postpone a request claimed by another."""
+
+        # -- Act -------------------------------------------------------------
+
+        retry_relations(
+            id=reclaimed.id,
+            leased_until=reclaimed.next_attempt,
+            attempts=1,
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        mock_session.expire_all()
+        request = mock_session.query(DbRelationsOutbox).one()
+
+        assert request.attempts == 2
+        assert request.next_attempt > reclaimed.next_attempt
+
+
+class TestProcessLogouts:
+    """Tests process_logouts()."""
+
+    @pytest.mark.integrationtest
+    def test__should_lease_long_enough_to_send_the_whole_batch(
+            self,
+            mock_session: db.Session,
+            queued_logout: DbLogoutOutbox,
+    ):
+        """The lease should not expire while the batch is being sent."""
+
+        # -- Act -------------------------------------------------------------
+
+        claimed = claim_logouts(batch_size=50, lease=60)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert claimed[0].next_attempt > \
+            datetime.now(tz=timezone.utc) + timedelta(seconds=640)
+
+    @pytest.mark.integrationtest
+    def test__idp_responds_200__should_log_out_and_delete_logout(
+            self,
+            mock_session: db.Session,
+            requests_mock: requests_mock.Mocker,
+            queued_logout: DbLogoutOutbox,
+    ):
+        """A sent logout should be removed from the outbox."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        adapter = requests_mock.post(OIDC_API_LOGOUT_URL, status_code=200)
+
+        # -- Act -------------------------------------------------------------
+
+        claimed = process_logouts()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert claimed == 1
+        assert adapter.last_request.json() == {'id_token': 'id-token'}
+        assert mock_session.query(DbLogoutOutbox).count() == 0
+
+    @pytest.mark.integrationtest
+    def test__circuit_open__should_retry_without_counting_attempt(
+            self,
+            mock_session: db.Session,
+            queued_logout: DbLogoutOutbox,
+    ):
+        """Logouts should not be dropped while the IdP is unavailable."""
+
+        # -- Act -------------------------------------------------------------
+
+        with patch('auth_api.outbox.oidc_backend.logout') as logout:
+            logout.side_effect = CircuitOpenError()
+            process_logouts()
+
+        # -- Assert ----------------------------------------------------------
+
+        mock_session.expire_all()
+        retry = mock_session.query(DbLogoutOutbox).one()
+
+        assert logout.call_count == 1
+        assert retry.attempts == 0
+        assert retry.next_attempt > datetime.now(tz=timezone.utc)
@@ -0,0 +1,109 @@
+"""Tests for counting the SQL statements executed."""
+
+# Standard Library
+import threading
+from uuid import uuid4
+
+# Third party
+import pytest
+from flask.testing import FlaskClient
+
+# Local
+from auth_api.db import db
+from auth_api.models import DbCompany
+from auth_api.sql_stats import count_statements, sql_stats
+
+
+class TestCountStatements:
+    """Tests count_statements()."""
+
+    @pytest.mark.integrationtest
+    def test__should_count_statements_and_rows_executed_within_block(
+            self,
+            mock_session: db.Session,
+    ):
+        """Only statements executed within the block should be counted."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.add(DbCompany(id=str(uuid4()), tin='1'))
+        mock_session.add(DbCompany(id=str(uuid4()), tin='2'))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        with count_statements() as counter:
+            mock_session.query(DbCompany).all()
+
+        mock_session.query(DbCompany).all()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert counter.statements == 1
+        assert counter.rows == 2
+        assert counter.duration > 0
+
+    @pytest.mark.integrationtest
+    def test__should_not_count_statements_executed_by_other_threads(
+            self,
+            mock_session: db.Session,
+    ):
+        """Statements executed by other threads should not be counted."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        def query():
+            session = db.make_session()
+            session.query(DbCompany).all()
+            session.close()
+
+        thread = threading.Thread(target=query)
+
+        # -- Act -------------------------------------------------------------
+
+        with count_statements() as counter:
+            thread.start()
+            thread.join()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert counter.statements == 0
+
+
+class TestGetSqlMetrics:
+    """Tests the /metrics/sql endpoint."""
+
+    @pytest.mark.integrationtest
+    def test__metrics_sql__should_return_counters(
+            self,
+            client: FlaskClient,
+            internal_token_encoded: str,
+    ):
+        """Should return the counters of this worker."""
+
+        sql_stats.reset()
+        sql_stats.count_statement(rows=1, duration=0.002)
+        sql_stats.count_statement(rows=3, duration=0.001)
+
+        r = client.get(
+            '/metrics/sql',
+            headers={'Authorization': f'Bearer: {internal_token_encoded}'},
+        )
+
+        assert r.status_code == 200
+        assert r.json == {
+            'statements': 2,
+            'rows': 4,
+            'duration_ms': 3.0,
+        }
+
+    @pytest.mark.integrationtest
+    def test__metrics_sql__no_token__should_return_401(
+            self,
+            client: FlaskClient,
+    ):
+        """Should not return the counters without an internal token."""
+
+        r = client.get('/metrics/sql')
+
+        assert r.status_code == 401
@@ -0,0 +1,140 @@
+from uuid import uuid4
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from auth_api.config import parse_utc_datetime
+from auth_api.opaque_token import OpaqueTokenSigner, derive_secret
+
+
+TOKEN_ID = str(uuid4())
+EXPIRES = datetime.now(tz=timezone.utc) + timedelta(days=1)
+
+
+class TestOpaqueTokenSigner:
+    """Tests OpaqueTokenSigner."""
+
+    @pytest.mark.unittest
+    def test__verify__token_is_signed__should_return_token_id(self):
+        """A token signed with the same secret should be accepted."""
+
+        signer = OpaqueTokenSigner(secret='secret')
+        opaque_token = signer.sign(TOKEN_ID, EXPIRES)
+
+        assert opaque_token.startswith(f'{TOKEN_ID}.')
+        assert signer.verify(opaque_token) == TOKEN_ID
+
+    @pytest.mark.unittest
+    def test__verify__token_signed_with_other_secret__should_return_none(self):
+        """A token signed with another secret should be rejected."""
+
+        opaque_token = OpaqueTokenSigner(secret='other-secret') \
+            .sign(TOKEN_ID, EXPIRES)
+
+        assert OpaqueTokenSigner(secret='secret').verify(opaque_token) is None
+
+    @pytest.mark.parametrize('part', [0, 1, 2])
+    @pytest.mark.unittest
+    def test__verify__token_is_tampered_with__should_return_none(
+            self,
+            part: int,
+    ):
+        """Changing any part of a signed token should invalidate it."""
+
+        signer = OpaqueTokenSigner(secret='secret')
+        parts = signer.sign(TOKEN_ID, EXPIRES).split('.')
+        parts[part] = {
+            0: str(uuid4()),
+            1: f'{int(EXPIRES.timestamp()) + 3600:x}',
+            2: 'A' * 22,
+        }[part]
+
+        assert signer.verify('.'.join(parts)) is None
+
+    @pytest.mark.unittest
+    def test__verify__token_is_expired__should_return_none(self):
+        """An expired token should be rejected, unless expiry is ignored."""
+
+        signer = OpaqueTokenSigner(secret='secret')
+        opaque_token = signer.sign(
+            token_id=TOKEN_ID,
+            expires=datetime.now(tz=timezone.utc) - timedelta(seconds=1),
+        )
+
+        assert signer.verify(opaque_token) is None
+        assert signer.verify(opaque_token, check_expiry=False) == TOKEN_ID
+
+    @pytest.mark.parametrize('accept_legacy_until, expected', [
+        (datetime.now(tz=timezone.utc) + timedelta(days=1), TOKEN_ID),
+        (datetime.now(tz=timezone.utc) - timedelta(seconds=1), None),
+        (None, TOKEN_ID),
+    ])
+    @pytest.mark.unittest
+    def test__verify__legacy_token__should_respect_accept_legacy_until(
+            self,
+            accept_legacy_until: Optional[datetime],
+            expected: Optional[str],
+    ):
+        """Legacy (unsigned) tokens should not be accepted after cutoff."""
+
+        signer = OpaqueTokenSigner(
+            secret='secret',
+            accept_legacy_until=accept_legacy_until,
+        )
+
+        assert signer.verify(TOKEN_ID) == expected
+
+    @pytest.mark.unittest
+    def test__verify__legacy_token_cutoff_without_timezone__should_be_utc(
+            self,
+    ):
+        """A cutoff configured without a timezone should not break verify."""
+
+        signer = OpaqueTokenSigner(
+            secret='secret',
+            accept_legacy_until=parse_utc_datetime('2000-01-01'),
+        )
+
+        assert signer.verify(TOKEN_ID) is None
+        assert signer.verify(signer.sign(TOKEN_ID, EXPIRES)) == TOKEN_ID
+
+    @pytest.mark.parametrize('opaque_token', [
+        None,
+        '',
+        'INVALID-TOKEN',
+        f'{TOKEN_ID}.',
+        f'{TOKEN_ID}..',
+        f'{TOKEN_ID.upper()}.ffff.{"A" * 22}',
+    ])
+    @pytest.mark.unittest
+    def test__verify__malformed_token__should_return_none(
+            self,
+            opaque_token: str,
+    ):
+        """Malformed tokens should be rejected."""
+
+        assert OpaqueTokenSigner(secret='secret').verify(opaque_token) is None
+
+
+class TestDeriveSecret:
+    """Tests derive_secret()."""
+
+    @pytest.mark.unittest
+    def test__should_derive_secret_using_hkdf(self):
+        """The secret should be derived as HKDF-SHA256 (RFC 5869)."""
+
+        secret = derive_secret(secret='\x0b' * 22, label='')
+
+        assert secret.startswith(
+            '8da4e775a563c18f715f802a063c5a31b8a11f5c5ee1879ec3454e5f3c738d2d')
+
+    @pytest.mark.unittest
+    def test__different_labels__should_derive_different_secrets(self):
+        """Secrets derived for different purposes should not be the same."""
+
+        secret1 = derive_secret(secret='secret', label='label 1')
+        secret2 = derive_secret(secret='secret', label='label 2')
+
+        assert secret1 != secret2
+        assert 'secret' not in (secret1, secret2)
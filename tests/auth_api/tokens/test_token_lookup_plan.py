@@ -0,0 +1,82 @@
+import json
+import pytest
+from uuid import uuid4
+from datetime import datetime, timedelta, timezone
+
+from origin.sql import SqlEngine
+
+from auth_api.models import DbToken
+from auth_api.queries import TOKEN_LOOKUP
+
+
+def find_plan_nodes(plan: dict):
+    """Yield a node of an EXPLAIN plan, and all its sub-nodes."""
+
+    yield plan
+
+    for sub_plan in plan.get('Plans', []):
+        yield from find_plan_nodes(sub_plan)
+
+
+class TestValidTokenLookupPlan:
+    """Tests the query plan of the token lookup done by ForwardAuth."""
+
+    @pytest.mark.integrationtest
+    def test__lookup_token__should_use_index_only_scan_on_primary_key(
+            self,
+            db: SqlEngine,
+            mock_session: SqlEngine.Session,
+    ):
+        """
+        The lookup should be served from the covering primary key alone.
+
+        A plain "Index Scan" means the index does not include the columns
+        read by ForwardAuth, and the heap is visited for each lookup.
+        """
+
+        # -- Arrange ---------------------------------------------------------
+
+        now = datetime.now(tz=timezone.utc)
+        token_ids = [str(uuid4()) for _ in range(1000)]
+
+        mock_session.add_all(DbToken(
+            opaque_token=token_id,
+            internal_token='INTERNAL-TOKEN',
+            id_token='ID-TOKEN',
+            issued=now - timedelta(minutes=1),
+            expires=now + timedelta(hours=1),
+            subject='subject',
+        ) for token_id in token_ids)
+        mock_session.commit()
+
+        sql = str(TOKEN_LOOKUP.compile(dialect=db.engine.dialect))
+
+        # -- Act -------------------------------------------------------------
+
+        with db.engine.connect() as connection:
+            connection = connection \
+                .execution_options(isolation_level='AUTOCOMMIT')
+
+            # Updates the visibility map, which index-only scans depend on
+            connection.exec_driver_sql('VACUUM ANALYZE token')
+
+            # Make the plan independent of the (small) size of the table
+            connection.exec_driver_sql('SET enable_seqscan = off')
+            connection.exec_driver_sql('SET enable_bitmapscan = off')
+
+            explain = connection.exec_driver_sql(
+                f'EXPLAIN (FORMAT JSON) {sql}',
+                {'token_id': token_ids[0]},
+            ).scalar()
+
+        # -- Assert ----------------------------------------------------------
+
+        if isinstance(explain, str):
+            explain = json.loads(explain)
+
+        nodes = list(find_plan_nodes(explain[0]['Plan']))
+        scans = [n for n in nodes if n['Node Type'].endswith('Scan')]
+
+        assert len(scans) == 1
+        assert scans[0]['Node Type'] == 'Index Only Scan'
+        assert scans[0]['Index Name'] == 'token_pkey'
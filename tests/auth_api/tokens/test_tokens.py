@@ -1,11 +1,31 @@
 import pytest
+import threading
+import requests_mock
+from uuid import uuid4
+from typing import Callable, ContextManager
+from unittest.mock import Mock, patch
+from concurrent.futures import ThreadPoolExecutor
 from origin.auth import TOKEN_COOKIE_NAME
 from flask.testing import FlaskClient
 from datetime import datetime, timedelta, timezone
 
 from origin.sql import SqlEngine
 
+from auth_api.cache import token_lookups, unknown_token_cache
+from auth_api.controller import db_controller, opaque_token_signer
+from auth_api.endpoints import ForwardAuth
 from auth_api.models import DbToken
+from auth_api.opaque_token import OpaqueTokenSigner
+from auth_api.sql_stats import SqlStats
+
+
+def sign(token_id: str) -> str:
+    """Return the token id signed, like the cookie set when logging in."""
+
+    return opaque_token_signer.sign(
+        token_id=token_id,
+        expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+    )
 
 
 class TestForwardAuth:
@@ -73,7 +93,7 @@ class TestForwardAuth:
     ):
         """Non valid token should return status 401."""
 
-        opaque_token = '12345'
+        opaque_token = str(uuid4())
         internal_token = '54321'
 
         mock_session.begin()
@@ -92,7 +112,7 @@ class TestForwardAuth:
         client.set_cookie(
             server_name='domain.com',  # TODO
             key=TOKEN_COOKIE_NAME,
-            value=opaque_token,
+            value=sign(opaque_token),
         )
 
         res = client.get('/token/forward-auth')
@@ -102,6 +122,46 @@ class TestForwardAuth:
         assert res.status_code == 401
         assert 'Authorization' not in res.headers
 
+    @pytest.mark.integrationtest
+    def test__token_not_valid_yet__should_not_cache_token_as_unknown(
+            self,
+            client: FlaskClient,
+            mock_session: SqlEngine.Session,
+    ):
+        """
+        A token issued after now (ie. due to clock skew) is not unknown.
+
+        It should not be cached as unknown, so it is accepted once valid.
+        """
+
+        opaque_token = str(uuid4())
+
+        mock_session.begin()
+        mock_session.add(DbToken(
+            opaque_token=opaque_token,
+            internal_token='54321',
+            id_token='',  # Irrelevant
+            issued=datetime.now(tz=timezone.utc) + timedelta(seconds=1),
+            expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+            subject='subject',
+        ))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        client.set_cookie(
+            server_name='domain.com',  # TODO
+            key=TOKEN_COOKIE_NAME,
+            value=sign(opaque_token),
+        )
+
+        res = client.get('/token/forward-auth')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 401
+        assert unknown_token_cache.get(opaque_token) is None
+
     @pytest.mark.integrationtest
     def test__token_exists__should_return_authorization_header_and_status_200(
             self,
@@ -110,7 +170,7 @@ class TestForwardAuth:
     ):
         """Correct token provided should return correct auth header and 200."""
 
-        opaque_token = '12345'
+        opaque_token = str(uuid4())
         internal_token = '54321'
 
         mock_session.begin()
@@ -129,7 +189,7 @@ class TestForwardAuth:
         client.set_cookie(
             server_name='domain.com',  # TODO
             key=TOKEN_COOKIE_NAME,
-            value=opaque_token,
+            value=sign(opaque_token),
         )
 
         res = client.get('/token/forward-auth')
@@ -138,3 +198,321 @@ class TestForwardAuth:
 
         assert res.status_code == 200
         assert res.headers['Authorization'] == f'Bearer: {internal_token}'
+
+    @pytest.mark.integrationtest
+    def test__token_not_cached__should_execute_1_statement(
+            self,
+            client: FlaskClient,
+            mock_session: SqlEngine.Session,
+            sql_budget: Callable[..., ContextManager[SqlStats]],
+    ):
+        """A token which is not cached should be looked up in one query."""
+
+        opaque_token = str(uuid4())
+
+        mock_session.begin()
+        mock_session.add(DbToken(
+            opaque_token=opaque_token,
+            internal_token='54321',
+            id_token='',  # Irrelevant
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+            subject='subject',
+        ))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        client.set_cookie(
+            server_name='domain.com',  # TODO
+            key=TOKEN_COOKIE_NAME,
+            value=sign(opaque_token),
+        )
+
+        with sql_budget(statements=1):
+            res = client.get('/token/forward-auth')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 200
+
+    @pytest.mark.unittest
+    def test__concurrent_lookups_of_same_token__should_query_database_once(
+            self,
+    ):
+        """Concurrent cache misses for a token should share one lookup."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        token_id = str(uuid4())
+        opaque_token = sign(token_id)
+        started = threading.Event()
+        release = threading.Event()
+
+        def get_token(token_id):
+            started.set()
+            release.wait(5)
+            return Mock(
+                internal_token='INTERNAL-TOKEN',
+                expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+                valid=True,
+            )
+
+        # -- Act -------------------------------------------------------------
+
+        with patch.object(ForwardAuth, 'get_token') as mock, \
+                ThreadPoolExecutor(max_workers=3) as executor:
+            mock.side_effect = get_token
+
+            first = executor.submit(
+                ForwardAuth().get_internal_token, opaque_token)
+            started.wait(5)
+            others = [
+                executor.submit(ForwardAuth().get_internal_token, opaque_token)
+                for _ in range(2)
+            ]
+
+            # Wait until the others have joined the lookup in flight
+            while token_lookups._calls[token_id].waiters < 2:
+                threading.Event().wait(0.005)
+
+            release.set()
+            results = [f.result(5) for f in [first, *others]]
+
+        # -- Assert ----------------------------------------------------------
+
+        assert mock.call_count == 1
+        assert results == ['INTERNAL-TOKEN'] * 3
+
+    @pytest.mark.integrationtest
+    def test__token_is_cached__should_not_query_database_again(
+            self,
+            client: FlaskClient,
+            mock_session: SqlEngine.Session,
+    ):
+        """A token which has been looked up once should be served cached."""
+
+        opaque_token = str(uuid4())
+        internal_token = '54321'
+
+        mock_session.begin()
+        mock_session.add(DbToken(
+            opaque_token=opaque_token,
+            internal_token=internal_token,
+            id_token='',  # Irrelevant
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+            subject='subject',
+        ))
+        mock_session.commit()
+
+        client.set_cookie(
+            server_name='domain.com',  # TODO
+            key=TOKEN_COOKIE_NAME,
+            value=sign(opaque_token),
+        )
+
+        client.get('/token/forward-auth')
+
+        # -- Act -------------------------------------------------------------
+
+        with patch.object(ForwardAuth, 'get_token') as get_token:
+            res = client.get('/token/forward-auth')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert get_token.call_count == 0
+        assert res.status_code == 200
+        assert res.headers['Authorization'] == f'Bearer: {internal_token}'
+
+    @pytest.mark.integrationtest
+    def test__token_is_cached_and_user_logs_out__should_return_status_401(
+            self,
+            client: FlaskClient,
+            mock_session: SqlEngine.Session,
+            oidc_adapter: requests_mock.Adapter,
+            internal_token_encoded: str,
+    ):
+        """Logging out should evict the token from the cache."""
+
+        opaque_token = str(uuid4())
+        internal_token = internal_token_encoded
+
+        mock_session.begin()
+        mock_session.add(DbToken(
+            opaque_token=opaque_token,
+            internal_token=internal_token,
+            id_token='',  # Irrelevant
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+            subject='subject',
+        ))
+        mock_session.commit()
+
+        client.set_cookie(
+            server_name='domain.com',  # TODO
+            key=TOKEN_COOKIE_NAME,
+            value=sign(opaque_token),
+        )
+
+        client.get('/token/forward-auth')
+
+        # -- Act -------------------------------------------------------------
+
+        client.post(
+            path='/logout',
+            headers={
+                'Authorization': f'Bearer: {internal_token}'
+            }
+        )
+
+        res = client.get('/token/forward-auth')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 401
+        assert 'Authorization' not in res.headers
+
+    @pytest.mark.integrationtest
+    def test__valid_signed_token__should_return_internal_token(
+            self,
+            client: FlaskClient,
+            mock_session: SqlEngine.Session,
+    ):
+        """A signed opaque token should be looked up by its id."""
+
+        token_id = str(uuid4())
+        internal_token = 'INTERNAL-TOKEN'
+        expires = datetime.now(tz=timezone.utc) + timedelta(days=1)
+
+        mock_session.begin()
+        mock_session.add(DbToken(
+            opaque_token=token_id,
+            internal_token=internal_token,
+            id_token='',  # Irrelevant
+            issued=datetime.now(tz=timezone.utc),
+            expires=expires,
+            subject='subject',
+        ))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        client.set_cookie(
+            server_name='domain.com',  # TODO
+            key=TOKEN_COOKIE_NAME,
+            value=opaque_token_signer.sign(token_id, expires),
+        )
+
+        res = client.get('/token/forward-auth')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 200
+        assert res.headers['Authorization'] == f'Bearer: {internal_token}'
+
+    @pytest.mark.parametrize('opaque_token', [
+        'INVALID-TOKEN',
+        '12345',
+        str(uuid4()).upper(),
+        f'{uuid4()}-suffix',
+        # Signed by someone else:
+        OpaqueTokenSigner('other-secret').sign(
+            token_id=str(uuid4()),
+            expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+        ),
+        # Signature is valid, but token is expired:
+        opaque_token_signer.sign(
+            token_id=str(uuid4()),
+            expires=datetime.now(tz=timezone.utc) - timedelta(seconds=1),
+        ),
+    ])
+    @pytest.mark.unittest
+    def test__malformed_token__should_return_status_401_without_querying_database(  # noqa E261
+            self,
+            opaque_token: str,
+            client: FlaskClient,
+    ):
+        """Malformed tokens should be rejected before the database is hit."""
+
+        # -- Act -------------------------------------------------------------
+
+        client.set_cookie(
+            server_name='domain.com',  # TODO
+            key=TOKEN_COOKIE_NAME,
+            value=opaque_token,
+        )
+
+        with patch.object(ForwardAuth, 'get_token') as get_token:
+            res = client.get('/token/forward-auth')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert get_token.call_count == 0
+        assert res.status_code == 401
+        assert 'Authorization' not in res.headers
+
+    @pytest.mark.unittest
+    def test__unknown_token_looked_up_twice__should_only_query_database_once(
+            self,
+            client: FlaskClient,
+    ):
+        """Tokens which are not found should be cached for a short while."""
+
+        # -- Act -------------------------------------------------------------
+
+        client.set_cookie(
+            server_name='domain.com',  # TODO
+            key=TOKEN_COOKIE_NAME,
+            value=sign(str(uuid4())),
+        )
+
+        with patch.object(ForwardAuth, 'get_token') as get_token:
+            get_token.return_value = None
+            res1 = client.get('/token/forward-auth')
+            res2 = client.get('/token/forward-auth')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert get_token.call_count == 1
+        assert res1.status_code == 401
+        assert res2.status_code == 401
+
+
+class TestCreateToken:
+    """Test issuing tokens."""
+
+    @pytest.mark.integrationtest
+    def test__should_return_opaque_token_and_internal_token_of_saved_token(
+            self,
+            mock_session: SqlEngine.Session,
+    ):
+        """The issued token should match the token saved in the database."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        issued = datetime.now(tz=timezone.utc)
+
+        # -- Act -------------------------------------------------------------
+
+        token = db_controller.create_token(
+            session=mock_session,
+            issued=issued,
+            expires=issued + timedelta(hours=1),
+            actor='actor',
+            subject='subject',
+            id_token='id-token',
+            scope=['scope1', 'scope2'],
+        )
+
+        mock_session.commit()
+
+        # -- Assert ----------------------------------------------------------
+
+        saved = db_controller.get_token(
+            session=mock_session,
+            opaque_token=token.opaque_token,
+        )
+
+        assert saved is not None
+        assert saved.internal_token == token.internal_token